@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Cachés de disponibilidad de SitVal compartidas por los scrapers.
+
+MonthDataCache guarda las respuestas de serviceMonthData (get_open_days,
+service_price) por estación/servicio/mes con su propio TTL, para que las
+búsquedas de huecos no repitan la llamada mensual.
+
+DayStateStore guarda, por día, las horas extraídas de serviceDayData y un
+hash del payload, para que el refresco incremental solo vuelva a pedir los
+días nuevos o pendientes de revalidar.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+from cache_config import CacheConfig
+
+
+class MonthDataCache:
+    """Thread-safe TTL cache of serviceMonthData responses keyed by (store, service, month)"""
+
+    def __init__(self, ttl: int = None):
+        self.ttl = CacheConfig.MONTH_CACHE_TTL if ttl is None else ttl
+        self._entries: Dict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(store, service, month: str) -> Tuple[str, str, str]:
+        # Any date of the month maps to the same entry
+        return str(store), str(service), month[:7]
+
+    def get(self, store, service, month: str) -> Optional[Dict[str, Any]]:
+        """Cached month data, or None if missing or expired"""
+        key = self._key(store, service, month)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def set(self, store, service, month: str, month_data: Dict[str, Any]):
+        """Store a month response; failed or non-JSON responses are not cached"""
+        if not month_data or 'raw_response' in month_data:
+            return
+        key = self._key(store, service, month)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now, month_data)
+            # Expired entries are otherwise only dropped when read again
+            if len(self._entries) % 100 == 0:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        expired = [key for key, (timestamp, _) in self._entries.items() if now - timestamp >= self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def invalidate(self, store=None, service=None):
+        """Drop all entries, or only those of a store (and service)"""
+        with self._lock:
+            if store is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries
+                        if k[0] == str(store) and (service is None or k[1] == str(service))]:
+                del self._entries[key]
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'ttl_seconds': self.ttl
+        }
+
+
+class DayRecord:
+    """Parsed hours of one serviceDayData payload plus its content hash"""
+
+    __slots__ = ('payload_hash', 'hours', 'checked_at')
+
+    def __init__(self, payload_hash: str, hours: List[str], checked_at: float):
+        self.payload_hash = payload_hash
+        self.hours = hours
+        self.checked_at = checked_at
+
+
+class DayStateStore:
+    """Per-day serviceDayData results keyed by (store, service) and day, for incremental refreshes"""
+
+    def __init__(self, revalidate_after: int = None):
+        self.revalidate_after = (CacheConfig.DAY_REVALIDATE_AFTER
+                                 if revalidate_after is None else revalidate_after)
+        self._days: Dict[Tuple[str, str], Dict[str, DayRecord]] = {}
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.unchanged = 0
+        self.changed = 0
+
+    @staticmethod
+    def payload_hash(day_slots: Any) -> str:
+        """Stable content hash of a get_day_slots payload"""
+        encoded = json.dumps(day_slots, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def get(self, store, service, dia: str) -> Optional[DayRecord]:
+        with self._lock:
+            return self._days.get((str(store), str(service)), {}).get(dia)
+
+    def needs_fetch(self, store, service, dia: str) -> bool:
+        """True if the day is new or its last check is older than revalidate_after"""
+        record = self.get(store, service, dia)
+        if record is None or time.time() - record.checked_at >= self.revalidate_after:
+            return True
+        self.reused += 1
+        return False
+
+    def update(self, store, service, dia: str, day_slots: Any, parse) -> List[str]:
+        """Record a fetched payload and return its hours; parse() only runs if the hash changed"""
+        payload_hash = self.payload_hash(day_slots)
+        record = self.get(store, service, dia)
+        now = time.time()
+        if record is not None and record.payload_hash == payload_hash:
+            record.checked_at = now
+            self.unchanged += 1
+            return record.hours
+
+        hours = parse(day_slots)
+        with self._lock:
+            self._days.setdefault((str(store), str(service)), {})[dia] = DayRecord(payload_hash, hours, now)
+        self.changed += 1
+        return hours
+
+    def retain(self, store, service, month_prefix: str, open_days: Iterable[str], today: str):
+        """Forget days of a month that are no longer open, and days already past"""
+        keep = set(open_days)
+        with self._lock:
+            days = self._days.get((str(store), str(service)))
+            if not days:
+                return
+            for dia in list(days):
+                if dia < today or (dia.startswith(month_prefix) and dia not in keep):
+                    del days[dia]
+
+    def invalidate(self, store=None, service=None):
+        """Drop all state, or only that of a store (and service)"""
+        with self._lock:
+            if store is None:
+                self._days.clear()
+                return
+            for key in [k for k in self._days
+                        if k[0] == str(store) and (service is None or k[1] == str(service))]:
+                del self._days[key]
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        with self._lock:
+            keys = len(self._days)
+            days = sum(len(d) for d in self._days.values())
+        return {
+            'keys': keys,
+            'days': days,
+            'reused_without_fetch': self.reused,
+            'unchanged_payloads': self.unchanged,
+            'changed_payloads': self.changed,
+            'revalidate_after_seconds': self.revalidate_after
+        }
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la decodificación de respuestas AJAX de SitVal.
+
+Compara el camino anterior de _make_request (decodificar todo el cuerpo a
+texto para ver si ya estaba descomprimido y luego response.json()) con el
+actual (_decode_body mirando solo unos bytes + parser JSON sobre bytes),
+usando los payloads de serviceMonthData y serviceDayData de benchmarks/payloads.
+
+Uso:
+    python benchmarks/bench_decode.py [--payloads DIR] [--number N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import brotli  # noqa: E402
+
+from scraper_sitval import _decode_body, _json_loads  # noqa: E402
+
+
+def legacy_decode(content: bytes, content_encoding: str) -> dict:
+    """Previous path: full UTF-8 decode to sniff, optional Brotli, then response.json()"""
+    if content_encoding == 'br':
+        test_text = content.decode('utf-8', errors='replace')
+        if not test_text.strip().startswith(('<!DOCTYPE', '<html', '{')):
+            content = brotli.decompress(content)
+    # requests' Response.json(): bytes -> str -> json.loads
+    return json.loads(content.decode('utf-8'))
+
+
+def current_decode(content: bytes, content_encoding: str) -> dict:
+    """Current path: magic-byte/prefix sniffing and a single parse from bytes"""
+    return _json_loads(_decode_body(content, content_encoding, 'bench'))
+
+
+def load_payloads(directory: str) -> dict:
+    payloads = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                payloads[name[:-5]] = f.read()
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payloads', default=os.path.join(HERE, 'payloads'))
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"JSON parser: {_json_loads.__module__}.{_json_loads.__name__}")
+    print(f"{'payload':<22}{'variant':<12}{'bytes':>8}{'legacy µs':>12}{'current µs':>12}{'speedup':>9}")
+    for name, body in load_payloads(args.payloads).items():
+        # SitVal sends plain JSON labelled 'br' as often as real Brotli
+        variants = {'br-header': body, 'brotli': brotli.compress(body), 'plain': body}
+        for variant, content in variants.items():
+            encoding = '' if variant == 'plain' else 'br'
+            assert legacy_decode(content, encoding) == current_decode(content, encoding)
+            legacy = timeit.timeit(lambda: legacy_decode(content, encoding), number=args.number)
+            current = timeit.timeit(lambda: current_decode(content, encoding), number=args.number)
+            print(f"{name:<22}{variant:<12}{len(content):>8}"
+                  f"{legacy / args.number * 1e6:>12.1f}{current / args.number * 1e6:>12.1f}"
+                  f"{legacy / current:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmark de extremo a extremo contra el simulador local de SitVal.
+
+Levanta sitval_simulator en un hilo, apunta main.py a él (SITVAL_BASE_URL) y mide:
+- refresher: throughput de refresh_cache_cycle() en keys/hora con un límite de ritmo dado
+- /itv/fechas: p50/p99 para aciertos de caché, fallos y fallos concurrentes
+- notificaciones: tiempo de fan-out con 1k, 10k y 100k tokens registrados
+- memoria: RSS máximo del proceso y pico de tracemalloc por sección
+
+Los resultados se escriben en JSON (--output) para comparar entre commits.
+
+Uso:
+    python benchmarks/bench_e2e.py --output bench_e2e.json
+    python benchmarks/bench_e2e.py --quick   # tamaños reducidos para una comprobación rápida
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+sys.path.insert(0, BACKEND)
+
+from slots import SlotSet  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_simulator(port: int, latency_ms: float):
+    """Run sitval_simulator with uvicorn in a daemon thread"""
+    os.environ.setdefault('SIM_LATENCY_MS', str(latency_ms))
+    os.environ.setdefault('SIM_LATENCY_JITTER_MS', str(latency_ms / 2))
+    import uvicorn
+    import sitval_simulator
+    server = uvicorn.Server(uvicorn.Config(sitval_simulator.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return sitval_simulator
+
+
+def percentiles(samples):
+    """p50/p99/max in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))]
+    return {
+        'count': len(samples),
+        'p50_ms': round(statistics.median(ordered) * 1000, 2),
+        'p99_ms': round(p99 * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2)
+    }
+
+
+def rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is in KiB on Linux)"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the app's per-request logging while measuring"""
+    logging.disable(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+@contextlib.contextmanager
+def traced(result: dict):
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['tracemalloc_peak_mb'] = round(peak / 1e6, 2)
+        result['rss_max_mb'] = rss_mb()
+
+
+def bench_refresher(main, simulator, keys: int, rate: float) -> dict:
+    """Keys per hour of one refresh_cache_cycle() over `keys` cached keys"""
+    main.upstream_limiter.rate = main.upstream_limiter.max_rate = rate
+    main.upstream_limiter.burst = max(1.0, rate)
+    main.slot_cache.clear()
+    main.refresh_schedule.prune(())
+    for store in range(1, keys + 1):
+        main.slot_cache.set(main.cache_key(str(store), '227'), SlotSet(str(store), '227'), timestamp=0)
+    main.month_cache.invalidate()
+    main.day_state.invalidate()
+
+    calls_before = sum(v for k, v in simulator.stats.items() if k.startswith('module_'))
+    result = {'keys': keys, 'rate_limit_rps': rate}
+    with traced(result), quiet():
+        started = time.perf_counter()
+        refreshed = main.refresh_cache_cycle()
+        elapsed = time.perf_counter() - started
+    calls = sum(v for k, v in simulator.stats.items() if k.startswith('module_')) - calls_before
+    result.update({
+        'refreshed': refreshed,
+        'seconds': round(elapsed, 2),
+        'keys_per_hour': round(refreshed / elapsed * 3600) if elapsed else None,
+        'upstream_calls': calls,
+        'upstream_calls_per_key': round(calls / max(1, refreshed), 2)
+    })
+    return result
+
+
+async def bench_fechas(main, misses: int, hits: int, concurrency: int) -> dict:
+    """/itv/fechas latency for cache hits, sequential misses and concurrent misses"""
+    import httpx
+    result = {}
+
+    async with httpx.AsyncClient(app=main.app, base_url='http://bench') as client:
+        async def timed(path):
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        with quiet():
+            main.slot_cache.clear()
+            samples = [await timed(f'/itv/fechas?store={store}&service=228&n=5')
+                       for store in range(1, misses + 1)]
+        result['miss'] = percentiles(samples)
+
+        with quiet():
+            samples = [await timed(f'/itv/fechas?store={1 + i % misses}&service=228&n=5') for i in range(hits)]
+        result['hit'] = percentiles(samples)
+
+        # Same key: single-flight should make everyone wait for one scrape
+        with quiet():
+            main.slot_cache.clear()
+            samples = await asyncio.gather(*[timed('/itv/fechas?store=1&service=229&n=3')
+                                             for _ in range(concurrency)])
+        result['concurrent_miss_same_key'] = percentiles(samples)
+
+        with quiet():
+            main.slot_cache.clear()
+            samples = await asyncio.gather(*[timed(f'/itv/fechas?store={store}&service=229&n=3')
+                                             for store in range(1, concurrency + 1)])
+        result['concurrent_miss_distinct_keys'] = percentiles(samples)
+    return result
+
+
+def bench_fanout(main, notifier, tokens: int) -> dict:
+    """Time for set_cached_slots to diff and notify `tokens` users watching one station"""
+    store, service = '1', '227'
+    old = SlotSet(store, service, '40.00')
+    new = SlotSet(store, service, '40.00')
+    base = datetime.date.today() + datetime.timedelta(days=1)
+    for minute in range(0, 600, 15):
+        hora = f"{8 + minute // 60:02d}:{minute % 60:02d}"
+        old.append(base.isoformat(), hora, '40.00')
+        new.append(base.isoformat(), hora, '40.00')
+    new.append((base + datetime.timedelta(days=1)).isoformat(), '09:00', '40.00')
+    seen = old.legacy_ids()
+
+    notifier.registered_tokens.clear()
+    for i in range(tokens):
+        notifier.registered_tokens[f"bench-token-{i:08d}-xxxxxxxx"] = {
+            'user_id': f"user-{i}", 'favoritos': [store, str(2 + i % 30)],
+            f"last_seen_{store}_{service}": list(seen)
+        }
+
+    result = {'tokens': tokens}
+    with traced(result), quiet():
+        started = time.perf_counter()
+        main.set_cached_slots(store, service, new)
+        result['seconds'] = round(time.perf_counter() - started, 3)
+    result['tokens_file_mb'] = round(os.path.getsize(notifier.TOKENS_DATA_FILE) / 1e6, 2)
+    notifier.registered_tokens.clear()
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench_e2e.json')
+    parser.add_argument('--rate', type=float, default=2.0, help='upstream requests/second for the refresher run')
+    parser.add_argument('--api-rate', type=float, default=50.0, help='upstream requests/second for /itv/fechas runs')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='simulated SitVal latency')
+    parser.add_argument('--refresh-keys', type=int, default=30)
+    parser.add_argument('--misses', type=int, default=30)
+    parser.add_argument('--hits', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--tokens', default='1000,10000,100000')
+    parser.add_argument('--quick', action='store_true', help='small sizes, for a smoke run')
+    args = parser.parse_args()
+    if args.quick:
+        args.refresh_keys, args.misses, args.hits, args.concurrency = 5, 5, 50, 5
+        args.tokens = '1000,10000'
+        args.rate = max(args.rate, 20.0)
+
+    port = free_port()
+    simulator = start_simulator(port, args.latency_ms)
+    os.environ['SITVAL_BASE_URL'] = f"http://127.0.0.1:{port}"
+    # main/notifier keep tokens_data.json in the working directory: use a scratch one
+    workdir = tempfile.mkdtemp(prefix='citabot-bench-')
+    os.chdir(workdir)
+    with quiet():
+        import main as app_main
+        import notifier
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'import_rss_mb': rss_mb()
+    }
+
+    print(f"🔄 Refresher: {args.refresh_keys} keys at {args.rate} req/s...")
+    results['refresher'] = bench_refresher(app_main, simulator, args.refresh_keys, args.rate)
+    print(f"   {results['refresher']['keys_per_hour']} keys/hour")
+
+    print("⏱️ /itv/fechas latency...")
+    app_main.upstream_limiter.rate = app_main.upstream_limiter.max_rate = args.api_rate
+    app_main.upstream_limiter.burst = args.api_rate
+    results['fechas'] = asyncio.run(bench_fechas(app_main, args.misses, args.hits, args.concurrency))
+    for name, stats in results['fechas'].items():
+        print(f"   {name:<30} p50 {stats['p50_ms']:>8} ms   p99 {stats['p99_ms']:>8} ms")
+
+    results['notification_fanout'] = []
+    for tokens in (int(t) for t in args.tokens.split(',') if t):
+        print(f"🔔 Notification fan-out to {tokens} tokens...")
+        fanout = bench_fanout(app_main, notifier, tokens)
+        results['notification_fanout'].append(fanout)
+        print(f"   {fanout['seconds']} s, tracemalloc peak {fanout['tracemalloc_peak_mb']} MB")
+
+    results['rss_max_mb'] = rss_mb()
+    output = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.output) \
+        if not os.path.isabs(args.output) else args.output
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"📝 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
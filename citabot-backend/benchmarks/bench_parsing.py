@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de los parsers de sitval_parsing.
+
+Recorre el corpus de formas de get_open_days y get_day_slots de
+benchmarks/payloads/parsing/shapes.json, comprueba que el parser actual da el
+mismo resultado que la implementación anterior y mide ambos.
+
+Uso:
+    python benchmarks/bench_parsing.py [--corpus FICHERO] [--number N] [--fail-slower X]
+
+--fail-slower X sale con código 1 si algún parser actual tarda más de X veces
+lo que tardaba el anterior (para detectar regresiones).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import sitval_parsing  # noqa: E402
+
+
+def legacy_open_days(open_days, first='0000-00-00', last='9999-99-99'):
+    """Previous _filter_valid_days + _candidate_days filtering (strptime per day)"""
+    valid_days = []
+    if isinstance(open_days, dict):
+        for key, value in open_days.items():
+            if isinstance(value, str) and len(value) == 10 and '-' in value:
+                try:
+                    year, month, day = value.split('-')
+                    if len(year) == 4 and len(month) == 2 and len(day) == 2:
+                        valid_days.append(value)
+                except ValueError:
+                    continue
+    elif isinstance(open_days, list):
+        valid_days = [v for v in open_days if isinstance(v, str) and not v.startswith('n')]
+    filtered_days = []
+    for dia in valid_days:
+        try:
+            datetime.datetime.strptime(dia, '%Y-%m-%d')
+            if first <= dia <= last:
+                filtered_days.append(dia)
+        except ValueError:
+            continue
+    filtered_days.sort()
+    return filtered_days
+
+
+def legacy_day_hours(day_slots):
+    """Previous _extract_valid_hours"""
+    valid_hours = []
+
+    def extract_hour(hora_str):
+        if isinstance(hora_str, str) and len(hora_str) >= 16:
+            return hora_str[11:16]
+        return None
+
+    if isinstance(day_slots, dict):
+        for slot_group in day_slots.values():
+            if isinstance(slot_group, dict):
+                for hora_str in slot_group.values():
+                    h = extract_hour(hora_str)
+                    if h:
+                        valid_hours.append(h)
+            elif isinstance(slot_group, list):
+                for hora in slot_group:
+                    h = extract_hour(hora)
+                    if h:
+                        valid_hours.append(h)
+            elif isinstance(slot_group, str):
+                h = extract_hour(slot_group)
+                if h:
+                    valid_hours.append(h)
+    elif isinstance(day_slots, list):
+        for hora in day_slots:
+            h = extract_hour(hora)
+            if h:
+                valid_hours.append(h)
+    return sorted(list(set(valid_hours)))
+
+
+PARSERS = {
+    'get_open_days': (legacy_open_days, sitval_parsing.parse_open_days),
+    'get_day_slots': (legacy_day_hours, sitval_parsing.parse_day_hours),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=os.path.join(HERE, 'payloads', 'parsing', 'shapes.json'))
+    parser.add_argument('--number', type=int, default=5000)
+    parser.add_argument('--fail-slower', type=float, default=None)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    regressions = []
+    print(f"{'shape':<30}{'items':>7}{'legacy µs':>12}{'current µs':>12}{'speedup':>9}")
+    for name, shape in corpus.items():
+        legacy, current = PARSERS[shape['field']]
+        payload = shape['payload']
+        expected = legacy(payload)
+        if current(payload) != expected:
+            print(f"{name:<30} MISMATCH: {current(payload)[:5]} != {expected[:5]}")
+            regressions.append(name)
+            continue
+        legacy_time = timeit.timeit(lambda: legacy(payload), number=args.number)
+        current_time = timeit.timeit(lambda: current(payload), number=args.number)
+        ratio = legacy_time / current_time
+        print(f"{name:<30}{len(expected):>7}{legacy_time / args.number * 1e6:>12.2f}"
+              f"{current_time / args.number * 1e6:>12.2f}{ratio:>8.1f}x")
+        if args.fail_slower is not None and current_time > legacy_time * args.fail_slower:
+            regressions.append(name)
+
+    if regressions:
+        print(f"❌ Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
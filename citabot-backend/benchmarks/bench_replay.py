@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark del scraper contra tráfico de SitVal grabado (sin red).
+
+Grabar un corpus (llama a SitVal de verdad, respetando el limitador normal):
+    python benchmarks/bench_replay.py record corpus.jsonl.gz --keys 1:227,2:227
+
+Reproducirlo (latencia original escalada, 0 = sin latencia):
+    python benchmarks/bench_replay.py run corpus.jsonl.gz --latency-scale 0 --repeat 5
+
+En modo run el reloj del scraper se fija al día de la grabación, de modo que
+las búsquedas piden los mismos meses y días que entonces.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from rate_limiter import AdaptiveRateLimiter  # noqa: E402
+from scraper_sitval import SitValScraper  # noqa: E402
+from sitval_replay import ReplayCorpus, SitValRecorder  # noqa: E402
+
+
+def parse_keys(keys: str):
+    return [tuple(key.split(':', 1)) for key in keys.split(',') if ':' in key]
+
+
+def corpus_keys(corpus: ReplayCorpus):
+    """store:service pairs searched in a corpus"""
+    keys = []
+    for entry in corpus.entries:
+        form = entry['form']
+        if entry['module'] == 'serviceMonthData' and 'store' in form and 'service' in form:
+            key = (form['store'], form['service'])
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def record(args):
+    recorder = SitValRecorder(args.corpus)
+    scraper = SitValScraper(recorder=recorder)
+    try:
+        scraper.extract_stations(scraper.get_group_startup())
+        for store, service in parse_keys(args.keys):
+            scraper.get_next_available_slots(store, service, "", args.max_slots, args.day_concurrency)
+    finally:
+        recorder.close()
+    print(f"📼 Recorded {recorder.recorded} exchanges into {args.corpus}")
+
+
+def run(args):
+    corpus = ReplayCorpus(args.corpus, args.latency_scale)
+    keys = parse_keys(args.keys) if args.keys else corpus_keys(corpus)
+    # Pacing is not what is measured here
+    limiter = AdaptiveRateLimiter(rate=1e6, max_rate=1e6, burst=1e6)
+
+    timings = {'extract_stations': [], 'get_next_available_slots': []}
+    for _ in range(args.repeat):
+        scraper = SitValScraper(rate_limiter=limiter)
+        corpus.install(scraper)
+        corpus.rewind()
+
+        started = time.perf_counter()
+        stations = scraper.extract_stations(scraper.get_group_startup())
+        timings['extract_stations'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        found = 0
+        for store, service in keys:
+            found += len(scraper.get_next_available_slots(store, service, "", args.max_slots,
+                                                          args.day_concurrency))
+        timings['get_next_available_slots'].append(time.perf_counter() - started)
+
+    print(f"\nCorpus: {corpus.status()}")
+    print(f"Stations: {len(stations)}, keys: {len(keys)}, slots found: {found}")
+    for name, values in timings.items():
+        print(f"{name:<26} median {statistics.median(values) * 1000:8.1f} ms   "
+              f"min {min(values) * 1000:8.1f} ms   ({len(values)} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['record', 'run'])
+    parser.add_argument('corpus')
+    parser.add_argument('--keys', default='', help='store:service pairs, comma separated')
+    parser.add_argument('--max-slots', type=int, default=10)
+    parser.add_argument('--day-concurrency', type=int, default=2)
+    parser.add_argument('--latency-scale', type=float, default=1.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.mode == 'record':
+        record(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,10 +16,82 @@ class CacheConfig:
     # Configuración de rate limiting para evitar baneos
     MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 2))  # Máximo 2 requests simultáneos
     REQUEST_DELAY = float(os.getenv('REQUEST_DELAY', 3.0))  # 3 segundos entre requests
+    DAY_FETCH_CONCURRENCY = int(os.getenv('DAY_FETCH_CONCURRENCY', 2))  # Días consultados en paralelo por búsqueda
+    
+    # Limitador adaptativo (token bucket AIMD) compartido por todas las llamadas a SitVal
+    # Un scrape en frío son ~20 llamadas: con 4 req/s y ráfaga de 10 tarda ~2.5 s, como antes con REQUEST_DELAY por clave
+    RATE_LIMIT_INITIAL = float(os.getenv('RATE_LIMIT_INITIAL', 4.0))  # req/s al arrancar
+    RATE_LIMIT_MIN = float(os.getenv('RATE_LIMIT_MIN', 0.05))  # Nunca por debajo de 1 petición cada 20 s
+    RATE_LIMIT_MAX = float(os.getenv('RATE_LIMIT_MAX', 8.0))
+    RATE_LIMIT_INCREASE = float(os.getenv('RATE_LIMIT_INCREASE', 0.01))  # Subida aditiva por respuesta sana
+    RATE_LIMIT_DECREASE_FACTOR = float(os.getenv('RATE_LIMIT_DECREASE_FACTOR', 0.5))  # Bajada multiplicativa
+    RATE_LIMIT_DECREASE_COOLDOWN = float(os.getenv('RATE_LIMIT_DECREASE_COOLDOWN', 5.0))
+    RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 10))  # Llamadas seguidas sin esperar
+    
+    # Catálogo de estaciones (groupStartup)
+    STATION_CATALOG_TTL = int(os.getenv('STATION_CATALOG_TTL', 21600))  # 6 horas
+    STATION_CATALOG_RETRY_DELAY = int(os.getenv('STATION_CATALOG_RETRY_DELAY', 60))  # Reintento tras fallo
+    
+    # Catálogo de servicios por estación (startUp)
+    SERVICES_CATALOG_TTL = int(os.getenv('SERVICES_CATALOG_TTL', 86400))  # 24 horas
+    SERVICES_REFRESH_INTERVAL = int(os.getenv('SERVICES_REFRESH_INTERVAL', 3600))  # Revisión cada hora
+    
+    # Caché de disponibilidad mensual (serviceMonthData)
+    MONTH_CACHE_TTL = int(os.getenv('MONTH_CACHE_TTL', 900))  # 15 minutos
+    DAY_REVALIDATE_AFTER = int(os.getenv('DAY_REVALIDATE_AFTER', 1800))  # Refresco incremental: revalidar cada día tras 30 minutos (menos que el TTL de huecos)
+    
+    # Pool de conexiones HTTP hacia SitVal
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))  # Conexiones por host (y hilos de descarga de días)
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 30.0))  # Segundos que vive una conexión ociosa
+    HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', 'false').lower() in ('1', 'true', 'yes')  # Requiere el paquete h2
+    
+    # Origen de SitVal (apuntar a sitval_simulator para pruebas de carga)
+    SITVAL_BASE_URL = os.getenv('SITVAL_BASE_URL', 'https://citaitvsitval.com')
+    
+    # Logging (niveles: DEBUG, INFO, WARNING, ERROR)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # Nivel por defecto de todos los componentes
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')  # Por componente: "scraper=WARNING,notifier=DEBUG"
+    LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))  # Mensajes por línea de código y ventana (0 = sin límite)
+    LOG_RATE_WINDOW = float(os.getenv('LOG_RATE_WINDOW', 60.0))  # Segundos
+    
+    # Caché de huecos de /itv/fechas (slot_cache.py)
+    SLOT_CACHE_BACKEND = os.getenv('SLOT_CACHE_BACKEND', 'memory')  # memory, sqlite o redis
+    SLOT_CACHE_MAX_ENTRIES = int(os.getenv('SLOT_CACHE_MAX_ENTRIES', 5000))  # Claves máximas (LRU)
+    SLOT_CACHE_MAX_MB = float(os.getenv('SLOT_CACHE_MAX_MB', 64))  # Tamaño aproximado máximo
+    SLOT_CACHE_IDLE_TTL = int(os.getenv('SLOT_CACHE_IDLE_TTL', 259200))  # 3 días sin peticiones = se deja de refrescar
+    SLOT_CACHE_SQLITE_PATH = os.getenv('SLOT_CACHE_SQLITE_PATH', 'slot_cache.sqlite3')
+    SLOT_CACHE_REDIS_URL = os.getenv('SLOT_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    SLOT_CACHE_MAX_STALE = int(os.getenv('SLOT_CACHE_MAX_STALE', 7200))  # Segundos tras caducar en que aún se sirve mientras se refresca
+    SLOT_CACHE_SNAPSHOT_PATH = os.getenv('SLOT_CACHE_SNAPSHOT_PATH', 'slot_cache.snapshot')  # Vacío = sin instantáneas
+    SLOT_CACHE_SNAPSHOT_INTERVAL = int(os.getenv('SLOT_CACHE_SNAPSHOT_INTERVAL', 300))  # Segundos entre instantáneas
+    
+    # Compresión de respuestas de la API (brotli si está instalado, si no gzip)
+    RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 500))  # Bytes; 0 = sin comprimir
+    
+    # Trazas de scrapes y refrescos (GET /debug/traces)
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', 50))  # Últimas trazas completas en memoria
+    TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', '')  # p.ej. http://127.0.0.1:4318/v1/traces (vacío = sin exportar)
+    
+    # Endpoints /admin (perfilado); sin token quedan desactivados
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')  # Se envía como "Authorization: Bearer <token>"
+    PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 300.0))  # Ventana máxima del profiler
+    
+    # Grabación / reproducción del tráfico con SitVal (vacío = desactivado)
+    SITVAL_CAPTURE_PATH = os.getenv('SITVAL_CAPTURE_PATH', '')  # Corpus .jsonl.gz donde grabar cada petición
+    SITVAL_REPLAY_PATH = os.getenv('SITVAL_REPLAY_PATH', '')  # Corpus a reproducir en lugar de llamar a SitVal
+    SITVAL_REPLAY_LATENCY_SCALE = float(os.getenv('SITVAL_REPLAY_LATENCY_SCALE', 1.0))  # 0 = sin latencia
     
     # Configuración de reintentos
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
     RETRY_DELAY = float(os.getenv('RETRY_DELAY', 5.0))  # 5 segundos entre reintentos
+    RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 30.0))  # Tope del backoff exponencial
+    REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 30.0))  # Timeout por petición a SitVal
+    REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 20.0))  # Tope por llamada, reintentos y esperas incluidos
+    
+    # Circuit breaker por endpoint de SitVal
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 3))  # Fallos seguidos para abrir
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 300.0))  # 5 minutos abierto
     
     # Configuración de horarios de scraping (para ser más respetuosos)
     SCRAPING_HOURS_START = int(os.getenv('SCRAPING_HOURS_START', 7))  # 7 AM
@@ -33,8 +105,38 @@ class CacheConfig:
             'background_refresh_interval_minutes': cls.BACKGROUND_REFRESH_INTERVAL / 60,
             'max_concurrent_requests': cls.MAX_CONCURRENT_REQUESTS,
             'request_delay_seconds': cls.REQUEST_DELAY,
+            'day_fetch_concurrency': cls.DAY_FETCH_CONCURRENCY,
+            'rate_limit_initial_per_second': cls.RATE_LIMIT_INITIAL,
+            'rate_limit_range_per_second': f"{cls.RATE_LIMIT_MIN} - {cls.RATE_LIMIT_MAX}",
+            'station_catalog_ttl_minutes': cls.STATION_CATALOG_TTL / 60,
+            'services_catalog_ttl_minutes': cls.SERVICES_CATALOG_TTL / 60,
+            'month_cache_ttl_minutes': cls.MONTH_CACHE_TTL / 60,
+            'day_revalidate_after_minutes': cls.DAY_REVALIDATE_AFTER / 60,
+            'http_pool_size': cls.HTTP_POOL_SIZE,
+            'http2_enabled': cls.HTTP2_ENABLED,
+            'sitval_base_url': cls.SITVAL_BASE_URL,
+            'slot_cache_backend': cls.SLOT_CACHE_BACKEND,
+            'slot_cache_max_entries': cls.SLOT_CACHE_MAX_ENTRIES,
+            'slot_cache_max_mb': cls.SLOT_CACHE_MAX_MB,
+            'slot_cache_idle_ttl_hours': cls.SLOT_CACHE_IDLE_TTL / 3600,
+            'slot_cache_max_stale_minutes': cls.SLOT_CACHE_MAX_STALE / 60,
+            'slot_cache_snapshot_enabled': bool(cls.SLOT_CACHE_SNAPSHOT_PATH) and cls.SLOT_CACHE_SNAPSHOT_INTERVAL > 0,
+            'slot_cache_snapshot_interval_minutes': cls.SLOT_CACHE_SNAPSHOT_INTERVAL / 60,
+            'response_compression_min_size': cls.RESPONSE_COMPRESSION_MIN_SIZE,
+            'log_level': cls.LOG_LEVEL,
+            'log_levels': cls.LOG_LEVELS,
+            'tracing_enabled': cls.TRACING_ENABLED,
+            'trace_buffer_size': cls.TRACE_BUFFER_SIZE,
+            'trace_otlp_export': bool(cls.TRACE_OTLP_ENDPOINT),
+            'admin_endpoints_enabled': bool(cls.ADMIN_TOKEN),
+            'sitval_capture_enabled': bool(cls.SITVAL_CAPTURE_PATH),
+            'sitval_replay_enabled': bool(cls.SITVAL_REPLAY_PATH),
             'max_retries': cls.MAX_RETRIES,
             'retry_delay_seconds': cls.RETRY_DELAY,
+            'request_timeout_seconds': cls.REQUEST_TIMEOUT,
+            'request_deadline_seconds': cls.REQUEST_DEADLINE,
+            'breaker_failure_threshold': cls.BREAKER_FAILURE_THRESHOLD,
+            'breaker_reset_timeout_seconds': cls.BREAKER_RESET_TIMEOUT,
             'scraping_hours': f"{cls.SCRAPING_HOURS_START}:00 - {cls.SCRAPING_HOURS_END}:00"
         }
     
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Instantáneas de la caché de huecos para arrancar en caliente.
+
+En Render el proceso se reinicia a menudo y la caché en memoria empieza vacía:
+todas las claves caducadas a la vez, una ráfaga de scrapes y peticiones frías
+en /itv/fechas. SnapshotWriter guarda cada SLOT_CACHE_SNAPSHOT_INTERVAL (y al
+apagar) las entradas y la hora del próximo refresco de cada clave en un
+fichero binario compacto; se escribe en un temporal y se renombra con
+os.replace, así que un corte a mitad nunca deja una instantánea a medias.
+
+Al arrancar, restore_snapshot() recarga las entradas (las que siguen dentro
+del TTL se sirven al momento) y RefreshSchedule reparte los refrescos
+pendientes a lo largo del intervalo en lugar de lanzarlos todos juntos.
+
+Formato: cabecera '<4sBI' (magic, versión, número de entradas), un registro
+'<HdddHdI' (longitud de la clave, timestamp, last_access, próximo refresco,
+profundidad pedida y cuándo, longitud del payload) + clave +
+SlotSet.to_bytes() por entrada, y un CRC32 final de todo lo anterior.
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cache_config import CacheConfig
+from log_config import get_logger
+from slot_cache import CacheEntry, SlotCache
+from slots import SlotSet
+
+logger = get_logger('cache')
+
+_MAGIC = b'CBSN'
+_VERSION = 2
+_FILE_HEADER = struct.Struct('<4sBI')  # magic, version, entries
+# key length, timestamp, last_access, next refresh, requested depth, requested at, payload length
+_RECORD = struct.Struct('<HdddHdI')
+_CRC = struct.Struct('<I')
+
+
+class RefreshSchedule:
+    """When each cache key is next due for a background refresh, and how deep to scrape it.
+
+    A key is due `interval` seconds after it was last scraped (by a request
+    or by the refresher), or later if it was explicitly deferred. Its depth is
+    the largest n requested within `depth_window`.
+    """
+
+    def __init__(self, interval: float, depth_window: float = 86400):
+        self.interval = interval
+        self.depth_window = depth_window
+        self._deferred: Dict[str, float] = {}
+        self._depths: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def due_at(self, key: str, entry: CacheEntry) -> float:
+        with self._lock:
+            deferred = self._deferred.get(key, 0)
+        return max(deferred, entry.timestamp + self.interval)
+
+    def defer(self, key: str, when: float):
+        """Do not refresh key before `when` (e.g. after a failed refresh)"""
+        with self._lock:
+            self._deferred[key] = when
+
+    def due_keys(self, entries: Iterable[Tuple[str, CacheEntry]], now: float = None) -> List[str]:
+        """Keys due by now, most overdue first"""
+        now = time.time() if now is None else now
+        due = [(self.due_at(key, entry), key) for key, entry in entries]
+        return [key for when, key in sorted(due) if when <= now]
+
+    def stagger(self, entries: Iterable[Tuple[str, CacheEntry]], now: float = None) -> int:
+        """Spread keys that are already due evenly over the next interval; returns how many"""
+        now = time.time() if now is None else now
+        overdue = self.due_keys(entries, now)
+        if not overdue:
+            return 0
+        step = self.interval / len(overdue)
+        with self._lock:
+            for i, key in enumerate(overdue):
+                self._deferred[key] = now + i * step
+        return len(overdue)
+
+    def note_depth(self, key: str, n: int, now: float = None):
+        """Record a request for the first n slots of key"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if key not in self._depths or n >= self._depths[key][0] or self._expired(key, now):
+                self._depths[key] = (n, now)
+
+    def _expired(self, key: str, now: float) -> bool:
+        return now - self._depths[key][1] > self.depth_window
+
+    def depth_for(self, key: str, default: int, now: float = None) -> int:
+        """Slots to scrape for key: the deepest recent request, at least default"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if key not in self._depths or self._expired(key, now):
+                return default
+            return max(default, self._depths[key][0])
+
+    def prune(self, keys: Iterable[str]):
+        """Forget keys that left the cache"""
+        live = set(keys)
+        with self._lock:
+            for state in (self._deferred, self._depths):
+                for key in [key for key in state if key not in live]:
+                    del state[key]
+
+    def deferred(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._deferred)
+
+    def depths(self) -> Dict[str, Tuple[int, float]]:
+        with self._lock:
+            return dict(self._depths)
+
+    def load(self, deferred: Dict[str, float], depths: Dict[str, Tuple[int, float]] = None):
+        with self._lock:
+            self._deferred.update(deferred)
+            self._depths.update(depths or {})
+
+
+def write_snapshot(path: str, entries: List[Tuple[str, CacheEntry]], schedule: RefreshSchedule) -> int:
+    """Atomically replace path with a snapshot of entries; returns its size in bytes"""
+    deferred, depths = schedule.deferred(), schedule.depths()
+    parts = [_FILE_HEADER.pack(_MAGIC, _VERSION, len(entries))]
+    for key, entry in entries:
+        key_bytes = key.encode('utf-8')
+        payload = entry.data.to_bytes()
+        depth, requested_at = depths.get(key, (0, 0.0))
+        parts.append(_RECORD.pack(len(key_bytes), entry.timestamp, entry.last_access,
+                                  deferred.get(key, 0.0), min(depth, 0xFFFF), requested_at, len(payload)))
+        parts.append(key_bytes)
+        parts.append(payload)
+    body = b''.join(parts)
+    data = body + _CRC.pack(zlib.crc32(body))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def read_snapshot(path: str) -> Tuple[List[Tuple[str, CacheEntry]], Dict[str, float], Dict[str, Tuple[int, float]]]:
+    """Entries, deferred refresh times and requested depths from a snapshot; raises ValueError if it is corrupt"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _FILE_HEADER.size + _CRC.size:
+        raise ValueError("snapshot truncated")
+    body, (crc, ) = data[:-_CRC.size], _CRC.unpack(data[-_CRC.size:])
+    if zlib.crc32(body) != crc:
+        raise ValueError("snapshot checksum mismatch")
+    magic, version, count = _FILE_HEADER.unpack_from(body)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"unsupported snapshot format {magic!r} v{version}")
+
+    entries, deferred, depths = [], {}, {}
+    offset = _FILE_HEADER.size
+    for _ in range(count):
+        (key_length, timestamp, last_access, next_refresh,
+         depth, requested_at, payload_length) = _RECORD.unpack_from(body, offset)
+        offset += _RECORD.size
+        key = body[offset:offset + key_length].decode('utf-8')
+        offset += key_length
+        data = SlotSet.from_bytes(body[offset:offset + payload_length])
+        offset += payload_length
+        entries.append((key, CacheEntry(data, timestamp, last_access)))
+        if next_refresh:
+            deferred[key] = next_refresh
+        if depth:
+            depths[key] = (depth, requested_at)
+    return entries, deferred, depths
+
+
+def restore_snapshot(cache: SlotCache, schedule: RefreshSchedule, path: str) -> int:
+    """Load a snapshot into cache and schedule at startup; returns the entries restored.
+
+    Keys idle for longer than the cache's idle_ttl are skipped, and keys the
+    backend already holds a newer copy of (sqlite, redis) are left alone.
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    started = time.monotonic()
+    try:
+        entries, deferred, depths = read_snapshot(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning("⚠️ Ignoring unreadable slot cache snapshot %s: %s", path, e)
+        return 0
+
+    cutoff = time.time() - cache.idle_ttl if cache.idle_ttl else 0
+    live = [(key, entry) for key, entry in entries if entry.last_access >= cutoff]
+    restored = cache.restore(live)
+    kept = {key for key, _ in cache.entries()}
+    schedule.load({key: when for key, when in deferred.items() if key in kept},
+                  {key: depth for key, depth in depths.items() if key in kept})
+    fresh = sum(1 for _, entry in live if cache.is_fresh(entry))
+    logger.info("♻️ Restored %s slot cache keys (%s still fresh) from %s in %.0f ms",
+                restored, fresh, path, (time.monotonic() - started) * 1000)
+    return restored
+
+
+class SnapshotWriter:
+    """Writes the slot cache snapshot periodically from a background thread"""
+
+    def __init__(self, cache: SlotCache, schedule: RefreshSchedule, path: str = None, interval: float = None):
+        self.cache = cache
+        self.schedule = schedule
+        self.path = CacheConfig.SLOT_CACHE_SNAPSHOT_PATH if path is None else path
+        self.interval = CacheConfig.SLOT_CACHE_SNAPSHOT_INTERVAL if interval is None else interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.last_written: Optional[float] = None
+        self.last_size = 0
+        self.last_duration_ms = 0.0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.interval > 0
+
+    def start(self):
+        if self.enabled:
+            threading.Thread(target=self._run, name="slot-cache-snapshot", daemon=True).start()
+
+    def stop(self):
+        """Stop the periodic writer and take a final snapshot"""
+        self._stop.set()
+        if self.enabled:
+            self.save()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self) -> bool:
+        """Write one snapshot now; never raises"""
+        with self._lock:
+            started = time.monotonic()
+            try:
+                size = write_snapshot(self.path, self.cache.entries(), self.schedule)
+            except Exception as e:
+                self.failures += 1
+                logger.warning("⚠️ Could not write slot cache snapshot %s: %s", self.path, e)
+                return False
+            self.last_duration_ms = round((time.monotonic() - started) * 1000, 1)
+            self.last_written = time.time()
+            self.last_size = size
+        logger.debug("💾 Slot cache snapshot written: %s bytes in %s ms", size, self.last_duration_ms)
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'interval_seconds': self.interval,
+            'last_written': (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_written))
+                             if self.last_written else None),
+            'size_kb': round(self.last_size / 1024, 1),
+            'duration_ms': self.last_duration_ms,
+            'failures': self.failures
+        }
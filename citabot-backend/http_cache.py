@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Caché HTTP y compresión de las respuestas de la API.
+
+validate() pone ETag, Last-Modified y Cache-Control (max-age = lo que le
+queda al dato en la caché del servidor) y devuelve un 304 cuando el cliente
+ya tiene esa versión (If-None-Match, o If-Modified-Since si no hay ETag que
+comparar). Los ETag son débiles y se derivan de la versión del dato cacheado,
+no del cuerpo serializado, así que un 304 no cuesta serializar nada.
+
+CompressionMiddleware comprime con brotli (si el paquete está instalado) o
+gzip según Accept-Encoding. Bufferiza la respuesta entera: no usarlo con
+respuestas en streaming. Los cuerpos con ETag se guardan ya comprimidos, de
+modo que la lista de estaciones solo se comprime cuando cambia.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from cache_config import CacheConfig
+
+try:
+    # Optional: ~20% smaller than gzip for JSON
+    import brotli
+except ImportError:
+    brotli = None
+
+_COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+
+def etag(*parts) -> str:
+    """Weak validator from the values a response body is built from"""
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _matches(if_none_match: str, current: str) -> bool:
+    """Weak comparison against an If-None-Match list"""
+    opaque = current[2:] if current.startswith('W/') else current
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def _not_modified(request: Request, current: str, last_modified: Optional[float]) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return _matches(if_none_match, current)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def validate(request: Request, response: Response, current: str, last_modified: float = None,
+             max_age: float = 0) -> Optional[Response]:
+    """Set validators and Cache-Control on response; returns a 304 to send instead if the client's copy is current"""
+    headers = {
+        'ETag': current,
+        'Cache-Control': f"public, max-age={max(0, int(max_age))}"
+    }
+    if last_modified:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    if _not_modified(request, current, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """'br' or 'gzip' if the client accepts it (brotli preferred), else None"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class CompressedBodies:
+    """Small LRU of compressed bodies keyed by (ETag, encoding), plus compression stats"""
+
+    def __init__(self, size: int = 32):
+        self.size = size
+        self._bodies: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.memo_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress(self, body: bytes, encoding: str, current_etag: Optional[str]) -> bytes:
+        key = (current_etag, encoding)
+        if current_etag:
+            with self._lock:
+                cached = self._bodies.get(key)
+                if cached is not None:
+                    self._bodies.move_to_end(key)
+                    self.memo_hits += 1
+                    return cached
+        compressed = compress(body, encoding)
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(compressed)
+            if current_etag:
+                self._bodies[key] = compressed
+                while len(self._bodies) > self.size:
+                    self._bodies.popitem(last=False)
+        return compressed
+
+    def status(self) -> Dict[str, object]:
+        """Snapshot for monitoring endpoints"""
+        return {
+            'brotli_available': brotli is not None,
+            'minimum_size': CacheConfig.RESPONSE_COMPRESSION_MIN_SIZE,
+            'compressed': self.compressed,
+            'memo_hits': self.memo_hits,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+        }
+
+
+compressed_bodies = CompressedBodies()
+
+
+class CompressionMiddleware:
+    """ASGI middleware: brotli/gzip per Accept-Encoding for compressible bodies above minimum_size"""
+
+    def __init__(self, app, minimum_size: int = None, bodies: CompressedBodies = None):
+        self.app = app
+        self.minimum_size = CacheConfig.RESPONSE_COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+        self.bodies = compressed_bodies if bodies is None else bodies
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.minimum_size:
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+            chunks.append(message.get('body', b''))
+            if message.get('more_body', False):
+                return
+            body = b''.join(chunks)
+            headers = MutableHeaders(raw=start['headers'])
+            if self._compressible(start['status'], headers, body):
+                body = self.bodies.compress(body, encoding, headers.get('etag'))
+                headers['Content-Encoding'] = encoding
+                headers['Content-Length'] = str(len(body))
+                headers.add_vary_header('Accept-Encoding')
+            await send(start)
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compressible(self, status: int, headers: MutableHeaders, body: bytes) -> bool:
+        if status < 200 or status in (204, 304) or len(body) < self.minimum_size:
+            return False
+        if 'content-encoding' in headers:
+            return False
+        return headers.get('content-type', '').startswith(_COMPRESSIBLE_TYPES)
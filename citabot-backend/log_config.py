@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Logging de Citabot.
+
+Todos los módulos usan get_logger(componente), que devuelve el logger
+'citabot.<componente>'. Los registros pasan por una QueueHandler y un hilo
+(QueueListener) los escribe en stdout, así el hilo de la petición nunca
+espera a la E/S. El nivel se configura por componente en CacheConfig
+(LOG_LEVEL y LOG_LEVELS), y RateLimitFilter limita cuántas veces por
+ventana se emite un mismo punto de log, resumiendo lo descartado.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Tuple
+
+from cache_config import CacheConfig
+
+ROOT_LOGGER = 'citabot'
+
+_setup_lock = threading.Lock()
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most `limit` records per call site (file:line) and window.
+
+    When a window with dropped records ends, the next record from that call
+    site says how many were suppressed. ERROR and above are never dropped.
+    """
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # (pathname, lineno) -> [window_start, emitted, suppressed]
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.setdefault((record.pathname, record.lineno), [now, 0, 0])
+            if now - site[0] >= self.window:
+                if site[2]:
+                    record.msg = f"{record.msg} [{site[2]} similar messages suppressed]"
+                site[0], site[1], site[2] = now, 0, 0
+            if site[1] >= self.limit:
+                site[2] += 1
+                self.suppressed_total += 1
+                return False
+            site[1] += 1
+            return True
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """'scraper=WARNING,notifier=DEBUG' -> {'scraper': 'WARNING', 'notifier': 'DEBUG'}"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            component, level = item.split('=', 1)
+            levels[component.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Configure the citabot loggers once: queue handler, stdout listener thread, levels and rate limit"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        log_queue = queue.SimpleQueue()
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s %(name)s: %(message)s'))
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        handler = logging.handlers.QueueHandler(log_queue)
+        # Filter before enqueueing so dropped records cost no queue traffic
+        handler.addFilter(RateLimitFilter(CacheConfig.LOG_RATE_LIMIT, CacheConfig.LOG_RATE_WINDOW))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(handler)
+        root.setLevel(CacheConfig.LOG_LEVEL.upper())
+        root.propagate = False
+        for component, level in _parse_levels(CacheConfig.LOG_LEVELS).items():
+            logging.getLogger(f"{ROOT_LOGGER}.{component}").setLevel(level)
+
+
+def get_logger(component: str) -> logging.Logger:
+    """Logger for a component (scraper, cache, notifier, api, ...)"""
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{component}")
+
+
+def suppressed_count() -> int:
+    """Records dropped by the rate limit so far"""
+    for handler in logging.getLogger(ROOT_LOGGER).handlers:
+        for log_filter in handler.filters:
+            if isinstance(log_filter, RateLimitFilter):
+                return log_filter.suppressed_total
+    return 0
@@ -1,18 +1,67 @@
+import asyncio
+import hmac
 import json
 import threading
 import time
 import os
-from fastapi import FastAPI, Request, Query
+from fastapi import FastAPI, Request, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from notifier import register_device_token, send_new_appointment_notification, get_registered_tokens_count, is_firebase_enabled, update_user_favorites
-from scraper_sitval import SitValScraper
+from scraper_sitval import SitValScraper, AsyncSitValScraper
+from cache_config import CacheConfig
+from station_catalog import StationCatalog
+from services_catalog import ServicesCatalog
+from availability_cache import MonthDataCache, DayStateStore
+from singleflight import SingleFlight
+from resilience import BreakerRegistry
+import rate_limiter
+from rate_limiter import AdaptiveRateLimiter
+from slots import parse_legacy_id, unpack_slot
+from slot_cache import SlotCache
+from cache_snapshot import RefreshSchedule, SnapshotWriter, restore_snapshot
+from sitval_replay import SitValRecorder, ReplayCorpus
+from log_config import get_logger, suppressed_count
+from http_cache import CompressionMiddleware, compressed_bodies
+import http_cache
+import metrics
+import profiling
+import tracing
+
+logger = get_logger('api')
 
 # Server startup time for health checks
 startup_time = time.time()
 
 
-scraper = SitValScraper()
+# serviceMonthData responses shared by every slot search (own TTL)
+month_cache = MonthDataCache()
+# Per-day payload hashes, so background refreshes only refetch changed/due days
+day_state = DayStateStore()
+# Circuit breakers per SitVal endpoint, shared so both scrapers fail fast together
+upstream_breakers = BreakerRegistry()
+# Token bucket every SitVal call goes through; adapts its rate to upstream responses
+upstream_limiter = AdaptiveRateLimiter()
+# Capture / offline replay of SitVal traffic, off unless configured
+upstream_recorder = SitValRecorder(CacheConfig.SITVAL_CAPTURE_PATH) if CacheConfig.SITVAL_CAPTURE_PATH else None
+upstream_replay = (ReplayCorpus(CacheConfig.SITVAL_REPLAY_PATH, CacheConfig.SITVAL_REPLAY_LATENCY_SCALE)
+                   if CacheConfig.SITVAL_REPLAY_PATH else None)
+scraper = SitValScraper(month_cache, day_state, upstream_breakers, upstream_limiter,
+                        upstream_recorder, upstream_replay)
+# Non-blocking scraper for async endpoints, so upstream waits never stall the event loop
+async_scraper = AsyncSitValScraper(month_cache, day_state, upstream_breakers, upstream_limiter,
+                                   upstream_recorder, upstream_replay)
+if upstream_replay is not None:
+    logger.info("📼 Replaying SitVal traffic from %s", CacheConfig.SITVAL_REPLAY_PATH)
+    upstream_replay.install(scraper)
+    upstream_replay.install(async_scraper)
+# On-demand wall-clock profiler for every thread (see /admin/profile)
+profiler = profiling.SamplingProfiler()
+# Shared, TTL-cached station list (one groupStartup call per TTL)
+station_catalog = StationCatalog(scraper)
+# Services per station, prefetched in background for every station in the catalog
+services_catalog = ServicesCatalog(scraper, station_catalog)
 app = FastAPI(
     title="Citabot API",
     description="API para consultar citas ITV en tiempo real",
@@ -39,27 +88,84 @@ app.add_middleware(
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST"],  # Solo métodos necesarios
-    allow_headers=["Content-Type", "Authorization"],  # Solo headers necesarios
+    # Solo headers necesarios (más los de peticiones condicionales y max-stale)
+    allow_headers=["Content-Type", "Authorization", "Cache-Control", "If-None-Match", "If-Modified-Since"],
+    expose_headers=["ETag", "Age", "Warning"],
 )
+# brotli/gzip per Accept-Encoding; compressed bodies are reused while their ETag holds
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency for /metrics; the route template keeps label cardinality bounded
+route_paths = {}
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    started = time.monotonic()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        endpoint = request.scope.get('endpoint')
+        if endpoint is not None and not route_paths:
+            route_paths.update({route.endpoint: route.path for route in app.routes if hasattr(route, 'endpoint')})
+        route = route_paths.get(endpoint, 'unmatched')
+        metrics.HTTP_LATENCY.labels(request.method, route, status).observe(time.monotonic() - started)
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Initialize server"""
-    print("🚀 Citabot server started")
+    """Initialize server and start background workers"""
+    # Warm restart: serve what the previous process had before the refresher starts
+    if snapshot_writer.enabled:
+        restore_snapshot(slot_cache, refresh_schedule, snapshot_writer.path)
+        snapshot_writer.start()
+    threading.Thread(target=background_cache_refresher, daemon=True).start()
+    services_catalog.start()
+    logger.info("🚀 Citabot server started")
 
-# In-memory cache for available slots
-slots_cache = {}
-slots_cache_lock = threading.Lock()
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the async scraper's HTTP connections, flush the capture corpus and snapshot the slot cache"""
+    await async_scraper.aclose()
+    await run_in_threadpool(snapshot_writer.stop)
+    if upstream_recorder is not None:
+        upstream_recorder.close()
 
 # More conservative cache configuration to avoid bans
 CACHE_TTL = 3600  # 1 hour (more conservative)
 BACKGROUND_REFRESH_INTERVAL = 3600  # 1 hour between background updates
-MAX_CONCURRENT_REQUESTS = 2  # Maximum 2 simultaneous requests to scraper
-REQUEST_DELAY = 5  # 5 seconds between requests to be respectful
+DAY_FETCH_CONCURRENCY = CacheConfig.DAY_FETCH_CONCURRENCY  # serviceDayData calls in flight per search
+MAX_BULK_STORE_IDS = 100  # Upper bound for /itv/servicios/bulk
+REFRESH_SLOTS = 10  # Minimum slots scraped per key (requests for fewer are sliced)
+MAX_REFRESH_SLOTS = 50  # Deepest scrape the refresher keeps up for a key, whatever n clients ask for
+MAX_STALE = CacheConfig.SLOT_CACHE_MAX_STALE  # Seconds past CACHE_TTL /itv/fechas still serves while revalidating
+REFRESH_TICK = 60  # Seconds between refresher passes (each pass only refreshes the keys that are due)
+
+def forget_key_state(key):
+    """Drop the day and month scrape state of a key that left slot_cache (evicted or idle)"""
+    store, _, service = key.partition(":")
+    day_state.invalidate(store, service)
+    month_cache.invalidate(store, service)
 
-# Semaphore to limit concurrent requests
-scraper_semaphore = threading.Semaphore(MAX_CONCURRENT_REQUESTS)
+# Available slots per 'store:service': bounded LRU, idle keys expire (SLOT_CACHE_* settings)
+slot_cache = SlotCache(ttl=CACHE_TTL, on_drop=forget_key_state)
+# Serializes read-diff-write in set_cached_slots so each new slot is notified once
+slots_cache_lock = threading.Lock()
+# Per-key due times (each key is refreshed BACKGROUND_REFRESH_INTERVAL after its last scrape)
+# and depths (the largest n requested in the last day, so refreshes keep serving it)
+refresh_schedule = RefreshSchedule(BACKGROUND_REFRESH_INTERVAL)
+# Periodic slot cache + schedule snapshots, reloaded at startup (SLOT_CACHE_SNAPSHOT_* settings)
+snapshot_writer = SnapshotWriter(slot_cache, refresh_schedule)
+
+# Concurrent scrapes of the same cache_key (requests and refresher) share one upstream scrape
+scrape_flight = SingleFlight()
+# Background revalidations started by stale /itv/fechas hits (referenced until they finish)
+revalidations = set()
+# Size of the last refresher pass that had keys due, exposed in /metrics
+last_refresh_cycle = {'keys': None, 'refreshed': None}
 
 # Health check endpoint
 @app.get("/")
@@ -69,7 +175,7 @@ def health_check():
         "status": "healthy",
         "service": "Citabot API",
         "version": "1.0.0",
-        "cache_entries": len(slots_cache)
+        "cache_entries": len(slot_cache)
     }
 
 @app.get("/health")
@@ -80,16 +186,15 @@ def detailed_health_check():
     stations_available = False
     
     try:
-        # Try to get stations to verify the scraper actually works
-        group_data = scraper.get_group_startup("", "1")
-        estaciones = scraper.extract_stations(group_data)
+        # Stations come from the shared catalog, refreshed from SitVal once per TTL
+        estaciones = station_catalog.all()
         stations_available = len(estaciones) > 0
         
         # Server is ready if we can get stations OR we have cache entries
-        server_ready = stations_available or len(slots_cache) > 0
+        server_ready = stations_available or len(slot_cache) > 0
         
     except Exception as e:
-        print(f"⚠️ Health check station test failed: {e}")
+        logger.warning("⚠️ Health check station test failed: %s", e)
         # Fallback: consider ready after 2 minutes if station test fails
         server_ready = time.time() > (startup_time + 120)
     
@@ -98,9 +203,12 @@ def detailed_health_check():
         "server_ready": server_ready,
         "stations_available": stations_available,
         "firebase_enabled": is_firebase_enabled(),
-        "cache_entries": len(slots_cache),
+        "cache_entries": len(slot_cache),
+        "station_catalog": station_catalog.status(),
+        "services_catalog": services_catalog.status(),
+        "upstream_breakers": upstream_breakers.status(),
         "services": {
-            "scraper": stations_available,  # Based on actual test
+            "scraper": stations_available and not upstream_breakers.any_open(),
             "notifications": is_firebase_enabled(),
             "cache": True
         },
@@ -115,31 +223,42 @@ def cache_key(store, service):
 def get_station_name(store_id):
     """Get the real station name from store_id"""
     try:
-        # Get stations data
-        group_data = scraper.get_group_startup("", "1")
-        estaciones = scraper.extract_stations(group_data)
-        
-        # Find the station with matching store_id
-        for estacion in estaciones:
-            if str(estacion.get('store_id')) == str(store_id):
-                provincia = estacion.get('provincia', '')
-                nombre = estacion.get('nombre', '')
-                tipo = estacion.get('tipo', '')
-                return f"{provincia} - {nombre} ({tipo})"
+        estacion = station_catalog.get(store_id)
+        if estacion:
+            provincia = estacion.get('provincia', '')
+            nombre = estacion.get('nombre', '')
+            tipo = estacion.get('tipo', '')
+            return f"{provincia} - {nombre} ({tipo})"
         
         # Fallback if not found
         return f"Estación {store_id}"
     except Exception as e:
-        print(f"Error getting station name for {store_id}: {e}")
+        logger.warning("Error getting station name for %s: %s", store_id, e)
         return f"Estación {store_id}"
 
-def get_cached_slots(store, service):
-    key = cache_key(store, service)
-    with slots_cache_lock:
-        entry = slots_cache.get(key)
-        if entry and (time.time() - entry['timestamp'] < CACHE_TTL):
-            return entry['data']
-    return None
+def get_cached_slots(store, service, max_stale=0, n=0):
+    """(slots, age in seconds) from the cache, or None.
+    
+    Entries past CACHE_TTL are still returned while they are at most
+    max_stale seconds past it (never more than MAX_STALE). Entries scraped
+    shallower than n slots (that are not the whole search window) are not returned.
+    """
+    entry = slot_cache.get(cache_key(store, service))
+    if entry is None:
+        metrics.SLOTS_CACHE_LOOKUPS.labels('miss').inc()
+        return None
+    if not entry.data.covers(n):
+        metrics.SLOTS_CACHE_LOOKUPS.labels('shallow').inc()
+        return None
+    age = max(0.0, time.time() - entry.timestamp)
+    if age < CACHE_TTL:
+        metrics.SLOTS_CACHE_LOOKUPS.labels('hit').inc()
+    elif age - CACHE_TTL <= min(max_stale, MAX_STALE):
+        metrics.SLOTS_CACHE_LOOKUPS.labels('stale').inc()
+    else:
+        metrics.SLOTS_CACHE_LOOKUPS.labels('expired').inc()
+        return None
+    return entry.data, age
 
 def detect_new_appointments_for_users(old_data, new_data, store, service):
     """Detects new appointments and determines which users should be notified"""
@@ -164,195 +283,255 @@ def detect_new_appointments_for_users(old_data, new_data, store, service):
             })
     
     if not interested_users:
-        print(f"No users interested in store {store}, service {service}")
+        logger.debug("No users interested in store %s, service %s", store, service)
         return []
     
-    print(f"Found {len(interested_users)} users interested in store {store}, service {service}")
+    logger.info("Found %s users interested in store %s, service %s", len(interested_users), store, service)
     
-    # Create current appointments set
-    current_appointments = set()
-    current_appointments_list = []
-    for item in new_data:
-        if isinstance(item, dict) and 'fecha' in item and 'hora' in item:
-            appointment_id = f"{item['fecha']}_{item['hora']}"
-            current_appointments.add(appointment_id)
-            current_appointments_list.append(appointment_id)
+    # Current appointments as packed integers; last_seen keeps the legacy "fecha_hora" ids
+    current_appointments = new_data.keys()
+    current_appointments_list = new_data.legacy_ids()
     
     # Check each user individually
     notifications_to_send = []
     estacion_nombre = None
     
     for user in interested_users:
-        user_last_seen = set(user['last_seen_appointments'])
+        user_last_seen = {parse_legacy_id(a) for a in user['last_seen_appointments']}
         user_new_appointments = current_appointments - user_last_seen
         
         if user_new_appointments:
             if estacion_nombre is None:
                 estacion_nombre = get_station_name(store)
             
-            print(f"User {user['user_id']} has {len(user_new_appointments)} new appointments")
+            logger.info("User %s has %s new appointments", user['user_id'], len(user_new_appointments))
             
-            # Find the EARLIEST new appointment for this user
-            earliest_appointment = None
-            earliest_datetime = None
-            
-            for item in new_data:
-                if isinstance(item, dict) and 'fecha' in item and 'hora' in item:
-                    appointment_id = f"{item['fecha']}_{item['hora']}"
-                    if appointment_id in user_new_appointments:
-                        try:
-                            # Parse date and time to find the earliest
-                            fecha_str = item['fecha']
-                            hora_str = item['hora']
-                            datetime_str = f"{fecha_str} {hora_str}"
-                            
-                            from datetime import datetime
-                            appointment_datetime = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M')
-                            
-                            if earliest_datetime is None or appointment_datetime < earliest_datetime:
-                                earliest_datetime = appointment_datetime
-                                earliest_appointment = {
-                                    'token': user['token'],
-                                    'user_id': user['user_id'],
-                                    'store_id': int(store),
-                                    'estacion_nombre': estacion_nombre,
-                                    'fecha': item['fecha'],
-                                    'hora': item['hora']
-                                }
-                        except Exception as e:
-                            print(f"Error parsing appointment datetime: {e}")
-                            continue
-            
-            # Only add the EARLIEST appointment for notification
-            if earliest_appointment:
-                print(f"Earliest new appointment for user {user['user_id']}: {earliest_appointment['fecha']} {earliest_appointment['hora']}")
-                notifications_to_send.append(earliest_appointment)
+            # Packed values sort chronologically: the smallest is the EARLIEST new appointment
+            fecha, hora = unpack_slot(min(user_new_appointments))
+            logger.info("Earliest new appointment for user %s: %s %s", user['user_id'], fecha, hora)
+            notifications_to_send.append({
+                'token': user['token'],
+                'user_id': user['user_id'],
+                'store_id': int(store),
+                'estacion_nombre': estacion_nombre,
+                'fecha': fecha,
+                'hora': hora
+            })
         
-        # Update user's last seen appointments
+        # Update user's last seen appointments (persisted once below, not per user)
         from notifier import update_user_last_seen_appointments
-        update_user_last_seen_appointments(user['token'], store, service, current_appointments_list)
+        update_user_last_seen_appointments(user['token'], store, service, current_appointments_list, save=False)
+    
+    from notifier import save_tokens_data
+    save_tokens_data()
     
     return notifications_to_send
 
 def set_cached_slots(store, service, data):
     key = cache_key(store, service)
     
-    with slots_cache_lock:
+    with tracing.span('set_cached_slots', key=key, slots=len(data)), \
+            tracing.traced_lock(slots_cache_lock, 'slots_cache'):
         # Check if there are new appointments for specific users
-        old_data = slots_cache.get(key, {}).get('data', [])
-        user_notifications = detect_new_appointments_for_users(old_data, data, store, service)
+        old_entry = slot_cache.peek(key)
+        old_data = old_entry.data if old_entry else None
+        with tracing.span('diff') as current:
+            user_notifications = detect_new_appointments_for_users(old_data, data, store, service)
+            current.set(notifications=len(user_notifications))
         
-        # Update cache
-        slots_cache[key] = {'data': data, 'timestamp': time.time()}
+        # Update cache, dated by the oldest day check the slots rely on (incremental scrapes reuse days)
+        slot_cache.set(key, data, timestamp=data.checked_at)
         
         # Send personalized notifications (only earliest appointment per user)
         if user_notifications:
-            print(f"Sending {len(user_notifications)} personalized notifications (earliest appointments only)")
-            for notification in user_notifications:
-                send_new_appointment_notification(
-                    notification['estacion_nombre'],
-                    notification['fecha'], 
-                    notification['hora'],
-                    specific_token=notification['token'],
-                    store_id=notification['store_id']
-                )
+            logger.info("Sending %s personalized notifications (earliest appointments only)", len(user_notifications))
+            with tracing.span('notify', notifications=len(user_notifications)):
+                for notification in user_notifications:
+                    send_new_appointment_notification(
+                        notification['estacion_nombre'],
+                        notification['fecha'], 
+                        notification['hora'],
+                        specific_token=notification['token'],
+                        store_id=notification['store_id']
+                    )
+
+def scrape_and_cache(store, service, max_slots=REFRESH_SLOTS, incremental=False):
+    """Scrapes a station/service and stores it in the cache (blocking).
+    
+    Call it through scrape_flight so concurrent callers share one scrape.
+    Upstream pacing is done per call by upstream_limiter.
+    """
+    data = scraper.get_next_available_slots(
+        store, service, "", max_slots, DAY_FETCH_CONCURRENCY, incremental=incremental
+    )
+    set_cached_slots(store, service, data)
+    return data
+
+async def scrape_and_cache_async(store, service, max_slots=REFRESH_SLOTS, use_month_cache=True, incremental=False):
+    """Async counterpart of scrape_and_cache, used by the request path"""
+    data = await async_scraper.get_next_available_slots(
+        store, service, "", max_slots, DAY_FETCH_CONCURRENCY,
+        use_month_cache=use_month_cache, incremental=incremental
+    )
+    # set_cached_slots may send notifications, keep it off the event loop
+    await run_in_threadpool(set_cached_slots, store, service, data)
+    return data
+
+def revalidate_in_background(store, service, max_slots=REFRESH_SLOTS):
+    """Re-scrape a stale key without making the caller wait (no-op if a scrape of it is already running)"""
+    key = cache_key(store, service)
+    if scrape_flight.in_flight(key):
+        return
+    
+    async def revalidate():
+        with tracing.span('revalidate', key=key):
+            await scrape_flight.do_async(key, scrape_and_cache_async, store, service, max_slots, incremental=True)
+    
+    task = asyncio.ensure_future(revalidate())
+    revalidations.add(task)
+    task.add_done_callback(finish_revalidation)
+
+def finish_revalidation(task):
+    revalidations.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background revalidation failed: %s", task.exception())
+
+def fechas_etag(slots, n):
+    """Validator of the first n slots (same slots, same ETag, even after a re-scrape)"""
+    return http_cache.etag('fechas', slots.head(n).to_bytes())
+
+def parse_max_stale(cache_control):
+    """Seconds of staleness a client accepts from Cache-Control: max-stale, capped at MAX_STALE.
+    
+    Absent, bare or unparsable max-stale means MAX_STALE: clients can only tighten the server's limit.
+    """
+    for directive in cache_control.split(","):
+        name, _, value = directive.strip().partition("=")
+        if name == "max-stale":
+            try:
+                return min(max(0, int(value.strip('" '))), MAX_STALE)
+            except ValueError:
+                break
+    return MAX_STALE
+
+def refresh_cache_cycle(stagger=False):
+    """One refresher pass: monitor users' favorite stations and refresh the cached keys that are due.
+    
+    With stagger=True (first pass after startup) keys already due are spread
+    over the next BACKGROUND_REFRESH_INTERVAL instead of refreshed in one burst.
+    Returns the number of keys refreshed successfully.
+    """
+    # Get all favorite stations from registered tokens
+    from notifier import registered_tokens
+    favorite_stations = set()
+    
+    for token_data in registered_tokens.values():
+        favoritos = token_data.get("favoritos", [])
+        if favoritos:
+            favorite_stations.update(favoritos)
+    
+    logger.debug("Found %s favorite stations from registered users: %s", len(favorite_stations), list(favorite_stations))
+    
+    # Add favorite stations to cache monitoring with common services
+    # Common service IDs for different vehicle types
+    common_services = ["227", "228", "229"]  # Turismo diesel, gasolina, eléctrico
+    
+    for station in favorite_stations:
+        for service in common_services:
+            # Favorites count as requested: they never expire as idle (new ones start empty and expired)
+            slot_cache.watch(cache_key(station, service), str(station), service)
+    
+    # Keys nobody requested (or favorited) within SLOT_CACHE_IDLE_TTL are dropped, not refreshed
+    slot_cache.expire_idle()
+    entries = slot_cache.entries()
+    refresh_schedule.prune(key for key, _ in entries)
+    
+    if stagger:
+        spread = refresh_schedule.stagger(entries)
+        if spread:
+            logger.info("⏱️ Spreading %s due cache refreshes over the next %s minutes",
+                        spread, BACKGROUND_REFRESH_INTERVAL // 60)
+    keys = refresh_schedule.due_keys(entries)
+    
+    if not keys:
+        logger.debug("No cache entries due for refresh")
+        return 0
+    
+    logger.info("Refreshing cache for %s station-service combinations...", len(keys))
+    refreshed = 0
+    started = time.monotonic()
+    
+    for i, key in enumerate(keys):
+        try:
+            store, service = key.split(":")
+            logger.debug("   Updating %s (%s/%s)", key, i+1, len(keys))
+            
+            # Joins a request-triggered scrape of the same key if one is running
+            depth = refresh_schedule.depth_for(key, REFRESH_SLOTS)
+            with tracing.span('refresh', key=key, depth=depth):
+                scrape_flight.do(key, scrape_and_cache, store, service, depth, incremental=True)
+            refreshed += 1
+            metrics.REFRESH_KEYS.labels('ok').inc()
+            
+        except Exception as e:
+            metrics.REFRESH_KEYS.labels('error').inc()
+            # Retry next interval rather than on every pass
+            refresh_schedule.defer(key, time.time() + BACKGROUND_REFRESH_INTERVAL)
+            logger.warning("   Error refreshing cache for %s: %s", key, e)
+    
+    metrics.REFRESH_CYCLE_DURATION.observe(time.monotonic() - started)
+    last_refresh_cycle['keys'] = len(keys)
+    last_refresh_cycle['refreshed'] = refreshed
+    logger.info("Cache refreshed completely")
+    return refreshed
 
 # Background thread to refresh cache periodically
 def background_cache_refresher():
     """Updates available appointments cache in background respectfully"""
+    first_pass = True
     while True:
         try:
-            # Get all favorite stations from registered tokens
-            from notifier import registered_tokens
-            favorite_stations = set()
-            
-            for token_data in registered_tokens.values():
-                favoritos = token_data.get("favoritos", [])
-                if favoritos:
-                    favorite_stations.update(favoritos)
-            
-            print(f"Found {len(favorite_stations)} favorite stations from registered users: {list(favorite_stations)}")
-            
-            # Add favorite stations to cache monitoring with common services
-            # Common service IDs for different vehicle types
-            common_services = ["227", "228", "229"]  # Turismo diesel, gasolina, eléctrico
-            
-            for station in favorite_stations:
-                for service in common_services:
-                    key = cache_key(station, service)
-                    if key not in slots_cache:
-                        print(f"Adding favorite station {station} service {service} to monitoring")
-                        # Initialize with empty data so it gets refreshed
-                        with slots_cache_lock:
-                            slots_cache[key] = {'data': [], 'timestamp': 0}
-            
-            # Refresh all keys that are now in cache
-            with slots_cache_lock:
-                keys = list(slots_cache.keys())
-            
-            if keys:
-                print(f"Refreshing cache for {len(keys)} station-service combinations...")
-                
-                for i, key in enumerate(keys):
-                    try:
-                        # Use semaphore to limit concurrent requests
-                        with scraper_semaphore:
-                            store, service = key.split(":")
-                            print(f"   Updating {key} ({i+1}/{len(keys)})")
-                            
-                            # Use empty instanceCode as it works perfectly
-                            data = scraper.get_next_available_slots(store, service, "", 10)
-                            set_cached_slots(store, service, data)
-                            
-                            # Delay between requests to be respectful
-                            if i < len(keys) - 1:  # No delay after the last one
-                                time.sleep(REQUEST_DELAY)
-                                
-                    except Exception as e:
-                        print(f"   Error refreshing cache for {key}: {e}")
-                
-                print("Cache refreshed completely")
-            else:
-                print("No cache entries to refresh")
-                
+            # Refresher calls yield to request-path scrapes waiting on upstream_limiter
+            with rate_limiter.background():
+                refresh_cache_cycle(stagger=first_pass)
+            first_pass = False
         except Exception as e:
-            print(f"Error in background_cache_refresher: {e}")
+            logger.error("Error in background_cache_refresher: %s", e)
         
-        # Wait for configured interval before next refresh
-        time.sleep(BACKGROUND_REFRESH_INTERVAL)
-
-threading.Thread(target=background_cache_refresher, daemon=True).start()
+        # Keys come due one by one (see refresh_schedule), check again shortly
+        time.sleep(min(REFRESH_TICK, BACKGROUND_REFRESH_INTERVAL))
 
 # Endpoint to get available services by station
 @app.get("/itv/servicios")
-def get_servicios(store_id: str):
-    """Gets available services for a specific ITV station"""
-    print(f"Getting services for station {store_id}...")
-    
-    # Use the new get_startup method
-    startup_data = scraper.get_startup("", store_id)
-    
-    categories = startup_data.get('categoriesServices', {})
-    print(f"[DEBUG] categoriesServices found: {len(categories)} categories")
-    
-    servicios = []
-    for cat_key, cat in categories.items():
-        cat_name = cat.get('name', 'Unknown')
-        services = cat.get('services', {})
-        
-        for serv_key, serv in services.items():
-            service_id = serv.get('id')
-            nombre = serv.get('name')
-            if nombre and service_id:
-                servicios.append({
-                    'nombre': nombre, 
-                    'service': service_id, 
-                    'categoria': cat_name
-                })
-    
-    print(f"[DEBUG] Extracted {len(servicios)} services for station {store_id}")
+def get_servicios(request: Request, response: Response, store_id: str):
+    """Gets available services for a specific ITV station (conditional: ETag, Last-Modified)"""
+    logger.debug("Getting services for station %s...", store_id)
+    
+    servicios = services_catalog.get(store_id)
+    validators = services_catalog.validators(store_id)
+    if validators is not None:
+        current = http_cache.etag('servicios', store_id, validators['version'])
+        not_modified = http_cache.validate(request, response, current,
+                                           validators['modified_at'], validators['expires_in'])
+        if not_modified is not None:
+            return not_modified
+    
+    logger.debug("Returning %s services for station %s", len(servicios), store_id)
     return {"servicios": servicios}
 
+# Endpoint to get services for several stations in one response
+@app.get("/itv/servicios/bulk")
+def get_servicios_bulk(store_ids: str):
+    """Gets available services for several stations (comma separated store_ids)"""
+    ids = list(dict.fromkeys(s.strip() for s in store_ids.split(",") if s.strip()))
+    if not ids:
+        return JSONResponse({"error": "store_ids is required"}, status_code=400)
+    if len(ids) > MAX_BULK_STORE_IDS:
+        return JSONResponse({"error": f"Maximum {MAX_BULK_STORE_IDS} store_ids per request"}, status_code=400)
+    
+    logger.debug("Getting services for %s stations...", len(ids))
+    return {"servicios": services_catalog.get_many(ids)}
+
 # Endpoint para registrar el token FCM
 @app.post("/register-token")
 async def register_token_endpoint(request: Request):
@@ -377,7 +556,7 @@ async def register_token_endpoint(request: Request):
         else:
             return JSONResponse({"error": "Invalid token format"}, status_code=400)
     except Exception as e:
-        print(f"Error registering token: {e}")
+        logger.error("Error registering token: %s", e)
         return JSONResponse({"error": "Failed to register token"}, status_code=500)
 
 # Endpoint para actualizar favoritos de un token
@@ -414,7 +593,7 @@ async def update_favorites_endpoint(request: Request):
             return JSONResponse({"error": "Token not found"}, status_code=404)
             
     except Exception as e:
-        print(f"Error updating favorites: {e}")
+        logger.error("Error updating favorites: %s", e)
         return JSONResponse({"error": "Failed to update favorites"}, status_code=500)
 
 @app.delete("/unregister-token")
@@ -445,7 +624,7 @@ async def unregister_token_endpoint(request: Request):
             }
             
     except Exception as e:
-        print(f"Error unregistering token: {e}")
+        logger.error("Error unregistering token: %s", e)
         return JSONResponse({"error": "Failed to unregister token"}, status_code=500)
 
 @app.delete("/clear-all-tokens")
@@ -463,30 +642,48 @@ def clear_all_tokens_endpoint():
         }
         
     except Exception as e:
-        print(f"Error clearing tokens: {e}")
+        logger.error("Error clearing tokens: %s", e)
         return {"error": "Failed to clear tokens"}, 500
 
 
 
 # Endpoint to get all real stations
 @app.get("/itv/estaciones")
-def get_estaciones():
-    """Gets all available ITV stations"""
-    print("Getting ITV stations list...")
+def get_estaciones(request: Request, response: Response, provincia: str = None):
+    """Gets all available ITV stations, optionally only those of one province (conditional: ETag, Last-Modified)"""
+    logger.debug("Getting ITV stations list...")
+    
+    if provincia:
+        estaciones = station_catalog.by_province(provincia)
+    else:
+        estaciones = station_catalog.all()
     
-    # Use store_id "1" to get all stations (any valid store_id works)
-    instance_code = ""
-    group_data = scraper.get_group_startup(instance_code, "1")
-    estaciones = scraper.extract_stations(group_data)
+    # The list almost never changes: clients revalidate with If-None-Match and usually get a 304
+    current = http_cache.etag('estaciones', station_catalog.version, provincia)
+    not_modified = http_cache.validate(request, response, current,
+                                       station_catalog.modified_at, station_catalog.expires_in())
+    if not_modified is not None:
+        return not_modified
     
-    print(f"Estaciones obtenidas: {len(estaciones)}")
+    logger.debug("Estaciones obtenidas: %s", len(estaciones))
     return {"estaciones": estaciones}
 
 # Endpoint to get upcoming real appointment dates and times (with cache)
 @app.get("/itv/fechas")
-async def get_fechas(request: Request, store: str, service: str, n: int = 3, force_refresh: bool = False):
-    """Gets next available appointments for a station and service. Permite forzar datos frescos si se solicita."""
-    print(f"Searching appointments for station {store}, service {service}")
+async def get_fechas(request: Request, response: Response, store: str, service: str,
+                     n: int = Query(3, ge=0), force_refresh: bool = False):
+    """Gets next available appointments for a station and service. Permite forzar datos frescos si se solicita.
+    
+    Entries up to MAX_STALE seconds past CACHE_TTL (or the client's
+    Cache-Control: max-stale) are served at once with an Age header and
+    refreshed in the background; older ones wait for a new scrape. Entries
+    scraped shallower than n are extended incrementally.
+    """
+    logger.debug("Searching appointments for station %s, service %s", store, service)
+    key = cache_key(store, service)
+    # Refreshes and scrapes of this key keep the deepest n asked for recently
+    refresh_schedule.note_depth(key, min(n, MAX_REFRESH_SLOTS))
+    depth = max(n, refresh_schedule.depth_for(key, REFRESH_SLOTS))
 
     # Detectar si el frontend pide forzar datos frescos
     force_fresh = force_refresh
@@ -495,21 +692,45 @@ async def get_fechas(request: Request, store: str, service: str, n: int = 3, for
         force_fresh = True
 
     if not force_fresh:
-        cached = get_cached_slots(store, service)
+        cached = get_cached_slots(store, service, parse_max_stale(cache_control), n)
         if cached:
-            print(f"Returning {len(cached[:n])} appointments from cache")
-            return {"fechas_horas": cached[:n]}
+            slots, age = cached
+            headers = {"Age": str(int(age))}
+            if age >= CACHE_TTL:
+                headers["Warning"] = '110 - "Response is Stale"'
+                revalidate_in_background(store, service, depth)
+            # max-age is the full TTL: clients subtract Age to get what is left of it
+            not_modified = http_cache.validate(request, response, fechas_etag(slots, n), time.time() - age, CACHE_TTL)
+            if not_modified is not None:
+                not_modified.headers.update(headers)
+                return not_modified
+            response.headers.update(headers)
+            fechas_horas = slots.to_dicts(n)
+            logger.debug("Returning %s appointments from cache (age %ss)", len(fechas_horas), int(age))
+            return {"fechas_horas": fechas_horas}
 
     # Si se fuerza datos frescos o no hay cache
-    print(f"Getting fresh data (force_fresh={force_fresh})...")
+    logger.debug("Getting fresh data (force_fresh=%s)...", force_fresh)
     try:
-        with scraper_semaphore:
-            fechas_horas = scraper.get_next_available_slots(store, service, "", n)
-            set_cached_slots(store, service, fechas_horas)
-            print(f"Got {len(fechas_horas)} new appointments")
-            return {"fechas_horas": fechas_horas}
+        # Concurrent misses for the same key wait on one scrape. Unless fresh data is forced,
+        # days already fetched for this key are reused, so a deeper n only fetches the extra days
+        with tracing.span('fechas', key=key, depth=depth, force_fresh=force_fresh):
+            slots = await scrape_flight.do_async(
+                key, scrape_and_cache_async, store, service, depth,
+                use_month_cache=not force_fresh, incremental=not force_fresh
+            )
+            if slots.depth is not None and not slots.covers(n):
+                # Joined a shallower scrape that was already in flight: extend it
+                slots = await scrape_flight.do_async(
+                    key, scrape_and_cache_async, store, service, depth, incremental=True
+                )
+        logger.info("Got %s new appointments", len(slots))
+        not_modified = http_cache.validate(request, response, fechas_etag(slots, n), time.time(), CACHE_TTL)
+        if not_modified is not None:
+            return not_modified
+        return {"fechas_horas": slots.to_dicts(n)}
     except Exception as e:
-        print(f"Error getting appointments: {e}")
+        logger.error("Error getting appointments: %s", e)
         return {"fechas_horas": []}
 
 # Endpoint para actualizar favoritos de un usuario
@@ -537,7 +758,7 @@ async def update_favorites_endpoint(request: Request):
             return JSONResponse({"error": "Token not found"}, status_code=404)
             
     except Exception as e:
-        print(f"Error updating favorites: {e}")
+        logger.error("Error updating favorites: %s", e)
         return JSONResponse({"error": "Failed to update favorites"}, status_code=500)
 
 # Endpoint para estadísticas de notificaciones
@@ -564,7 +785,7 @@ def get_notification_stats():
         "firebase_enabled": firebase_enabled,
         "cache_ttl": CACHE_TTL,
         "background_refresh_interval": BACKGROUND_REFRESH_INTERVAL,
-        "cache_entries": len(slots_cache),
+        "cache_entries": len(slot_cache),
         "status": "active" if firebase_enabled else "disabled"
     }
 
@@ -596,7 +817,7 @@ async def test_notification(request: Request):
             return JSONResponse({"error": "Failed to send notification"}, status_code=500)
             
     except Exception as e:
-        print(f"Error sending test notification: {e}")
+        logger.error("Error sending test notification: %s", e)
         return JSONResponse({"error": "Failed to send test notification"}, status_code=500)
 
 # Endpoint para enviar notificación de prueba automática
@@ -621,7 +842,7 @@ async def test_notification_auto():
                 if success:
                     sent_count += 1
             except Exception as e:
-                print(f"Error sending test to {token[:20]}...: {e}")
+                logger.warning("Error sending test to %s...: %s", token[:20], e)
         
         return {
             "message": f"Test notifications sent to {sent_count} devices",
@@ -630,7 +851,7 @@ async def test_notification_auto():
         }
         
     except Exception as e:
-        print(f"Error in auto test: {e}")
+        logger.error("Error in auto test: %s", e)
         return JSONResponse({"error": "Failed to send test notifications"}, status_code=500)
 
 # Endpoint para forzar actualización de favoritos
@@ -649,7 +870,7 @@ async def force_refresh_favorites():
         if not favorite_stations:
             return {"message": "No favorite stations found", "refreshed": 0}
         
-        print(f"Force refreshing {len(favorite_stations)} favorite stations...")
+        logger.info("Force refreshing %s favorite stations...", len(favorite_stations))
         
         # Common service IDs for different vehicle types
         common_services = ["227", "228", "229"]
@@ -658,13 +879,15 @@ async def force_refresh_favorites():
         for station in favorite_stations:
             for service in common_services:
                 try:
-                    print(f"Force refreshing station {station}, service {service}")
-                    data = scraper.get_next_available_slots(station, service, "", 10)
-                    set_cached_slots(station, service, data)
+                    logger.debug("Force refreshing station %s, service %s", station, service)
+                    key = cache_key(station, service)
+                    await scrape_flight.do_async(
+                        key, run_in_threadpool, scrape_and_cache,
+                        station, service, refresh_schedule.depth_for(key, REFRESH_SLOTS)
+                    )
                     refreshed_count += 1
-                    time.sleep(2)  # Small delay to be respectful
                 except Exception as e:
-                    print(f"Error refreshing {station}:{service}: {e}")
+                    logger.warning("Error refreshing %s:%s: %s", station, service, e)
         
         return {
             "message": f"Force refresh completed",
@@ -673,7 +896,7 @@ async def force_refresh_favorites():
         }
         
     except Exception as e:
-        print(f"Error in force refresh: {e}")
+        logger.error("Error in force refresh: %s", e)
         return JSONResponse({"error": "Failed to force refresh"}, status_code=500)
 
 # Endpoint para limpiar historial de citas vistas (útil para testing)
@@ -707,7 +930,7 @@ async def clear_user_history(request: Request):
         }
         
     except Exception as e:
-        print(f"Error clearing user history: {e}")
+        logger.error("Error clearing user history: %s", e)
         return JSONResponse({"error": "Failed to clear user history"}, status_code=500)
 
 # Endpoint para limpiar historial de un usuario por user_id
@@ -740,38 +963,81 @@ async def clear_history_by_user(request: Request):
         }
         
     except Exception as e:
-        print(f"Error clearing user history by user_id: {e}")
+        logger.error("Error clearing user history by user_id: %s", e)
         return JSONResponse({"error": "Failed to clear user history"}, status_code=500)
 
 
 
+# Live values read when /metrics is scraped
+metrics.REGISTRY.gauge('citabot_slots_cache_entries', 'Keys in the slots cache', lambda: len(slot_cache))
+metrics.REGISTRY.gauge('citabot_refresh_cycle_keys', 'Keys in the last refresh cycle', lambda: last_refresh_cycle['keys'])
+metrics.REGISTRY.gauge('citabot_upstream_rate_limit_rate', 'Current upstream rate limit (requests/second)',
+                       lambda: upstream_limiter.rate)
+metrics.REGISTRY.gauge('citabot_upstream_circuit_open', '1 while the endpoint circuit breaker is open',
+                       lambda: {(name, ): int(state['state'] == 'open')
+                                for name, state in upstream_breakers.status().items()},
+                       ('module',))
+metrics.REGISTRY.gauge('citabot_upstream_in_flight', 'SitVal requests in flight by scraper',
+                       lambda: {('blocking', ): scraper.pool_stats()['in_flight'],
+                                ('async', ): async_scraper.pool_stats()['in_flight']},
+                       ('scraper',))
+metrics.REGISTRY.gauge('citabot_http_pool_idle_connections', 'Idle keep-alive connections to SitVal by scraper',
+                       lambda: {('blocking', ): scraper.pool_stats()['idle_connections'],
+                                ('async', ): async_scraper.pool_stats()['idle_connections']},
+                       ('scraper',))
+metrics.REGISTRY.gauge('citabot_notification_tokens', 'Registered device tokens', get_registered_tokens_count)
+metrics.REGISTRY.gauge('citabot_log_records_suppressed', 'Log records dropped by the rate limit', suppressed_count)
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Counters, histograms and gauges in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Endpoint to monitor cache status
 @app.get("/cache/status")
 def get_cache_status():
     """Returns information about cache status"""
-    with slots_cache_lock:
-        cache_info = []
-        current_time = time.time()
+    cache_info = []
+    current_time = time.time()
+    
+    for key, entry in slot_cache.entries():
+        age_seconds = current_time - entry.timestamp
+        age_minutes = age_seconds / 60
+        is_expired = age_seconds > CACHE_TTL
         
-        for key, entry in slots_cache.items():
-            age_seconds = current_time - entry['timestamp']
-            age_minutes = age_seconds / 60
-            is_expired = age_seconds > CACHE_TTL
-            
-            cache_info.append({
-                'key': key,
-                'entries': len(entry['data']),
-                'age_minutes': round(age_minutes, 1),
-                'is_expired': is_expired,
-                'last_updated': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['timestamp']))
-            })
+        cache_info.append({
+            'key': key,
+            'entries': len(entry.data),
+            'scrape_depth': entry.data.depth,
+            'refresh_depth': refresh_schedule.depth_for(key, REFRESH_SLOTS),
+            'age_minutes': round(age_minutes, 1),
+            'is_expired': is_expired,
+            'last_updated': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.timestamp)),
+            'last_requested': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.last_access)),
+            'next_refresh': time.strftime('%Y-%m-%d %H:%M:%S',
+                                          time.localtime(max(refresh_schedule.due_at(key, entry), current_time)))
+        })
     
     return {
-        'total_entries': len(slots_cache),
+        'total_entries': len(cache_info),
         'cache_ttl_minutes': CACHE_TTL / 60,
         'refresh_interval_minutes': BACKGROUND_REFRESH_INTERVAL / 60,
-        'max_concurrent_requests': MAX_CONCURRENT_REQUESTS,
-        'request_delay_seconds': REQUEST_DELAY,
+        'slot_cache': slot_cache.status(),
+        'slot_cache_snapshot': snapshot_writer.status(),
+        'rate_limiter': upstream_limiter.status(),
+        'http_pool': async_scraper.pool_stats(),
+        'http_pool_blocking': scraper.pool_stats(),
+        'day_fetch_concurrency': DAY_FETCH_CONCURRENCY,
+        'month_cache': month_cache.status(),
+        'day_state': day_state.status(),
+        'scrape_flights': scrape_flight.status(),
+        'revalidations_in_flight': len(revalidations),
+        'max_stale_minutes': MAX_STALE / 60,
+        'upstream_capture': upstream_recorder.status() if upstream_recorder else None,
+        'upstream_replay': upstream_replay.status() if upstream_replay else None,
+        'tracing': tracing.status(),
+        'response_compression': compressed_bodies.status(),
         'entries': cache_info
     }
 
@@ -780,75 +1046,97 @@ def get_cache_status():
 def clear_cache():
     """Clears all cache"""
     with slots_cache_lock:
-        cleared_entries = len(slots_cache)
-        slots_cache.clear()
+        cleared_entries = slot_cache.clear()
+    month_cache.invalidate()
+    day_state.invalidate()
     
     return {
         "message": f"Cache cleared. {cleared_entries} entries removed."
     }
 
-# Debug endpoint to see raw scraper data
-@app.get("/debug/fechas")
-def debug_fechas(store: str, service: str):
-    """Debug endpoint to see raw scraper response"""
-    try:
-        print(f"DEBUG: Getting raw data for store={store}, service={service}")
-        
-        # Get fresh data without cache
-        with scraper_semaphore:
-            # Get instanceCode
-            instance_code = scraper.get_instance_code_robust(store)
-            print(f"DEBUG: instanceCode = {instance_code}")
-            
-            # Get month data
-            import datetime
-            today = datetime.date.today()
-            month_data = scraper.get_service_month_data(store, service, instance_code, today.strftime('%Y-%m-%d'))
-            print(f"DEBUG: month_data keys = {list(month_data.keys())}")
-            
-            open_days = month_data.get('get_open_days', {})
-            print(f"DEBUG: open_days = {open_days}")
-            
-            # Get first available day
-            valid_days = scraper._filter_valid_days(open_days)
-            print(f"DEBUG: valid_days = {valid_days}")
-            
-            if valid_days:
-                first_day = valid_days[0]
-                print(f"DEBUG: Checking day {first_day}")
-                
-                # Get day data
-                day_data = scraper.get_service_day_data(store, service, instance_code, first_day)
-                print(f"DEBUG: day_data keys = {list(day_data.keys())}")
-                
-                day_slots = day_data.get('get_day_slots', {})
-                print(f"DEBUG: day_slots = {day_slots}")
-                
-                valid_hours = scraper._extract_valid_hours(day_slots)
-                print(f"DEBUG: valid_hours = {valid_hours}")
-                
-                return {
-                    "store": store,
-                    "service": service,
-                    "instance_code": instance_code,
-                    "first_day": first_day,
-                    "raw_day_slots": day_slots,
-                    "extracted_hours": valid_hours,
-                    "month_data_keys": list(month_data.keys()),
-                    "day_data_keys": list(day_data.keys())
-                }
-            else:
-                return {
-                    "store": store,
-                    "service": service,
-                    "error": "No valid days found",
-                    "raw_open_days": open_days
-                }
-                
-    except Exception as e:
-        return {
-            "error": str(e),
-            "store": store,
-            "service": service
-        }
+# Recent scrape/refresh traces (the slowest step of a slow refresh shows up here)
+@app.get("/debug/traces")
+def debug_traces(limit: int = 20, min_duration_ms: float = 0, name: str = None, format: str = "json"):
+    """Last traces, newest first; format=text renders a waterfall per trace"""
+    traces = tracing.recent(limit, min_duration_ms, name)
+    if format == "text":
+        return PlainTextResponse("\n\n".join(tracing.render_text(trace) for trace in traces) + "\n")
+    return {"tracing": tracing.status(), "traces": traces}
+
+@app.get("/debug/traces/{trace_id}")
+def debug_trace(trace_id: str, format: str = "json"):
+    """One trace by id"""
+    trace = tracing.get(trace_id)
+    if trace is None:
+        return JSONResponse({"error": "Trace not found"}, status_code=404)
+    if format == "text":
+        return PlainTextResponse(tracing.render_text(trace) + "\n")
+    return trace
+
+def admin_denied(request: Request):
+    """Error response if the request may not use /admin endpoints, None if it may"""
+    if not CacheConfig.ADMIN_TOKEN:
+        return JSONResponse({"error": "Admin endpoints are disabled (set ADMIN_TOKEN)"}, status_code=403)
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {CacheConfig.ADMIN_TOKEN}".encode()):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return None
+
+# Sampling profiler: start a bounded window, then download the collapsed stacks
+@app.post("/admin/profile/start")
+def start_profile(request: Request, seconds: float = 30, interval_ms: float = 10):
+    """Samples all threads (API, background_cache_refresher, day fetch pool) for up to `seconds`"""
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    if not profiler.start(seconds, interval_ms / 1000):
+        return JSONResponse({"error": "Profiler already running", "profile": profiler.status()}, status_code=409)
+    return profiler.status()
 
+@app.post("/admin/profile/stop")
+def stop_profile(request: Request):
+    """Ends the window early and returns the collapsed stacks"""
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    return PlainTextResponse(profiler.stop(), headers={"Content-Disposition": 'attachment; filename="citabot.collapsed"'})
+
+@app.get("/admin/profile")
+def get_profile(request: Request):
+    """Collapsed stacks of the current or last window (flamegraph.pl / speedscope input)"""
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    return PlainTextResponse(profiler.collapsed(), headers={"Content-Disposition": 'attachment; filename="citabot.collapsed"'})
+
+@app.get("/admin/profile/status")
+def get_profile_status(request: Request):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    return profiler.status()
+
+# tracemalloc: start tracing, then take snapshots of the top allocators
+@app.post("/admin/memory/start")
+def start_memory_tracing(request: Request, frames: int = 1):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    return {"started": profiling.tracemalloc_start(frames)}
+
+@app.post("/admin/memory/stop")
+def stop_memory_tracing(request: Request):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    return {"stopped": profiling.tracemalloc_stop()}
+
+@app.get("/admin/memory/snapshot")
+def memory_snapshot(request: Request, top: int = 15):
+    """Top allocating lines, and who allocated what is held in slot_cache and registered_tokens"""
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    from notifier import registered_tokens
+    cache = dict(slot_cache.entries())
+    return profiling.memory_report({'slot_cache': cache, 'registered_tokens': dict(registered_tokens)}, top)
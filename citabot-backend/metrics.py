@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Métricas en formato de texto de Prometheus para GET /metrics.
+
+Registro mínimo sin dependencias: contadores, histogramas y gauges calculados
+al vuelo (callbacks que leen el estado actual de limitador, pools, caché...).
+Los contadores e histogramas son seguros entre hilos y corrutinas. La API
+imita a prometheus_client (labels(...).inc() / observe()) para que cambiar
+a esa librería sea trivial si algún día hace falta.
+"""
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets (seconds) for HTTP round-trips and request handling
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Refresh cycles take minutes when the limiter is conservative
+CYCLE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """Child for one combination of label values (created on first use)"""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonic counter; the exposed name gets the _total suffix"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in sorted(self._children.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from a callback.
+
+    The callback returns a number, or a dict of label values tuple -> number
+    for labelled gauges. Errors in a callback only blank that gauge.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        if self.callback is None:
+            return []
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{_format_labels(self.labelnames, tuple(str(v) for v in key))} {_format_value(v)}"
+                for key, v in sorted(value.items()) if v is not None]
+
+
+class Registry:
+    """Ordered set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], object],
+              labelnames: Iterable[str] = ()) -> Gauge:
+        """Register a callback gauge, replacing any previous one with the same name"""
+        with self._lock:
+            self._metrics.pop(name, None)
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# Upstream (SitVal) traffic, by AJAX module ('page' for plain page loads)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'citabot_upstream_requests', 'SitVal HTTP requests by module and status (error = no response)',
+    ('module', 'status'))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'citabot_upstream_request_duration_seconds', 'SitVal HTTP round-trip time', ('module',))
+UPSTREAM_WAIT = REGISTRY.histogram(
+    'citabot_upstream_rate_limit_wait_seconds', 'Time spent waiting for an upstream rate limiter token')
+
+# Slot cache
+SLOTS_CACHE_LOOKUPS = REGISTRY.counter(
+    'citabot_slots_cache_lookups',
+    'get_cached_slots lookups by result (hit, stale = served while revalidating, expired, shallow, miss)',
+    ('result',))
+
+# Background refresher
+REFRESH_CYCLE_DURATION = REGISTRY.histogram(
+    'citabot_refresh_cycle_duration_seconds', 'Duration of a background refresh cycle', buckets=CYCLE_BUCKETS)
+REFRESH_KEYS = REGISTRY.counter(
+    'citabot_refresh_keys', 'Keys processed by refresh cycles by result (ok, error)', ('result',))
+
+# API
+HTTP_LATENCY = REGISTRY.histogram(
+    'citabot_http_request_duration_seconds', 'API request latency by route template',
+    ('method', 'route', 'status'))
+
+# Push notifications
+NOTIFICATIONS = REGISTRY.counter(
+    'citabot_notifications', 'Push notification sends by result (sent, failed)', ('result',))
+TOKENS_PRUNED = REGISTRY.counter(
+    'citabot_notification_tokens_pruned', 'Device tokens removed after FCM reported them invalid')
+
+
+def render() -> str:
+    """Text exposition of every registered metric"""
+    return REGISTRY.render()
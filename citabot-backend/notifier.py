@@ -1,6 +1,11 @@
 import os
 import json
 
+import metrics
+from log_config import get_logger
+
+logger = get_logger('notifier')
+
 # Firebase es opcional - solo se inicializa si el archivo de credenciales existe
 firebase_app = None
 messaging = None
@@ -21,26 +26,26 @@ def load_tokens_data():
         if os.path.exists(TOKENS_DATA_FILE):
             with open(TOKENS_DATA_FILE, 'r', encoding='utf-8') as f:
                 registered_tokens = json.load(f)
-                print(f"📂 Loaded {len(registered_tokens)} tokens from local file")
+                logger.info("📂 Loaded %s tokens from local file", len(registered_tokens))
                 return
     except Exception as e:
-        print(f"❌ Error loading tokens from file: {e}")
+        logger.error("❌ Error loading tokens from file: %s", e)
     
     # Si no hay archivo, intentar cargar desde variable de entorno
     try:
         tokens_backup = os.getenv("TOKENS_BACKUP")
         if tokens_backup:
             registered_tokens = json.loads(tokens_backup)
-            print(f"🔄 Loaded {len(registered_tokens)} tokens from environment backup")
+            logger.info("🔄 Loaded %s tokens from environment backup", len(registered_tokens))
             # Guardar inmediatamente en archivo local
             save_tokens_data()
             return
     except Exception as e:
-        print(f"❌ Error loading tokens from environment: {e}")
+        logger.error("❌ Error loading tokens from environment: %s", e)
     
     # Si nada funciona, empezar con diccionario vacío
     registered_tokens = {}
-    print("🆕 Starting with empty tokens registry")
+    logger.info("🆕 Starting with empty tokens registry")
 
 def save_tokens_data():
     """
@@ -50,10 +55,10 @@ def save_tokens_data():
     try:
         with open(TOKENS_DATA_FILE, 'w', encoding='utf-8') as f:
             json.dump(registered_tokens, f, ensure_ascii=False, indent=2)
-        print(f"💾 Saved {len(registered_tokens)} tokens to local storage")
+        logger.debug("💾 Saved %s tokens to local storage", len(registered_tokens))
         return True
     except Exception as e:
-        print(f"❌ Error saving tokens data: {e}")
+        logger.error("❌ Error saving tokens data: %s", e)
         return False
 
 # Cargar tokens al iniciar
@@ -68,18 +73,18 @@ try:
         cred = credentials.Certificate(firebase_config)
         firebase_app = firebase_admin.initialize_app(cred)
         messaging = fb_messaging
-        print("Firebase initialized successfully from FIREBASE_CONFIG environment variable")
+        logger.info("Firebase initialized successfully from FIREBASE_CONFIG environment variable")
     elif os.path.exists("firebase-service-account.json"):
         import firebase_admin
         from firebase_admin import credentials, messaging as fb_messaging
         cred = credentials.Certificate("firebase-service-account.json")
         firebase_app = firebase_admin.initialize_app(cred)
         messaging = fb_messaging
-        print("Firebase initialized successfully from JSON file")
+        logger.info("Firebase initialized successfully from JSON file")
     else:
-        print("Firebase service account not found - notifications disabled")
+        logger.warning("Firebase service account not found - notifications disabled")
 except Exception as e:
-    print(f"Firebase initialization failed: {e}")
+    logger.error("Firebase initialization failed: %s", e)
 
 def register_device_token(token, user_id=None, favoritos=None):
     """
@@ -99,7 +104,7 @@ def register_device_token(token, user_id=None, favoritos=None):
                 normalized = []
             registered_tokens[token]["favoritos"] = normalized
         save_tokens_data()
-        print(f"Device token registered: {token[:20]}... user_id={user_id} favoritos={favoritos}")
+        logger.info("Device token registered: %s... user_id=%s favoritos=%s", token[:20], user_id, favoritos)
         return True
     return False
 
@@ -114,19 +119,21 @@ def update_user_favorites(token, favoritos):
             normalized = []
         registered_tokens[token]["favoritos"] = normalized
         save_tokens_data()
-        print(f"Updated favorites for token {token[:20]}...: {favoritos}")
+        logger.info("Updated favorites for token %s...: %s", token[:20], favoritos)
         return True
     return False
 
-def update_user_last_seen_appointments(token, store, service, appointments_list):
+def update_user_last_seen_appointments(token, store, service, appointments_list, save=True):
     """
     Actualiza las últimas citas vistas por un usuario para una estación/servicio específico.
+    Con save=False no se persiste; quien actualiza muchos usuarios llama a save_tokens_data() una vez al final.
     """
     if token in registered_tokens:
         key = f"last_seen_{store}_{service}"
         registered_tokens[token][key] = appointments_list
-        save_tokens_data()
-        print(f"Updated last seen appointments for token {token[:20]}... store {store} service {service}: {len(appointments_list)} appointments")
+        if save:
+            save_tokens_data()
+        logger.debug("Updated last seen appointments for token %s... store %s service %s: %s appointments", token[:20], store, service, len(appointments_list))
         return True
     return False
 
@@ -136,7 +143,7 @@ def send_notification_to_all(title, message, data=None):
     Usar solo para pruebas o casos especiales.
     """
     if not messaging or not firebase_app or not registered_tokens:
-        print(f"Notification would be sent to {len(registered_tokens)} devices: {title} - {message}")
+        logger.info("Notification would be sent to %s devices: %s - %s", len(registered_tokens), title, message)
         return
     successful_sends = 0
     failed_tokens = []
@@ -152,16 +159,19 @@ def send_notification_to_all(title, message, data=None):
             )
             response = messaging.send(notification_msg)
             successful_sends += 1
-            print(f"Notification sent successfully to {token[:20]}...: {response}")
+            metrics.NOTIFICATIONS.labels('sent').inc()
+            logger.debug("Notification sent successfully to %s...: %s", token[:20], response)
         except Exception as e:
-            print(f"Error sending notification to {token[:20]}...: {e}")
+            metrics.NOTIFICATIONS.labels('failed').inc()
+            logger.warning("Error sending notification to %s...: %s", token[:20], e)
             if "invalid" in str(e).lower() or "not-registered" in str(e).lower():
                 failed_tokens.append(token)
     for token in failed_tokens:
         registered_tokens.pop(token, None)
-        print(f"Removed invalid token: {token[:20]}...")
+        metrics.TOKENS_PRUNED.inc()
+        logger.info("Removed invalid token: %s...", token[:20])
     save_tokens_data()
-    print(f"Notifications sent: {successful_sends}/{len(registered_tokens) + len(failed_tokens)}")
+    logger.info("Notifications sent: %s/%s", successful_sends, len(registered_tokens) + len(failed_tokens))
 
 def send_notification_to_favorites(title, message, data, estacion):
     """
@@ -169,7 +179,7 @@ def send_notification_to_favorites(title, message, data, estacion):
     Solo los tokens cuyo array de favoritos contiene la estación recibirán la notificación.
     """
     if not messaging or not firebase_app or not registered_tokens:
-        print(f"Notification would be sent to {len(registered_tokens)} devices: {title} - {message}")
+        logger.info("Notification would be sent to %s devices: %s - %s", len(registered_tokens), title, message)
         return
     successful_sends = 0
     failed_tokens = []
@@ -194,16 +204,19 @@ def send_notification_to_favorites(title, message, data, estacion):
                 )
                 response = messaging.send(notification_msg)
                 successful_sends += 1
-                print(f"Notification sent successfully to {token[:20]}...: {response}")
+                metrics.NOTIFICATIONS.labels('sent').inc()
+                logger.debug("Notification sent successfully to %s...: %s", token[:20], response)
             except Exception as e:
-                print(f"Error sending notification to {token[:20]}...: {e}")
+                metrics.NOTIFICATIONS.labels('failed').inc()
+                logger.warning("Error sending notification to %s...: %s", token[:20], e)
                 if "invalid" in str(e).lower() or "not-registered" in str(e).lower():
                     failed_tokens.append(token)
     for token in failed_tokens:
         registered_tokens.pop(token, None)
-        print(f"Removed invalid token: {token[:20]}...")
+        metrics.TOKENS_PRUNED.inc()
+        logger.info("Removed invalid token: %s...", token[:20])
     save_tokens_data()
-    print(f"Notifications sent to favorites: {successful_sends}")
+    logger.info("Notifications sent to favorites: %s", successful_sends)
 
 def send_new_appointment_notification(estacion_nombre, fecha, hora, specific_token=None, store_id=None):
     """
@@ -222,19 +235,19 @@ def send_new_appointment_notification(estacion_nombre, fecha, hora, specific_tok
     }
     
     if specific_token:
-        print(f"🔔 Sending personalized notification to {specific_token[:20]}...: {title} - {message}")
+        logger.info("🔔 Sending personalized notification to %s...: %s - %s", specific_token[:20], title, message)
         return send_notification_to_token(title, message, data, specific_token)
     elif store_id:
-        print(f"🔔 Sending notification to all users with favorite station {store_id}: {title} - {message}")
+        logger.info("🔔 Sending notification to all users with favorite station %s: %s - %s", store_id, title, message)
         # Usar el ID numérico de la estación para filtrar favoritos
         send_notification_to_favorites(title, message, data, store_id)
     else:
-        print(f"⚠️ No store_id provided for notification: {estacion_nombre}")
+        logger.warning("⚠️ No store_id provided for notification: %s", estacion_nombre)
 
 def send_notification_to_token(title, message, data, token):
     """Envía notificación push a un token específico"""
     if not messaging or not firebase_app:
-        print(f"Test notification would be sent to {token[:20]}...: {title} - {message}")
+        logger.info("Test notification would be sent to %s...: %s - %s", token[:20], title, message)
         return True
     try:
         notification_msg = messaging.Message(
@@ -246,10 +259,12 @@ def send_notification_to_token(title, message, data, token):
             token=token
         )
         response = messaging.send(notification_msg)
-        print(f"Test notification sent successfully to {token[:20]}...: {response}")
+        metrics.NOTIFICATIONS.labels('sent').inc()
+        logger.info("Test notification sent successfully to %s...: %s", token[:20], response)
         return True
     except Exception as e:
-        print(f"Error sending test notification to {token[:20]}...: {e}")
+        metrics.NOTIFICATIONS.labels('failed').inc()
+        logger.warning("Error sending test notification to %s...: %s", token[:20], e)
         return False
 
 def get_registered_tokens_count():
@@ -261,10 +276,10 @@ def unregister_device_token(token):
     if token in registered_tokens:
         registered_tokens.pop(token)
         save_tokens_data()
-        print(f"Device token unregistered: {token[:20]}...")
+        logger.info("Device token unregistered: %s...", token[:20])
         return True
     else:
-        print(f"Token not found for unregistration: {token[:20]}...")
+        logger.info("Token not found for unregistration: %s...", token[:20])
         return False
 
 def clear_all_tokens():
@@ -272,7 +287,7 @@ def clear_all_tokens():
     count = len(registered_tokens)
     registered_tokens.clear()
     save_tokens_data()
-    print(f"Cleared {count} registered tokens")
+    logger.info("Cleared %s registered tokens", count)
     return count
 
 def get_all_tokens():
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Perfilado bajo demanda del proceso en producción.
+
+SamplingProfiler muestrea las pilas de todos los hilos (peticiones,
+background_cache_refresher, pool de días...) durante una ventana acotada y
+devuelve el resultado en formato "collapsed stack" (una línea por pila con su
+número de muestras), que entienden flamegraph.pl, speedscope e inferno. Es un
+perfil de tiempo de reloj: los hilos que esperan también aparecen.
+
+memory_report() resume un snapshot de tracemalloc y atribuye la memoria de
+contenedores concretos (slot_cache, registered_tokens) al código que asignó
+cada objeto.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Optional
+
+from cache_config import CacheConfig
+from log_config import get_logger
+
+logger = get_logger('profiling')
+
+_UNTRACED = '<allocated before tracemalloc started>'
+_ROOT = '<container itself>'
+
+
+def _site(traceback) -> str:
+    """'file:line' of the most recent frame of an allocation traceback"""
+    if traceback is _ROOT:
+        return _ROOT
+    if not traceback:
+        return _UNTRACED
+    frame = traceback[-1]
+    return f"{_short_path(frame.filename)}:{frame.lineno}"
+
+
+def _short_path(path: str) -> str:
+    marker = 'site-packages' + os.sep
+    index = path.rfind(marker)
+    if index >= 0:
+        return path[index + len(marker):]
+    return os.path.basename(path)
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval for a bounded window"""
+
+    def __init__(self, max_seconds: float = None):
+        self.max_seconds = CacheConfig.PROFILE_MAX_SECONDS if max_seconds is None else max_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: collections.Counter = collections.Counter()
+        self._labels: Dict[Any, str] = {}
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.seconds = 0.0
+        self.interval = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float = 30.0, interval: float = 0.01) -> bool:
+        """Start a new window (previous results are discarded); False if one is running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.seconds = max(0.1, min(seconds, self.max_seconds))
+            self.interval = max(0.001, interval)
+            self._stacks = collections.Counter()
+            self.samples = 0
+            self.started_at, self.finished_at = time.time(), None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info("🔬 Sampling profiler started for %.0fs every %.1f ms", self.seconds, self.interval * 1000)
+        return True
+
+    def stop(self) -> str:
+        """End the window early (no-op if finished) and return the collapsed stacks"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self.collapsed()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    stack.reverse()
+                    self._stacks[';'.join(stack)] += 1
+                self.samples += 1
+                self._stop.wait(self.interval)
+        finally:
+            self.finished_at = time.time()
+            logger.info("🔬 Sampling profiler finished: %s samples", self.samples)
+
+    def collapsed(self) -> str:
+        """'frame;frame;frame count' lines, root (thread name) first"""
+        stacks = list(self._stacks.items())
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'samples': self.samples,
+            'distinct_stacks': len(self._stacks),
+            'window_seconds': self.seconds,
+            'interval_ms': round(self.interval * 1000, 2),
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)) if self.started_at else None,
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.finished_at)) if self.finished_at else None,
+            'max_seconds': self.max_seconds
+        }
+
+
+_LEAF_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def _children(obj) -> Iterable[Any]:
+    """Objects directly referenced by obj, for the containers this app keeps"""
+    if isinstance(obj, dict):
+        children = list(obj.keys())
+        children.extend(obj.values())
+        return children
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return obj
+    children = [getattr(obj, name) for name in getattr(type(obj), '__slots__', ()) if hasattr(obj, name)]
+    if hasattr(obj, '__dict__'):
+        children.append(vars(obj))
+    return children
+
+
+def object_allocators(root: Any, top: int = 10, max_objects: int = 2_000_000) -> Dict[str, Any]:
+    """Size of everything reachable from root, grouped by the line that allocated each object"""
+    # Keyed by traceback: formatting a site per object would dominate the walk
+    sites: Dict[Any, List[int]] = {}
+    seen = set()
+    pending = [root]
+    total = 0
+    truncated = False
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        if len(seen) >= max_objects:
+            truncated = True
+            break
+        seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        total += size
+        # The root is often a snapshot copy made by the caller: not worth attributing
+        traceback = tracemalloc.get_object_traceback(obj) if obj is not root else _ROOT
+        entry = sites.get(traceback)
+        if entry is None:
+            entry = sites[traceback] = [0, 0]
+        entry[0] += size
+        entry[1] += 1
+        if not isinstance(obj, _LEAF_TYPES):
+            pending.extend(_children(obj))
+    by_site: Dict[str, List[int]] = {}
+    for traceback, (size, count) in sites.items():
+        entry = by_site.setdefault(_site(traceback), [0, 0])
+        entry[0] += size
+        entry[1] += count
+    ranked = sorted(by_site.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        'objects': len(seen),
+        'size_mb': round(total / 1e6, 3),
+        'truncated': truncated,
+        'top_allocators': [{'site': site, 'size_kb': round(size / 1024, 1), 'objects': count}
+                           for site, (size, count) in ranked]
+    }
+
+
+def tracemalloc_start(frames: int = 1) -> bool:
+    """Start tracing allocations (only objects allocated afterwards are attributed).
+
+    Every extra frame makes each allocation and each snapshot noticeably slower.
+    """
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    logger.info("🧠 tracemalloc started (%s frames)", frames)
+    return True
+
+
+def tracemalloc_stop() -> bool:
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    logger.info("🧠 tracemalloc stopped")
+    return True
+
+
+def memory_report(containers: Dict[str, Any], top: int = 15) -> Dict[str, Any]:
+    """Top allocating lines process-wide plus per-container allocators"""
+    report: Dict[str, Any] = {'tracing': tracemalloc.is_tracing()}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        report.update({
+            'traced_mb': round(current / 1e6, 3),
+            'peak_mb': round(peak / 1e6, 3),
+            'top_lines': [{'site': _site(stat.traceback),
+                           'size_kb': round(stat.size / 1024, 1), 'blocks': stat.count}
+                          for stat in snapshot.statistics('lineno')[:top]]
+        })
+    else:
+        report['hint'] = 'POST /admin/memory/start first; objects allocated before that are not attributed'
+    report['containers'] = {name: object_allocators(obj, top) for name, obj in containers.items()}
+    return report
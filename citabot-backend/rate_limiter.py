@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Limitador de ritmo adaptativo para todas las llamadas a SitVal.
+
+Token bucket compartido por hilos y corrutinas. El ritmo sube de forma
+aditiva mientras las respuestas son sanas y se reduce de forma
+multiplicativa ante 429/403/5xx o desafíos de Cloudflare (AIMD).
+
+Las llamadas hechas dentro de `with background():` (precarga del catálogo de
+servicios, refresco periódico de la caché) solo cogen un token libre y ceden
+el turno mientras haya peticiones de usuarios esperando al limitador.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+import metrics
+from cache_config import CacheConfig
+from log_config import get_logger
+
+logger = get_logger('limiter')
+
+_background: contextvars.ContextVar = contextvars.ContextVar('citabot_background_upstream', default=False)
+
+
+@contextmanager
+def background():
+    """Upstream calls made inside yield to request-path callers waiting on the limiter"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate (requests/second) follows AIMD on upstream signals"""
+
+    def __init__(self, rate: float = None, min_rate: float = None, max_rate: float = None,
+                 increase: float = None, decrease_factor: float = None, burst: float = None,
+                 decrease_cooldown: float = None):
+        self.min_rate = CacheConfig.RATE_LIMIT_MIN if min_rate is None else min_rate
+        self.max_rate = CacheConfig.RATE_LIMIT_MAX if max_rate is None else max_rate
+        initial = CacheConfig.RATE_LIMIT_INITIAL if rate is None else rate
+        self.rate = min(self.max_rate, max(self.min_rate, initial))
+        self.increase = CacheConfig.RATE_LIMIT_INCREASE if increase is None else increase
+        self.decrease_factor = (CacheConfig.RATE_LIMIT_DECREASE_FACTOR
+                                if decrease_factor is None else decrease_factor)
+        self.burst = CacheConfig.RATE_LIMIT_BURST if burst is None else burst
+        # Throttle signals from requests already in flight count as one
+        self.decrease_cooldown = (CacheConfig.RATE_LIMIT_DECREASE_COOLDOWN
+                                  if decrease_cooldown is None else decrease_cooldown)
+
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._last_decrease = 0.0
+        self._waiting = 0  # request-path callers sleeping for a reserved token
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.background_acquired = 0
+        self.throttle_signals = 0
+        self.total_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _reserve(self) -> float:
+        """Take a token (possibly in advance) and return how long the caller must wait for it"""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            self.acquired += 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            self.total_wait += wait
+            if wait > 0:
+                self._waiting += 1
+        metrics.UPSTREAM_WAIT.observe(wait)
+        return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def _try_background(self) -> float:
+        """Take a free token if no request-path caller is waiting (returns 0), else how long to back off"""
+        with self._lock:
+            self._refill()
+            if not self._waiting and self._tokens >= 1:
+                self._tokens -= 1
+                self.acquired += 1
+                self.background_acquired += 1
+                return 0.0
+            return max(1.0 - self._tokens, 1.0 if self._waiting else 0.0) / self.rate
+
+    def _background_waited(self, waited: float):
+        with self._lock:
+            self.total_wait += waited
+        metrics.UPSTREAM_WAIT.observe(waited)
+
+    def acquire(self) -> float:
+        """Block until the caller may send one request; returns the time waited"""
+        if _background.get():
+            waited = 0.0
+            while True:
+                backoff = self._try_background()
+                if not backoff:
+                    break
+                time.sleep(backoff)
+                waited += backoff
+            self._background_waited(waited)
+            return waited
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Coroutine version of acquire()"""
+        if _background.get():
+            waited = 0.0
+            while True:
+                backoff = self._try_background()
+                if not backoff:
+                    break
+                await asyncio.sleep(backoff)
+                waited += backoff
+            self._background_waited(waited)
+            return waited
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    def on_success(self):
+        """Healthy response: additive increase"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, reason: str = ""):
+        """429/403/5xx, challenge or timeout: multiplicative decrease"""
+        with self._lock:
+            self.throttle_signals += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            old_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        logger.warning("🐢 Upstream rate %.2f -> %.2f req/s (%s)", old_rate, self.rate, reason)
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        with self._lock:
+            return {
+                'rate_per_second': round(self.rate, 3),
+                'min_rate': self.min_rate,
+                'max_rate': self.max_rate,
+                'burst': self.burst,
+                'available_tokens': round(self._tokens, 2),
+                'acquired': self.acquired,
+                'background_acquired': self.background_acquired,
+                'waiting': self._waiting,
+                'throttle_signals': self.throttle_signals,
+                'total_wait_seconds': round(self.total_wait, 1)
+            }
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Capa de resiliencia para las llamadas a SitVal.
+
+- Reintentos con backoff exponencial y jitter para errores transitorios
+  (timeouts, conexión, 429, 5xx).
+- Circuit breaker por endpoint (módulo AJAX) que falla rápido mientras
+  SitVal está caído o devuelve desafíos de Cloudflare.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from cache_config import CacheConfig
+from log_config import get_logger
+
+logger = get_logger('resilience')
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUS = {429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+
+# Markers of a Cloudflare interstitial instead of the real page/JSON
+CHALLENGE_MARKERS = (b'challenge-platform', b'cf-chl-', b'Just a moment...', b'cf_chl_opt')
+
+
+class UpstreamError(Exception):
+    """Base class for SitVal calls that did not produce a usable response"""
+
+
+class TransientUpstreamError(UpstreamError):
+    """Retryable failure (timeout, connection error, 429, 5xx) that exhausted its retries"""
+
+
+class UpstreamChallengeError(UpstreamError):
+    """SitVal answered with a Cloudflare challenge page"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The endpoint's circuit breaker is open; the call was not attempted"""
+
+
+def backoff_delay(attempt: int, base: float = None, max_delay: float = None) -> float:
+    """Delay before retry number attempt (0-based): exponential with equal jitter"""
+    base = CacheConfig.RETRY_DELAY if base is None else base
+    max_delay = CacheConfig.RETRY_MAX_DELAY if max_delay is None else max_delay
+    delay = min(max_delay, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Retry-After header in seconds, if present and numeric"""
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_challenge(status_code: int, headers: Mapping[str, str], body: bytes) -> bool:
+    """True if the response is a Cloudflare challenge rather than SitVal content"""
+    if headers and headers.get('cf-mitigated', '').lower() == 'challenge':
+        return True
+    if status_code not in (403, 429, 503):
+        return False
+    head = body[:4096] if body else b''
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive failures -> half-open after reset_timeout.
+
+    While half-open a single trial call is let through; its outcome closes or
+    reopens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = (CacheConfig.BREAKER_FAILURE_THRESHOLD
+                                  if failure_threshold is None else failure_threshold)
+        self.reset_timeout = CacheConfig.BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._last_error: Optional[str] = None
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go upstream"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self._rejected += 1
+        raise CircuitOpenError(f"Circuit for {self.name} is open ({self._last_error})")
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("✅ Circuit for %s closed", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another call try the half-open circuit when this one ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Any = None, trip: bool = False):
+        """Count a failed call; trip=True opens the circuit right away (e.g. Cloudflare challenge)"""
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error is not None else None
+            self._trial_in_flight = False
+            if trip or self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("🚫 Circuit for %s opened after %s failures: %s", self.name, self._failures, self._last_error)
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = max(0, round(self.reset_timeout - (time.time() - self._opened_at), 1))
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'rejected_calls': self._rejected,
+                'last_error': self._last_error,
+                'retry_in_seconds': retry_in
+            }
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per upstream endpoint, created on first use"""
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, self._failure_threshold, self._reset_timeout)
+                self._breakers[name] = breaker
+            return breaker
+
+    def any_open(self) -> bool:
+        return any(b.status()['state'] != CircuitBreaker.CLOSED for b in list(self._breakers.values()))
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.status() for name, breaker in breakers.items()}
@@ -1,77 +1,284 @@
 import requests
+import httpx
 import json
 import re
+import time
 import datetime
-from typing import Dict, List, Optional, Any
+import threading
+import gzip
+import zlib
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from itertools import islice
+from typing import Dict, List, Optional, Any, Tuple, Iterator, AsyncIterator
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from cache_config import CacheConfig
+from rate_limiter import AdaptiveRateLimiter
+from slots import SlotSet
+import metrics
+import sitval_parsing
+import tracing
+from sitval_replay import ReplayAdapter, ReplayTransport
+from log_config import get_logger
+from resilience import (BreakerRegistry, CircuitOpenError, TransientUpstreamError, UpstreamChallengeError, UpstreamError,
+                        RETRYABLE_STATUS, backoff_delay, is_challenge, retry_after_seconds)
+
+logger = get_logger('scraper')
+
+try:
+    # Optional: several times faster than json and parses bytes directly
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+_MODULE_RE = re.compile(r'[?&]module=([^&]+)')
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZLIB_MAGIC = (b'\x78\x01', b'\x78\x5e', b'\x78\x9c', b'\x78\xda')
+
+def _endpoint_name(url: str) -> str:
+    """AJAX module name of a SitVal URL ('page' for plain page loads)"""
+    match = _MODULE_RE.search(url)
+    return match.group(1) if match else 'page'
+
+def _observe_upstream(url: str, status, seconds: float):
+    """Count one SitVal round-trip in the /metrics registry"""
+    module = _endpoint_name(url)
+    metrics.UPSTREAM_REQUESTS.labels(module, status).inc()
+    metrics.UPSTREAM_LATENCY.labels(module).observe(seconds)
 
 class SitValScraper:
     """Scraper for the SitVal ITV appointment system with minimal logging"""
     
-    BASE_URL = "https://citaitvsitval.com"
+    # Overridable (SITVAL_BASE_URL) to point the scraper at sitval_simulator
+    BASE_URL = CacheConfig.SITVAL_BASE_URL.rstrip('/')
     AJAX_URL = f"{BASE_URL}/ajax/ajaxmodules.php"
     
-    def __init__(self):
-        self.session = requests.Session()
-        self._setup_headers()
+    DEFAULT_HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+        "Accept-Language": "es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Connection": "keep-alive",
+        "Upgrade-Insecure-Requests": "1",
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "none"
+    }
+    
+    def __init__(self, month_cache=None, day_state=None, breakers=None, rate_limiter=None,
+                 recorder=None, replay=None):
+        # requests.Session is not thread-safe: one pooled session per worker thread
+        self._local = threading.local()
+        self._sessions: Dict[int, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._in_flight = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Per-endpoint circuit breakers, shareable between scrapers
+        self.breakers = breakers if breakers is not None else BreakerRegistry()
+        # Every upstream call takes a token; share one limiter between scrapers
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        self.max_retries = CacheConfig.MAX_RETRIES
+        # Optional availability_cache.MonthDataCache shared between scrapers
+        self.month_cache = month_cache
+        # Optional availability_cache.DayStateStore used by incremental searches
+        self.day_state = day_state
+        # Capture mode: optional sitval_replay.SitValRecorder fed with every exchange
+        self.recorder = recorder
+        # Offline mode: optional sitval_replay.ReplayCorpus answering instead of SitVal
+        self.replay = replay
+        # Search window clock; pinned to the capture day when replaying
+        self.today = datetime.date.today
+    
+    @property
+    def session(self) -> requests.Session:
+        """Keep-alive session of the calling thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._new_session()
+            self._local.session = session
+        return session
     
-    def _setup_headers(self):
+    def _new_session(self) -> requests.Session:
+        """Create a session with a bounded connection pool and register it for this thread"""
+        session = requests.Session()
+        if self.replay is not None:
+            adapter = ReplayAdapter(self.replay)
+        else:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=CacheConfig.HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._setup_headers(session)
+        
+        alive = {thread.ident for thread in threading.enumerate()}
+        with self._sessions_lock:
+            # Close sessions of threads that no longer exist
+            for ident in [i for i in self._sessions if i not in alive]:
+                self._sessions.pop(ident).close()
+            self._sessions[threading.get_ident()] = session
+        return session
+    
+    def _setup_headers(self, session: requests.Session):
         """Set up common headers for requests"""
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "none"
-        })
+        session.headers.update(self.DEFAULT_HEADERS)
+    
+    def _day_executor(self) -> ThreadPoolExecutor:
+        """Worker pool for concurrent day fetches, reused so its threads keep their sessions"""
+        with self._sessions_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=CacheConfig.HTTP_POOL_SIZE,
+                                                    thread_name_prefix="sitval-day")
+            return self._executor
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool utilization across the per-thread sessions"""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+        connections = idle = requests_sent = 0
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                # RecentlyUsedContainer refuses iteration; keys() is taken under its lock
+                for pool in filter(None, (pools.get(key) for key in pools.keys())):
+                    connections += getattr(pool, 'num_connections', 0)
+                    requests_sent += getattr(pool, 'num_requests', 0)
+                    # The queue is pre-filled with None placeholders for unopened slots
+                    idle += sum(1 for conn in list(getattr(pool.pool, 'queue', ())) if conn is not None)
+        return {
+            'client': 'requests',
+            'sessions': len(sessions),
+            'pool_size_per_host': CacheConfig.HTTP_POOL_SIZE,
+            'in_flight': self._in_flight,
+            'connections_opened': connections,
+            'idle_connections': idle,
+            'requests_sent': requests_sent
+        }
 
     def _make_request(self, url: str, method: str = "GET", **kwargs) -> requests.Response:
-        """Make a request with error handling and minimal logging"""
+        """Make a request with retries, a per-endpoint circuit breaker and minimal logging.
+        
+        Raises CircuitOpenError without calling SitVal while the endpoint's
+        breaker is open, and an UpstreamError once retries are exhausted or the
+        call has used up REQUEST_DEADLINE (attempts, backoff and rate limit waits).
+        """
+        endpoint = _endpoint_name(url)
+        breaker = self.breakers.get(endpoint)
+        breaker.before_call()
+        timeout = kwargs.pop('timeout', CacheConfig.REQUEST_TIMEOUT)
+        deadline = time.monotonic() + CacheConfig.REQUEST_DEADLINE
+        
         try:
-            response = self.session.request(method, url, **kwargs)
-            
-            # Only log errors, not success
-            if response.status_code != 200:
-                print(f"⚠️ HTTP {response.status_code} for {url}")
-            
-            # Check if content is actually compressed
-            content_encoding = response.headers.get('Content-Encoding', '').lower()
-            
-            if content_encoding == 'br':
-                # Check if content is already text (requests auto-decompressed)
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                tracing.current_span().add('rate_limit_wait_ms', self.rate_limiter.acquire() * 1000)
                 try:
-                    # Try to decode as text first - if it works, it's already decompressed
-                    test_text = response.content.decode('utf-8', errors='replace')
-                    if test_text.strip().startswith(('<!DOCTYPE', '<html', '{')):
-                        # Content is already readable, just remove the misleading header
-                        response.headers.pop('Content-Encoding', None)
-                        print(f"✅ Content already decompressed by requests for {url}")
-                    else:
-                        # Try manual Brotli decompression
-                        import brotli
-                        decompressed = brotli.decompress(response.content)
-                        response._content = decompressed
-                        response.headers.pop('Content-Encoding', None)
-                        print(f"✅ Manual Brotli decompression: {len(decompressed)} bytes for {url}")
-                except ImportError:
-                    print("⚠️ Brotli library not available - using content as-is")
-                except Exception as e:
-                    # If Brotli fails, assume content is already good
-                    response.headers.pop('Content-Encoding', None)
-                    print(f"ℹ️ Using content as-is for {url} (Brotli header may be incorrect)")
-            
-            return response
+                    response = self._send_request(url, method, timeout=self._attempt_timeout(timeout, deadline), **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = TransientUpstreamError(f"{type(e).__name__}: {e}")
+                    self.rate_limiter.on_throttle(str(error))
+                except requests.RequestException as e:
+                    breaker.record_failure(e)
+                    logger.error("❌ Request failed for %s: %s", url, e)
+                    raise
+                else:
+                    tracing.current_span().set(status=response.status_code)
+                    error = self._response_error(response.status_code, response.headers, response.content)
+                    self._report_rate(response.status_code, error)
+                    if error is None:
+                        breaker.record_success()
+                        return response
+                    if not isinstance(error, TransientUpstreamError):
+                        break
+                    retry_after = retry_after_seconds(response.headers)
             
-        except requests.RequestException as e:
-            print(f"❌ Request failed for {url}: {e}")
+                if attempt < self.max_retries:
+                    delay = self._retry_delay(attempt, retry_after)
+                    if time.monotonic() + delay >= deadline:
+                        logger.warning("⌛ Giving up on %s: no time left for a retry (%s)", endpoint, error)
+                        break
+                    logger.warning("🔁 Retrying %s in %.1fs (%s/%s): %s", endpoint, delay, attempt + 1, self.max_retries, error)
+                    tracing.current_span().add('retries', 1)
+                    time.sleep(delay)
+        
+            breaker.record_failure(error, trip=isinstance(error, UpstreamChallengeError))
+            logger.error("❌ Request failed for %s: %s", url, error)
+            raise error
+        except BaseException:
+            # e.g. cancelled mid-trial: without this a half-open breaker would wait forever
+            breaker.release_trial()
             raise
 
-    def _make_ajax_request(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Make AJAX request and return JSON response"""
+    def _response_error(self, status_code: int, headers, body: bytes) -> Optional[UpstreamError]:
+        """Classify a response: None if usable, otherwise the error to retry or raise"""
+        if is_challenge(status_code, headers, body):
+            return UpstreamChallengeError(f"Cloudflare challenge (HTTP {status_code})")
+        if status_code in RETRYABLE_STATUS:
+            return TransientUpstreamError(f"HTTP {status_code}")
+        if status_code == 403:
+            # Blocked without a challenge page: retrying won't help, but the breaker must count it
+            return UpstreamError("HTTP 403 (blocked)")
+        return None
+
+    def _report_rate(self, status_code: int, error: Optional[UpstreamError]):
+        """Feed the adaptive rate limiter with the outcome of a response"""
+        if error is not None or status_code == 403 or status_code >= 500:
+            self.rate_limiter.on_throttle(str(error) if error else f"HTTP {status_code}")
+        elif status_code < 400:
+            self.rate_limiter.on_success()
+
+    @staticmethod
+    def _attempt_timeout(timeout: float, deadline: float) -> float:
+        """Per-attempt timeout, cut short so the call ends by its deadline"""
+        return max(0.1, min(timeout, deadline - time.monotonic()))
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Jittered exponential backoff, stretched to honour Retry-After"""
+        delay = backoff_delay(attempt)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, CacheConfig.RETRY_MAX_DELAY))
+        return delay
+
+    def _send_request(self, url: str, method: str = "GET", **kwargs) -> requests.Response:
+        """Single HTTP round-trip; the body is decoded once by _decode_body, not by requests"""
+        with self._sessions_lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        status = 'error'
+        try:
+            # stream=True: read the raw bytes so SitVal's misleading Brotli header
+            # is handled in one place, without requests decoding first
+            response = self.session.request(method, url, stream=True, **kwargs)
+            try:
+                raw = response.raw.read(decode_content=False)
+            finally:
+                response._content_consumed = True
+                response.close()
+            status = response.status_code
+        finally:
+            with self._sessions_lock:
+                self._in_flight -= 1
+            _observe_upstream(url, status, time.monotonic() - started)
+        
+        # Only log errors, not success
+        if response.status_code != 200:
+            logger.warning("⚠️ HTTP %s for %s", response.status_code, url)
+        
+        response._content = _decode_body(raw, response.headers.pop('Content-Encoding', ''), url)
+        if self.recorder is not None:
+            self.recorder.record(method, url, kwargs.get('data'), response.status_code,
+                                 response.headers, response._content, time.monotonic() - started)
+        return response
+
+    def _make_ajax_request(self, url: str, data: Dict[str, Any], strict: bool = False) -> Dict[str, Any]:
+        """Make AJAX request and return JSON response.
+        
+        Failures return {} unless strict=True, which raises UpstreamError instead
+        (also for a non-JSON answer) so callers can tell them from an empty answer.
+        """
         try:
             response = self._make_request(
                 url,
@@ -80,15 +287,26 @@ class SitValScraper:
                 headers={"X-Requested-With": "XMLHttpRequest"}
             )
             
-            # Try to parse as JSON
+            # Try to parse as JSON, straight from the bytes
             try:
-                return response.json()
-            except json.JSONDecodeError:
-                print(f"⚠️ Response is not valid JSON, returning raw text")
+                return _json_loads(response.content)
+            except ValueError:
+                if strict:
+                    raise UpstreamError(f"{_endpoint_name(url)} response is not valid JSON")
+                logger.warning("⚠️ Response is not valid JSON, returning raw text")
                 return {"raw_response": response.text}
                 
+        except CircuitOpenError as e:
+            tracing.current_span().set(error=str(e))
+            logger.warning("⏸️ Skipping AJAX request: %s", e)
+            if strict:
+                raise
+            return {}
         except Exception as e:
-            print(f"❌ AJAX request failed: {e}")
+            tracing.current_span().set(error=str(e))
+            logger.error("❌ AJAX request failed: %s", e)
+            if strict:
+                raise e if isinstance(e, UpstreamError) else UpstreamError(f"{type(e).__name__}: {e}") from e
             return {}
 
     def search_appointments(self, province_id: str = "2", service_id: str = "1", 
@@ -106,7 +324,7 @@ class SitValScraper:
         instance_code = self._extract_instance_code(main_response)
         
         if not instance_code:
-            print("⚠️ Could not find instance code")
+            logger.warning("⚠️ Could not find instance code")
             return {"error": "Instance code not found", "appointments": [], "found_count": 0}
         
         # Step 2: Search for appointments
@@ -144,7 +362,7 @@ class SitValScraper:
         
         # Only log when appointments are found
         if appointments:
-            print(f"✅ Found {len(appointments)} appointments for {year}/{month}")
+            logger.info("✅ Found %s appointments for %s/%s", len(appointments), year, month)
         
         return result
 
@@ -157,20 +375,7 @@ class SitValScraper:
                 return str(header_value)
         
         # Try HTML content
-        content = response.text
-        patterns = [
-            r'instanceCode["\']?\s*[:=]\s*["\']([^"\']{25,})["\']',
-            r'instance["\']?\s*[:=]\s*["\']([^"\']{25,})["\']',
-            r'var\s+instanceCode\s*=\s*["\']([^"\']{25,})["\']',
-            r'data-instance["\']?\s*=\s*["\']([^"\']{25,})["\']'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
-                return matches[0]
-        
-        return None
+        return sitval_parsing.extract_instance_code(response.text)
 
     def _parse_appointments(self, html_content: str) -> List[Dict[str, Any]]:
         """Parse appointment data from HTML response"""
@@ -178,279 +383,339 @@ class SitValScraper:
         if not html_content or html_content.strip() == "":
             return []
 
-    def get_group_startup(self, instance_code: str = "", store_id: str = "1") -> Dict[str, Any]:
-        """Gets information about provinces and stations via AJAX call"""
-        print(f"🌐 Making groupStartup AJAX call...")
-        
-        # Make AJAX request for groupStartup
-        data = {
+    def _group_startup_data(self, instance_code: str, store_id: str) -> Dict[str, Any]:
+        """Form data for the groupStartup module"""
+        return {
             "store": str(store_id),
             "owner": "1", 
             "instanceCode": instance_code,
             "group": "4"
         }
+
+    def _startup_data(self, instance_code: str, store_id: str) -> Dict[str, Any]:
+        """Form data for the startUp module"""
+        return {
+            "store": str(store_id),
+            "instanceCode": instance_code,
+            "itineraryPlace": "0"
+        }
+
+    def _service_month_data(self, store: str, service: str, instance_code: str, date: str) -> Dict[str, Any]:
+        """Form data for the serviceMonthData module"""
+        return {
+            "store": str(store),
+            "itineraryPlace": "0",
+            "instanceCode": instance_code,
+            "firstCall": "true",
+            "date": date,
+            "service": str(service)
+        }
+
+    def _service_day_data(self, store: str, service: str, instance_code: str, dia: str) -> Dict[str, Any]:
+        """Form data for the serviceDayData module"""
+        return {
+            "store": str(store),
+            "service": str(service),
+            "instanceCode": instance_code,
+            "date": dia,
+            "itineraryPlace": "0",
+            "dateHour": dia
+        }
+
+    def get_group_startup(self, instance_code: str = "", store_id: str = "1") -> Dict[str, Any]:
+        """Gets information about provinces and stations via AJAX call"""
+        logger.debug("🌐 Making groupStartup AJAX call...")
         
         try:
             response = self._make_ajax_request(
                 self.AJAX_URL + "?module=groupStartup",
-                data
+                self._group_startup_data(instance_code, store_id)
             )
             
-            print(f"✅ GroupStartup response received")
+            logger.debug("✅ GroupStartup response received")
             return response
             
         except Exception as e:
-            print(f"⚠️ Error getting groupStartup data: {e}")
+            logger.warning("⚠️ Error getting groupStartup data: %s", e)
             return {}
 
     def get_startup(self, instance_code: str = "", store_id: str = "1") -> Dict[str, Any]:
         """Gets startup information for a specific store via AJAX call"""
-        print(f"🌐 Making startUp AJAX call for store {store_id}...")
-        
-        # Make AJAX request for startUp
-        data = {
-            "store": str(store_id),
-            "instanceCode": instance_code,
-            "itineraryPlace": "0"
-        }
+        logger.debug("🌐 Making startUp AJAX call for store %s...", store_id)
         
         try:
             response = self._make_ajax_request(
                 self.AJAX_URL + "?module=startUp",
-                data
+                self._startup_data(instance_code, store_id)
             )
             
-            print(f"✅ StartUp response received for store {store_id}")
+            logger.debug("✅ StartUp response received for store %s", store_id)
             return response
             
         except Exception as e:
-            print(f"⚠️ Error getting startUp data for store {store_id}: {e}")
+            logger.warning("⚠️ Error getting startUp data for store %s: %s", store_id, e)
             return {}
 
     def get_service_month_data(self, store: str, service: str, instance_code: str, 
-                              date: str = None) -> Dict[str, Any]:
-        """Gets monthly availability for a station and service"""
+                              date: str = None, strict: bool = False) -> Dict[str, Any]:
+        """Gets monthly availability for a station and service (strict: see _make_ajax_request)"""
         if date is None:
-            import datetime
-            date = datetime.date.today().strftime('%Y-%m-%d')
+            date = self.today().strftime('%Y-%m-%d')
         
-        print(f"🗓️ Getting month data for store {store}, service {service}, date {date}")
-        
-        data = {
-            "store": str(store),
-            "itineraryPlace": "0",
-            "instanceCode": instance_code,
-            "firstCall": "true",
-            "date": date,
-            "service": str(service)
-        }
+        logger.debug("🗓️ Getting month data for store %s, service %s, date %s", store, service, date)
         
         try:
             response = self._make_ajax_request(
                 self.AJAX_URL + "?module=serviceMonthData",
-                data
+                self._service_month_data(store, service, instance_code, date),
+                strict
             )
             
-            print(f"✅ Month data received for store {store}")
+            logger.debug("✅ Month data received for store %s", store)
             return response
             
         except Exception as e:
-            print(f"⚠️ Error getting month data for store {store}: {e}")
+            logger.warning("⚠️ Error getting month data for store %s: %s", store, e)
+            if strict:
+                raise
             return {}
 
     def get_service_day_data(self, store: str, service: str, instance_code: str, 
                             dia: str) -> Dict[str, Any]:
         """Gets available time slots for a specific day"""
-        print(f"📅 Getting day data for store {store}, service {service}, date {dia}")
-        
-        data = {
-            "store": str(store),
-            "service": str(service),
-            "instanceCode": instance_code,
-            "date": dia,
-            "itineraryPlace": "0",
-            "dateHour": dia
-        }
+        logger.debug("📅 Getting day data for store %s, service %s, date %s", store, service, dia)
         
         try:
             response = self._make_ajax_request(
                 self.AJAX_URL + "?module=serviceDayData",
-                data
+                self._service_day_data(store, service, instance_code, dia)
             )
             
-            print(f"✅ Day data received for store {store}")
+            logger.debug("✅ Day data received for store %s", store)
             return response
             
         except Exception as e:
-            print(f"⚠️ Error getting day data for store {store}: {e}")
+            logger.warning("⚠️ Error getting day data for store %s: %s", store, e)
             return {}
 
     def get_next_available_slots(self, store: str, service: str, instance_code: str = "", 
-                               max_slots: int = 10) -> List[Dict[str, Any]]:
-        """Gets next available appointments for specific station and service"""
-        print(f"🔍 Searching appointments for store={store}, service={service}")
+                               max_slots: int = 10, day_concurrency: int = 1,
+                               use_month_cache: bool = True, incremental: bool = False) -> SlotSet:
+        """Gets next available appointments for specific station and service.
         
-        try:
-            slots = []
-            today = datetime.datetime.now().date()
-            
-            # Search range: from today to end of next month
-            current_month_start = today.replace(day=1)
-            next_month_start = (current_month_start + datetime.timedelta(days=32)).replace(day=1)
-            end_of_next_month = (next_month_start + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
-            
-            print(f"📍 Searching from {today} to {end_of_next_month}")
-            
-            # Search current month and next month
-            search_months = [current_month_start, next_month_start]
-            
-            for month_start in search_months:
-                if len(slots) >= max_slots:
-                    break
-                
-                month_name = month_start.strftime('%B %Y')
-                print(f"📅 Checking {month_name}...")
-                
-                # Get available days for the month
-                month_data = self.get_service_month_data(
-                    store, service, instance_code, month_start.strftime('%Y-%m-%d')
-                )
-                
-                open_days = month_data.get('get_open_days', {})
-                service_price = month_data.get('service_price')
-                
-                # Filter valid days
-                valid_days = self._filter_valid_days(open_days)
-                
-                # Only take dates from today to end of next month
-                filtered_days = []
-                for dia in valid_days:
-                    try:
-                        dia_date = datetime.datetime.strptime(dia, '%Y-%m-%d').date()
-                        if today <= dia_date <= end_of_next_month:
-                            filtered_days.append(dia)
-                    except:
-                        continue
-                
-                # Sort dates chronologically
-                filtered_days.sort()
-                
-                print(f"   📋 Available days in {month_name}: {len(filtered_days)}")
+        With day_concurrency > 1, up to that many serviceDayData calls are in
+        flight at once; results are still consumed in chronological order.
+        use_month_cache=False skips month_cache lookups (the result is still stored).
+        incremental=True (needs day_state) only refetches days that are new or due
+        for revalidation, and skips parsing payloads whose hash has not changed.
+        Raises UpstreamError if a month cannot be fetched (circuit open, retries exhausted).
+        """
+        logger.debug("🔍 Searching appointments for store=%s, service=%s", store, service)
+        
+        with tracing.span('scrape', store=store, service=service, max_slots=max_slots,
+                          incremental=incremental) as current:
+            try:
+                slots = SlotSet(store, service, depth=max_slots)
+                today, search_months, end_of_next_month = self._search_window()
                 
-                for dia in filtered_days:
+                for month_start in search_months:
                     if len(slots) >= max_slots:
                         break
                     
-                    # Get time slots for the day
-                    day_data = self.get_service_day_data(store, service, instance_code, dia)
-                    day_slots = day_data.get('get_day_slots', {})
+                    # Get available days for the month
+                    month_data = self._get_month_data(
+                        store, service, instance_code, month_start.strftime('%Y-%m-%d'), use_month_cache
+                    )
+                    service_price = month_data.get('service_price')
+                    filtered_days = self._candidate_days(month_data, month_start, today, end_of_next_month)
                     
-                    # Extract valid hours
-                    valid_hours = self._extract_valid_hours(day_slots)
+                    day_state = self.day_state if incremental else None
+                    # Only reached with a real serviceMonthData answer (failures raise above)
+                    if day_state is not None:
+                        day_state.retain(store, service, month_start.strftime('%Y-%m'), filtered_days, today.isoformat())
                     
-                    if valid_hours:
-                        print(f"   ✅ {dia}: {len(valid_hours)} time slots available")
-                        
-                        for hora in valid_hours:
-                            slots.append({
-                                'fecha': dia,
-                                'hora': hora,
-                                'precio': service_price,
-                                'store': store,
-                                'service': service
-                            })
-                            if len(slots) >= max_slots:
-                                break
-                    else:
-                        print(f"   ❌ {dia}: No available time slots")
-            
-            print(f"🎉 Found {len(slots)} total appointments")
-            return slots
-            
-        except Exception as e:
-            print(f"⚠️ Error searching appointments: {e}")
-            return []
+                    # Get time slots for each day
+                    day_results = self._iter_day_hours(store, service, instance_code, filtered_days,
+                                                       day_concurrency, day_state)
+                    for dia, valid_hours, checked_at in day_results:
+                        self._append_day_slots(slots, dia, valid_hours, service_price, max_slots, checked_at)
+                        if len(slots) >= max_slots:
+                            day_results.close()
+                            break
+                
+                current.set(slots=len(slots))
+                logger.info("🎉 Found %s total appointments", len(slots))
+                return slots
+                
+            except UpstreamError as e:
+                # Let callers keep what they had instead of caching an empty result
+                current.set(error=str(e))
+                logger.warning("⚠️ Search for store %s, service %s aborted: %s", store, service, e)
+                raise
+            except Exception as e:
+                current.set(error=str(e))
+                logger.error("⚠️ Error searching appointments: %s", e)
+                return SlotSet(store, service)
 
-    def _filter_valid_days(self, open_days: Any) -> List[str]:
-        """Filter valid days from availability response"""
-        valid_days = []
-        if isinstance(open_days, dict):
-            # System returns dates as values: {'n0': '2025-09-15', 'n1': '2025-09-16', ...}
-            for key, value in open_days.items():
-                if isinstance(value, str) and len(value) == 10 and '-' in value:
-                    # Validate it's a valid date (YYYY-MM-DD)
-                    try:
-                        year, month, day = value.split('-')
-                        if len(year) == 4 and len(month) == 2 and len(day) == 2:
-                            valid_days.append(value)
-                    except:
-                        continue
-        elif isinstance(open_days, list):
-            valid_days = [v for v in open_days if isinstance(v, str) and not v.startswith('n')]
-        return valid_days
+    def _get_month_data(self, store: str, service: str, instance_code: str, date: str,
+                        use_month_cache: bool = True) -> Dict[str, Any]:
+        """serviceMonthData for a month, served from month_cache when possible"""
+        with tracing.span('month', date=date) as current:
+            if self.month_cache is not None and use_month_cache:
+                cached = self.month_cache.get(store, service, date)
+                if cached is not None:
+                    current.set(cached=True)
+                    return cached
+            # strict: an outage must abort the search, not read as a month with no open days
+            month_data = self.get_service_month_data(store, service, instance_code, date, strict=True)
+            if self.month_cache is not None:
+                self.month_cache.set(store, service, date, month_data)
+            return month_data
 
-    def _extract_valid_hours(self, day_slots: Any) -> List[str]:
-        """Extract valid hours in HH:MM format from day slots"""
-        valid_hours = []
+    def _fetch_day(self, store: str, service: str, instance_code: str, dia: str) -> Dict[str, Any]:
+        """serviceDayData for one day, in its own trace span"""
+        with tracing.span('day', date=dia):
+            return self.get_service_day_data(store, service, instance_code, dia)
+
+    def _iter_day_data(self, store: str, service: str, instance_code: str, days: List[str],
+                       day_concurrency: int = 1) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yields (dia, day_data) in the order of days, keeping up to day_concurrency calls in flight"""
+        if day_concurrency <= 1 or len(days) <= 1:
+            for dia in days:
+                yield dia, self._fetch_day(store, service, instance_code, dia)
+            return
         
-        def extract_hour(hora_str):
-            # Extract HH:MM from 'YYYY-MM-DD HH:MM:SS'
-            if isinstance(hora_str, str) and len(hora_str) >= 16:
-                return hora_str[11:16]
-            return None
+        executor = self._day_executor()
+        remaining = iter(days)
+        pending = deque()
+        try:
+            for dia in islice(remaining, day_concurrency):
+                pending.append((dia, executor.submit(tracing.wrap(self._fetch_day), store, service, instance_code, dia)))
+            while pending:
+                dia, future = pending.popleft()
+                day_data = future.result()
+                # Refill the window before handing the result over
+                for next_dia in islice(remaining, 1):
+                    pending.append((next_dia, executor.submit(tracing.wrap(self._fetch_day), store, service, instance_code, next_dia)))
+                yield dia, day_data
+        finally:
+            # Caller stopped early (max_slots reached): drop days not started yet
+            for _, future in pending:
+                future.cancel()
+
+    def _search_window(self) -> Tuple[datetime.date, List[datetime.date], datetime.date]:
+        """Returns today, the months to search and the last searchable day (end of next month)"""
+        today = self.today()
         
-        if isinstance(day_slots, dict):
-            for slot_group in day_slots.values():
-                if isinstance(slot_group, dict):
-                    # Nested structure: {"n0": {"n0": "2025-09-15 08:10:00", "n1": "..."}, ...}
-                    for hora_str in slot_group.values():
-                        h = extract_hour(hora_str)
-                        if h:
-                            valid_hours.append(h)
-                elif isinstance(slot_group, list):
-                    # List of time slots
-                    for hora in slot_group:
-                        h = extract_hour(hora)
-                        if h:
-                            valid_hours.append(h)
-                elif isinstance(slot_group, str):
-                    # Direct time slot
-                    h = extract_hour(slot_group)
-                    if h:
-                        valid_hours.append(h)
-        elif isinstance(day_slots, list):
-            for hora in day_slots:
-                h = extract_hour(hora)
-                if h:
-                    valid_hours.append(h)
-        
-        # Remove duplicates and sort
-        return sorted(list(set(valid_hours)))
+        # Search range: from today to end of next month
+        current_month_start = today.replace(day=1)
+        next_month_start = (current_month_start + datetime.timedelta(days=32)).replace(day=1)
+        end_of_next_month = (next_month_start + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        
+        logger.debug("📍 Searching from %s to %s", today, end_of_next_month)
+        
+        # Search current month and next month
+        return today, [current_month_start, next_month_start], end_of_next_month
+
+    def _candidate_days(self, month_data: Dict[str, Any], month_start: datetime.date,
+                        today: datetime.date, end_of_next_month: datetime.date) -> List[str]:
+        """Returns the open days of a serviceMonthData response inside the search window, sorted"""
+        month_name = month_start.strftime('%B %Y')
+        logger.debug("📅 Checking %s...", month_name)
+        
+        with tracing.span('parse month') as current:
+            # Valid days come back sorted; ISO dates compare chronologically as strings
+            valid_days = self._filter_valid_days(month_data.get('get_open_days', {}))
+            first, last = today.isoformat(), end_of_next_month.isoformat()
+            filtered_days = [dia for dia in valid_days if first <= dia <= last]
+            current.set(days=len(filtered_days))
+        
+        logger.debug("   📋 Available days in %s: %s", month_name, len(filtered_days))
+        return filtered_days
+
+    def _day_hours(self, store: str, service: str, dia: str, day_data: Dict[str, Any],
+                   day_state=None) -> List[str]:
+        """Valid hours of a serviceDayData response, reusing day_state when the payload is unchanged"""
+        with tracing.span('parse day', date=dia):
+            if day_state is None:
+                return self._extract_valid_hours(day_data.get('get_day_slots', {}))
+            if not day_data or 'get_day_slots' not in day_data:
+                # Failed call: keep serving what we knew about the day
+                record = day_state.get(store, service, dia)
+                return record.hours if record else []
+            return day_state.update(store, service, dia, day_data['get_day_slots'], self._extract_valid_hours)
+
+    def _iter_day_hours(self, store: str, service: str, instance_code: str, days: List[str],
+                        day_concurrency: int = 1, day_state=None) -> Iterator[Tuple[str, List[str], Optional[float]]]:
+        """Yields (dia, valid_hours, checked_at) in the order of days; with day_state, fresh days
+        are not refetched and checked_at is when they were last checked (None for fetched days)"""
+        if day_state is None:
+            fetch_days = days
+        else:
+            fetch_days = [dia for dia in days if day_state.needs_fetch(store, service, dia)]
+        fetch_set = set(fetch_days)
+        
+        fetched = self._iter_day_data(store, service, instance_code, fetch_days, day_concurrency)
+        try:
+            for dia in days:
+                if dia not in fetch_set:
+                    record = day_state.get(store, service, dia)
+                    yield (dia, record.hours, record.checked_at) if record else (dia, [], None)
+                    continue
+                _, day_data = next(fetched)
+                yield dia, self._day_hours(store, service, dia, day_data, day_state), None
+        finally:
+            fetched.close()
+
+    def _append_day_slots(self, slots: SlotSet, dia: str, valid_hours: List[str],
+                          service_price: Any, max_slots: int, checked_at: Optional[float] = None):
+        """Appends the valid hours of a day to slots, up to max_slots"""
+        if checked_at is not None:
+            # Reused without refetching: the slots are only as fresh as this check
+            slots.note_checked(checked_at)
+        if not valid_hours:
+            logger.debug("   ❌ %s: No available time slots", dia)
+            return
+        
+        logger.debug("   ✅ %s: %s time slots available", dia, len(valid_hours))
+        
+        for hora in valid_hours:
+            if len(slots) >= max_slots:
+                break
+            slots.append(dia, hora, service_price)
+
+    def _filter_valid_days(self, open_days: Any) -> List[str]:
+        """Filter valid days from availability response (sorted, unique)"""
+        return sitval_parsing.parse_open_days(open_days)
+
+    def _extract_valid_hours(self, day_slots: Any) -> List[str]:
+        """Extract valid hours in HH:MM format from day slots (sorted, unique)"""
+        return sitval_parsing.parse_day_hours(day_slots)
 
     def extract_stations(self, group_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Extract stations information from groupStartup JSON response"""
-        print(f"🏢 Extracting stations from groupStartup data...")
+        logger.debug("🏢 Extracting stations from groupStartup data...")
         
         estaciones = []
         
         if not group_data or 'groups' not in group_data:
-            print("⚠️ No 'groups' data found in response")
+            logger.warning("⚠️ No 'groups' data found in response")
             return estaciones
             
         try:
             groups = group_data['groups']
-            print(f"📋 Found {len(groups)} province groups")
+            logger.debug("📋 Found %s province groups", len(groups))
             
             for prov_key, prov_data in groups.items():
                 provincia = prov_data.get('name', 'Unknown')
-                print(f"   📍 Processing province: {provincia}")
+                logger.debug("   📍 Processing province: %s", provincia)
                 
                 level2_data = prov_data.get('level2', {})
                 for type_key, type_data in level2_data.items():
                     tipo = type_data.get('name', 'ITV')
                     stores = type_data.get('stores', {})
                     
-                    print(f"      🏪 Found {len(stores)} stores for type: {tipo}")
+                    logger.debug("      🏪 Found %s stores for type: %s", len(stores), tipo)
                     
                     for store_key, store_data in stores.items():
                         estacion = {
@@ -464,15 +729,36 @@ class SitValScraper:
                         }
                         
                         estaciones.append(estacion)
-                        print(f"         ✅ Added: {estacion['nombre']} (ID: {estacion['store_id']})")
+                        logger.debug("         ✅ Added: %s (ID: %s)", estacion['nombre'], estacion['store_id'])
             
-            print(f"🎉 Total stations extracted: {len(estaciones)}")
+            logger.info("🎉 Total stations extracted: %s", len(estaciones))
             return estaciones
             
         except Exception as e:
-            print(f"⚠️ Error extracting stations: {e}")
+            logger.error("⚠️ Error extracting stations: %s", e)
             return []
 
+    def extract_services(self, startup_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Extract services information from startUp JSON response"""
+        categories = startup_data.get('categoriesServices', {}) if startup_data else {}
+        
+        servicios = []
+        for cat_key, cat in categories.items():
+            cat_name = cat.get('name', 'Unknown')
+            services = cat.get('services', {})
+            
+            for serv_key, serv in services.items():
+                service_id = serv.get('id')
+                nombre = serv.get('name')
+                if nombre and service_id:
+                    servicios.append({
+                        'nombre': nombre, 
+                        'service': service_id, 
+                        'categoria': cat_name
+                    })
+        
+        return servicios
+
     def _parse_station_info(self, text: str, value: str) -> Optional[Dict[str, Any]]:
         """Parse station information from option text"""
         try:
@@ -508,7 +794,7 @@ class SitValScraper:
                 }
                 
         except Exception as e:
-            print(f"⚠️ Error parsing station info for '{text}': {e}")
+            logger.warning("⚠️ Error parsing station info for '%s': %s", text, e)
             
         return None
 
@@ -516,20 +802,12 @@ class SitValScraper:
         """Fallback method to extract stations using regex patterns"""
         stations = []
         
-        print("🔍 Using fallback regex patterns to find stations...")
+        logger.debug("🔍 Using fallback regex patterns to find stations...")
         
         # Pattern 1: ITV station names with common prefixes
-        itv_patterns = [
-            r'ITV\s+([A-Za-zÀ-ÿ\s\-\.]+)',
-            r'ESTACIÓN\s+ITV\s+([A-Za-zÀ-ÿ\s\-\.]+)',
-            r'CENTRO\s+ITV\s+([A-Za-zÀ-ÿ\s\-\.]+)',
-            r'>([A-Za-zÀ-ÿ\s\-\.]+\s+ITV)<',
-            r'"([A-Za-zÀ-ÿ\s\-\.]+\s+ITV)"'
-        ]
-        
-        for i, pattern in enumerate(itv_patterns):
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            print(f"   Pattern {i+1}: Found {len(matches)} matches")
+        for i, pattern in enumerate(sitval_parsing.ITV_PATTERNS):
+            matches = pattern.findall(html_content)
+            logger.debug("   Pattern %s: Found %s matches", i+1, len(matches))
             
             for j, match in enumerate(matches[:10]):  # Limit to first 10 for debugging
                 if len(match.strip()) > 3:  # Avoid very short matches
@@ -542,16 +820,9 @@ class SitValScraper:
                     })
         
         # Pattern 2: Look for data attributes or JSON-like structures
-        data_patterns = [
-            r'data-station[^=]*=\s*["\']([^"\']+)["\']',
-            r'data-store[^=]*=\s*["\']([^"\']+)["\']',
-            r'"station[^"]*"\s*:\s*"([^"]+)"',
-            r'"store[^"]*"\s*:\s*"([^"]+)"'
-        ]
-        
-        for i, pattern in enumerate(data_patterns):
-            matches = re.findall(pattern, html_content)
-            print(f"   Data pattern {i+1}: Found {len(matches)} matches")
+        for i, pattern in enumerate(sitval_parsing.DATA_PATTERNS):
+            matches = pattern.findall(html_content)
+            logger.debug("   Data pattern %s: Found %s matches", i+1, len(matches))
             
             for j, match in enumerate(matches[:5]):
                 stations.append({
@@ -562,14 +833,9 @@ class SitValScraper:
                 })
         
         # Pattern 3: Look for city/location names that might be ITV stations
-        location_patterns = [
-            r'value\s*=\s*["\'](\d+)["\'][^>]*>([A-Za-zÀ-ÿ\s\-\.]{5,40})<',
-            r'<option[^>]+value\s*=\s*["\']([^"\']+)["\'][^>]*>([^<]{5,40})</option>'
-        ]
-        
-        for i, pattern in enumerate(location_patterns):
-            matches = re.findall(pattern, html_content)
-            print(f"   Location pattern {i+1}: Found {len(matches)} matches")
+        for i, pattern in enumerate(sitval_parsing.LOCATION_PATTERNS):
+            matches = pattern.findall(html_content)
+            logger.debug("   Location pattern %s: Found %s matches", i+1, len(matches))
             
             for match in matches[:10]:
                 if len(match) == 2:
@@ -582,7 +848,7 @@ class SitValScraper:
                             "tipo": "ITV"
                         })
         
-        print(f"🔄 Fallback extraction found {len(stations)} total matches")
+        logger.info("🔄 Fallback extraction found %s total matches", len(stations))
         return stations
         
         appointments = []
@@ -592,13 +858,13 @@ class SitValScraper:
             
             # Look for appointment containers
             appointment_elements = soup.find_all(['div', 'li', 'tr'], 
-                                               class_=re.compile(r'appointment|cita|available', re.I))
+                                               class_=sitval_parsing.APPOINTMENT_CLASS_RE)
             
             if not appointment_elements:
                 appointment_elements = soup.find_all(['div', 'li', 'tr'], attrs={'data-date': True})
             
             if not appointment_elements:
-                appointment_elements = soup.find_all(string=re.compile(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'))
+                appointment_elements = soup.find_all(string=sitval_parsing.SLASH_DATE_RE)
                 
             for element in appointment_elements:
                 appointment = self._extract_appointment_data(element)
@@ -607,13 +873,8 @@ class SitValScraper:
                     
         except Exception:
             # Fallback: regex search for dates
-            date_patterns = [
-                r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})',
-                r'(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})',
-            ]
-            
-            for pattern in date_patterns:
-                matches = re.findall(pattern, html_content)
+            for pattern in (sitval_parsing.SLASH_DATE_RE, sitval_parsing.SPANISH_DATE_RE):
+                matches = pattern.findall(html_content)
                 for match in matches:
                     try:
                         if len(match) == 3:
@@ -636,7 +897,7 @@ class SitValScraper:
         """Extract appointment data from HTML element"""
         
         if isinstance(element, str):
-            date_match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})', element)
+            date_match = sitval_parsing.SLASH_DATE_RE.search(element)
             if date_match:
                 day, month, year = date_match.groups()
                 if len(year) == 2:
@@ -652,7 +913,7 @@ class SitValScraper:
         try:
             text = element.get_text(strip=True) if hasattr(element, 'get_text') else str(element)
             
-            date_match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})', text)
+            date_match = sitval_parsing.SLASH_DATE_RE.search(text)
             if not date_match:
                 return None
             
@@ -660,7 +921,7 @@ class SitValScraper:
             if len(year) == 2:
                 year = "20" + year
             
-            time_match = re.search(r'(\d{1,2}):(\d{2})', text)
+            time_match = sitval_parsing.CLOCK_RE.search(text)
             time_str = f"{time_match.group(1)}:{time_match.group(2)}" if time_match else "Unknown"
             
             available = True
@@ -682,6 +943,393 @@ class SitValScraper:
         except Exception:
             return None
 
+def _looks_decoded(content: bytes) -> bool:
+    """True if the body already starts like HTML or JSON (checks a short prefix only)"""
+    return content[:64].lstrip()[:1] in (b'<', b'{', b'[')
+
+def _decode_body(content: bytes, content_encoding: str, url: str) -> bytes:
+    """Decode a raw response body at most once.
+    
+    gzip and zlib are recognised by their magic bytes; Brotli has none, so a
+    body labelled 'br' is only decompressed when it does not already look like
+    HTML/JSON (SitVal often sends plain content with that header).
+    """
+    if not content:
+        return content
+    
+    try:
+        if content[:2] == _GZIP_MAGIC:
+            return gzip.decompress(content)
+        if content[:1] == b'\x78' and content[:2] in _ZLIB_MAGIC:
+            return zlib.decompress(content)
+    except (OSError, EOFError, zlib.error):
+        logger.debug("ℹ️ Using content as-is for %s (corrupt compressed body)", url)
+        return content
+    
+    content_encoding = content_encoding.lower()
+    if content_encoding == 'deflate' and not _looks_decoded(content):
+        try:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+        except zlib.error:
+            return content
+    if content_encoding != 'br' or _looks_decoded(content):
+        # Plain body, or the Brotli header is misleading
+        return content
+    try:
+        import brotli
+        return brotli.decompress(content)
+    except ImportError:
+        logger.warning("⚠️ Brotli library not available - using content as-is")
+    except Exception:
+        logger.debug("ℹ️ Using content as-is for %s (Brotli header may be incorrect)", url)
+    return content
+
+class AsyncSitValScraper(SitValScraper):
+    """Asyncio variant of SitValScraper built on a non-blocking httpx client.
+    
+    get_group_startup, get_startup, get_service_month_data, get_service_day_data
+    and get_next_available_slots are coroutines here; parsing helpers are shared
+    with the blocking scraper.
+    """
+    
+    def __init__(self, month_cache=None, day_state=None, breakers=None, rate_limiter=None,
+                 recorder=None, replay=None):
+        super().__init__(month_cache, day_state, breakers, rate_limiter, recorder, replay)
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Lazily create the shared AsyncClient inside the running event loop.
+        
+        AsyncClient is safe to share between coroutines; it keeps a bounded
+        keep-alive pool and can multiplex over HTTP/2 when h2 is installed.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.DEFAULT_HEADERS,
+                timeout=CacheConfig.REQUEST_TIMEOUT,
+                follow_redirects=True,
+                transport=ReplayTransport(self.replay) if self.replay is not None else None,
+                http2=self._http2_enabled(),
+                limits=httpx.Limits(
+                    max_connections=CacheConfig.HTTP_POOL_SIZE,
+                    max_keepalive_connections=CacheConfig.HTTP_POOL_SIZE,
+                    keepalive_expiry=CacheConfig.HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+    
+    @staticmethod
+    def _http2_enabled() -> bool:
+        """HTTP2_ENABLED, only if the optional h2 package is installed"""
+        if not CacheConfig.HTTP2_ENABLED:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("⚠️ HTTP2_ENABLED set but h2 is not installed - using HTTP/1.1")
+            return False
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool utilization of the AsyncClient (plus the blocking sessions)"""
+        stats = {
+            'client': 'httpx',
+            'http2': bool(self._client is not None and self._http2_enabled()),
+            'max_connections': CacheConfig.HTTP_POOL_SIZE,
+            'in_flight': self._in_flight,
+            'connections': 0,
+            'idle_connections': 0,
+            'blocking': super().pool_stats()
+        }
+        pool = getattr(getattr(self._client, '_transport', None), '_pool', None)
+        if pool is not None:
+            # httpcore internals; best effort only
+            try:
+                connections = list(pool.connections)
+                stats['connections'] = len(connections)
+                stats['idle_connections'] = sum(1 for c in connections if c.is_idle())
+            except Exception:
+                pass
+        return stats
+    
+    async def aclose(self):
+        """Close the underlying AsyncClient"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _make_request_async(self, url: str, method: str = "GET", **kwargs) -> httpx.Response:
+        """Non-blocking counterpart of _make_request (same retries, deadline and circuit breakers)"""
+        endpoint = _endpoint_name(url)
+        breaker = self.breakers.get(endpoint)
+        breaker.before_call()
+        timeout = kwargs.pop('timeout', CacheConfig.REQUEST_TIMEOUT)
+        deadline = time.monotonic() + CacheConfig.REQUEST_DEADLINE
+        
+        try:
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                tracing.current_span().add('rate_limit_wait_ms', await self.rate_limiter.acquire_async() * 1000)
+                try:
+                    response = await self._send_request_async(url, method, timeout=self._attempt_timeout(timeout, deadline), **kwargs)
+                except httpx.TransportError as e:
+                    error = TransientUpstreamError(f"{type(e).__name__}: {e}")
+                    self.rate_limiter.on_throttle(str(error))
+                except httpx.HTTPError as e:
+                    breaker.record_failure(e)
+                    logger.error("❌ Request failed for %s: %s", url, e)
+                    raise
+                else:
+                    tracing.current_span().set(status=response.status_code)
+                    error = self._response_error(response.status_code, response.headers, response.content)
+                    self._report_rate(response.status_code, error)
+                    if error is None:
+                        breaker.record_success()
+                        return response
+                    if not isinstance(error, TransientUpstreamError):
+                        break
+                    retry_after = retry_after_seconds(response.headers)
+            
+                if attempt < self.max_retries:
+                    delay = self._retry_delay(attempt, retry_after)
+                    if time.monotonic() + delay >= deadline:
+                        logger.warning("⌛ Giving up on %s: no time left for a retry (%s)", endpoint, error)
+                        break
+                    logger.warning("🔁 Retrying %s in %.1fs (%s/%s): %s", endpoint, delay, attempt + 1, self.max_retries, error)
+                    tracing.current_span().add('retries', 1)
+                    await asyncio.sleep(delay)
+        
+            breaker.record_failure(error, trip=isinstance(error, UpstreamChallengeError))
+            logger.error("❌ Request failed for %s: %s", url, error)
+            raise error
+        except BaseException:
+            # e.g. cancelled mid-trial: without this a half-open breaker would wait forever
+            breaker.release_trial()
+            raise
+    
+    async def _send_request_async(self, url: str, method: str = "GET", **kwargs) -> httpx.Response:
+        """Single non-blocking HTTP round-trip, fixing SitVal's misleading Brotli header"""
+        client = self._get_client()
+        request = client.build_request(method, url, **kwargs)
+        self._in_flight += 1
+        started = time.monotonic()
+        status = 'error'
+        try:
+            # Read the raw body so the Brotli quirk is handled like in _make_request
+            response = await client.send(request, stream=True)
+            try:
+                raw = b"".join([chunk async for chunk in response.aiter_raw()])
+            finally:
+                await response.aclose()
+            status = response.status_code
+        finally:
+            self._in_flight -= 1
+            _observe_upstream(url, status, time.monotonic() - started)
+        
+        if response.status_code != 200:
+            logger.warning("⚠️ HTTP %s for %s", response.status_code, url)
+        
+        content_encoding = response.headers.get('Content-Encoding', '')
+        headers = [(k, v) for k, v in response.headers.items()
+                   if k.lower() not in ('content-encoding', 'content-length')]
+        content = _decode_body(raw, content_encoding, url)
+        if self.recorder is not None:
+            self.recorder.record(method, url, kwargs.get('data'), response.status_code,
+                                 dict(headers), content, time.monotonic() - started)
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            content=content,
+            request=request
+        )
+    
+    async def _make_ajax_request_async(self, url: str, data: Dict[str, Any], strict: bool = False) -> Dict[str, Any]:
+        """Non-blocking counterpart of _make_ajax_request"""
+        try:
+            response = await self._make_request_async(
+                url,
+                method="POST",
+                data=data,
+                headers={"X-Requested-With": "XMLHttpRequest"}
+            )
+            
+            try:
+                return _json_loads(response.content)
+            except ValueError:
+                if strict:
+                    raise UpstreamError(f"{_endpoint_name(url)} response is not valid JSON")
+                logger.warning("⚠️ Response is not valid JSON, returning raw text")
+                return {"raw_response": response.text}
+                
+        except CircuitOpenError as e:
+            tracing.current_span().set(error=str(e))
+            logger.warning("⏸️ Skipping AJAX request: %s", e)
+            if strict:
+                raise
+            return {}
+        except Exception as e:
+            tracing.current_span().set(error=str(e))
+            logger.error("❌ AJAX request failed: %s", e)
+            if strict:
+                raise e if isinstance(e, UpstreamError) else UpstreamError(f"{type(e).__name__}: {e}") from e
+            return {}
+    
+    async def get_group_startup(self, instance_code: str = "", store_id: str = "1") -> Dict[str, Any]:
+        """Gets information about provinces and stations via AJAX call"""
+        logger.debug("🌐 Making groupStartup AJAX call...")
+        response = await self._make_ajax_request_async(
+            self.AJAX_URL + "?module=groupStartup",
+            self._group_startup_data(instance_code, store_id)
+        )
+        logger.debug("✅ GroupStartup response received")
+        return response
+    
+    async def get_startup(self, instance_code: str = "", store_id: str = "1") -> Dict[str, Any]:
+        """Gets startup information for a specific store via AJAX call"""
+        logger.debug("🌐 Making startUp AJAX call for store %s...", store_id)
+        response = await self._make_ajax_request_async(
+            self.AJAX_URL + "?module=startUp",
+            self._startup_data(instance_code, store_id)
+        )
+        logger.debug("✅ StartUp response received for store %s", store_id)
+        return response
+    
+    async def get_service_month_data(self, store: str, service: str, instance_code: str,
+                                     date: str = None, strict: bool = False) -> Dict[str, Any]:
+        """Gets monthly availability for a station and service"""
+        if date is None:
+            date = self.today().strftime('%Y-%m-%d')
+        
+        logger.debug("🗓️ Getting month data for store %s, service %s, date %s", store, service, date)
+        response = await self._make_ajax_request_async(
+            self.AJAX_URL + "?module=serviceMonthData",
+            self._service_month_data(store, service, instance_code, date),
+            strict
+        )
+        logger.debug("✅ Month data received for store %s", store)
+        return response
+    
+    async def get_service_day_data(self, store: str, service: str, instance_code: str,
+                                   dia: str) -> Dict[str, Any]:
+        """Gets available time slots for a specific day"""
+        logger.debug("📅 Getting day data for store %s, service %s, date %s", store, service, dia)
+        response = await self._make_ajax_request_async(
+            self.AJAX_URL + "?module=serviceDayData",
+            self._service_day_data(store, service, instance_code, dia)
+        )
+        logger.debug("✅ Day data received for store %s", store)
+        return response
+    
+    async def _get_month_data_async(self, store: str, service: str, instance_code: str, date: str,
+                                    use_month_cache: bool = True) -> Dict[str, Any]:
+        """Async counterpart of _get_month_data"""
+        with tracing.span('month', date=date) as current:
+            if self.month_cache is not None and use_month_cache:
+                cached = self.month_cache.get(store, service, date)
+                if cached is not None:
+                    current.set(cached=True)
+                    return cached
+            month_data = await self.get_service_month_data(store, service, instance_code, date, strict=True)
+            if self.month_cache is not None:
+                self.month_cache.set(store, service, date, month_data)
+            return month_data
+    
+    async def _iter_day_data_async(self, store: str, service: str, instance_code: str, days: List[str],
+                                   day_concurrency: int = 1) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Async counterpart of _iter_day_data"""
+        remaining = iter(days)
+        pending = deque()
+        
+        async def fetch_day(dia):
+            with tracing.span('day', date=dia):
+                return await self.get_service_day_data(store, service, instance_code, dia)
+        
+        def schedule(dia):
+            # Tasks copy the current context, so their spans join the caller's trace
+            task = asyncio.ensure_future(fetch_day(dia))
+            pending.append((dia, task))
+        
+        try:
+            for dia in islice(remaining, max(day_concurrency, 1)):
+                schedule(dia)
+            while pending:
+                dia, task = pending.popleft()
+                day_data = await task
+                for next_dia in islice(remaining, 1):
+                    schedule(next_dia)
+                yield dia, day_data
+        finally:
+            for _, task in pending:
+                task.cancel()
+    
+    async def _iter_day_hours_async(self, store: str, service: str, instance_code: str, days: List[str],
+                                    day_concurrency: int = 1, day_state=None) -> AsyncIterator[Tuple[str, List[str], Optional[float]]]:
+        """Async counterpart of _iter_day_hours"""
+        if day_state is None:
+            fetch_days = days
+        else:
+            fetch_days = [dia for dia in days if day_state.needs_fetch(store, service, dia)]
+        fetch_set = set(fetch_days)
+        
+        fetched = self._iter_day_data_async(store, service, instance_code, fetch_days, day_concurrency)
+        async with aclosing(fetched):
+            for dia in days:
+                if dia not in fetch_set:
+                    record = day_state.get(store, service, dia)
+                    yield (dia, record.hours, record.checked_at) if record else (dia, [], None)
+                    continue
+                _, day_data = await fetched.__anext__()
+                yield dia, self._day_hours(store, service, dia, day_data, day_state), None
+    
+    async def get_next_available_slots(self, store: str, service: str, instance_code: str = "",
+                                       max_slots: int = 10, day_concurrency: int = 1,
+                                       use_month_cache: bool = True, incremental: bool = False) -> SlotSet:
+        """Gets next available appointments for specific station and service"""
+        logger.debug("🔍 Searching appointments for store=%s, service=%s", store, service)
+        
+        with tracing.span('scrape', store=store, service=service, max_slots=max_slots,
+                          incremental=incremental) as current:
+            try:
+                slots = SlotSet(store, service, depth=max_slots)
+                today, search_months, end_of_next_month = self._search_window()
+                
+                for month_start in search_months:
+                    if len(slots) >= max_slots:
+                        break
+                    
+                    month_data = await self._get_month_data_async(
+                        store, service, instance_code, month_start.strftime('%Y-%m-%d'), use_month_cache
+                    )
+                    service_price = month_data.get('service_price')
+                    filtered_days = self._candidate_days(month_data, month_start, today, end_of_next_month)
+                    
+                    day_state = self.day_state if incremental else None
+                    # Only reached with a real serviceMonthData answer (failures raise above)
+                    if day_state is not None:
+                        day_state.retain(store, service, month_start.strftime('%Y-%m'), filtered_days, today.isoformat())
+                    
+                    day_results = self._iter_day_hours_async(store, service, instance_code, filtered_days,
+                                                             day_concurrency, day_state)
+                    async with aclosing(day_results):
+                        async for dia, valid_hours, checked_at in day_results:
+                            self._append_day_slots(slots, dia, valid_hours, service_price, max_slots, checked_at)
+                            if len(slots) >= max_slots:
+                                break
+                
+                current.set(slots=len(slots))
+                logger.info("🎉 Found %s total appointments", len(slots))
+                return slots
+                
+            except UpstreamError as e:
+                # Let callers keep what they had instead of caching an empty result
+                current.set(error=str(e))
+                logger.warning("⚠️ Search for store %s, service %s aborted: %s", store, service, e)
+                raise
+            except Exception as e:
+                current.set(error=str(e))
+                logger.error("⚠️ Error searching appointments: %s", e)
+                return SlotSet(store, service)
+
 # Test function (minimal output)
 def test_scraper():
     """Test the scraper functionality with minimal output"""
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Catálogo en memoria de los servicios de cada estación.
+
+Un hilo en segundo plano recorre las estaciones del StationCatalog y
+mantiene la lista de servicios (startUp) de cada una con un TTL, para que
+/itv/servicios no tenga que consultar SitVal en cada petición. El ritmo de
+las llamadas lo marca el limitador compartido del scraper, y la precarga cede
+el turno a las peticiones de usuarios (rate_limiter.background).
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Any, Iterable
+
+import rate_limiter
+from cache_config import CacheConfig
+from log_config import get_logger
+
+logger = get_logger('catalog')
+
+
+class ServicesCatalog:
+    """TTL-cached services per store_id, kept warm by a background thread"""
+
+    def __init__(self, scraper, station_catalog, ttl: int = None, refresh_interval: int = None):
+        self._scraper = scraper
+        self._station_catalog = station_catalog
+        self.ttl = CacheConfig.SERVICES_CATALOG_TTL if ttl is None else ttl
+        self.refresh_interval = (CacheConfig.SERVICES_REFRESH_INTERVAL
+                                 if refresh_interval is None else refresh_interval)
+
+        # store_id -> {'servicios': [...], 'timestamp': ..., 'version': digest, 'modified_at': ...}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # One startUp call in flight per store
+        self._store_locks: Dict[str, threading.Lock] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _store_lock(self, store_id: str) -> threading.Lock:
+        with self._lock:
+            return self._store_locks.setdefault(store_id, threading.Lock())
+
+    def _fresh_entry(self, store_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(store_id)
+        if entry and time.time() - entry['timestamp'] < self.ttl:
+            return entry
+        return None
+
+    def _fetch(self, store_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Fetch startUp for a store and store its services; None if upstream failed"""
+        startup_data = self._scraper.get_startup("", store_id)
+        servicios = self._scraper.extract_services(startup_data)
+        if not servicios:
+            return None
+        now = time.time()
+        version = hashlib.blake2b(json.dumps(servicios, sort_keys=True, separators=(',', ':')).encode('utf-8'),
+                                  digest_size=8).hexdigest()
+        with self._lock:
+            previous = self._entries.get(store_id)
+            modified_at = previous['modified_at'] if previous and previous['version'] == version else now
+            self._entries[store_id] = {'servicios': servicios, 'timestamp': now,
+                                       'version': version, 'modified_at': modified_at}
+        return servicios
+
+    def get(self, store_id) -> List[Dict[str, Any]]:
+        """Services of a store, fetched live only when missing or expired"""
+        store_id = str(store_id)
+        entry = self._fresh_entry(store_id)
+        if entry:
+            return entry['servicios']
+
+        with self._store_lock(store_id):
+            # Another caller (or the background thread) may have just fetched it
+            entry = self._fresh_entry(store_id)
+            if entry:
+                return entry['servicios']
+            servicios = self._fetch(store_id)
+
+        if servicios is None:
+            # Serve the expired list rather than nothing while SitVal is failing
+            stale = self._entries.get(store_id)
+            return stale['servicios'] if stale else []
+        return servicios
+
+    def validators(self, store_id) -> Optional[Dict[str, Any]]:
+        """Version, last change and seconds of TTL left for a store's services; None if not cached"""
+        entry = self._entries.get(str(store_id))
+        if entry is None:
+            return None
+        return {
+            'version': entry['version'],
+            'modified_at': entry['modified_at'],
+            'expires_in': max(0.0, entry['timestamp'] + self.ttl - time.time())
+        }
+
+    def get_many(self, store_ids: Iterable) -> Dict[str, List[Dict[str, Any]]]:
+        """Services for several stores, keyed by store_id"""
+        return {str(store_id): self.get(store_id) for store_id in store_ids}
+
+    def refresh_all(self):
+        """Fetch every station whose services are missing or expired"""
+        stations = self._station_catalog.all()
+        refreshed = 0
+        for estacion in stations:
+            store_id = str(estacion.get('store_id'))
+            if self._fresh_entry(store_id):
+                continue
+            with self._store_lock(store_id):
+                if self._fresh_entry(store_id):
+                    continue
+                try:
+                    if self._fetch(store_id) is not None:
+                        refreshed += 1
+                except Exception as e:
+                    logger.warning("⚠️ Error prefetching services for store %s: %s", store_id, e)
+        logger.info("🧰 Services catalog: %s stations refreshed, %s cached", refreshed, len(self._entries))
+
+    def _run(self):
+        while True:
+            try:
+                with rate_limiter.background():
+                    self.refresh_all()
+            except Exception as e:
+                logger.error("Error in services catalog refresher: %s", e)
+            time.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start the background prefetch thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        now = time.time()
+        with self._lock:
+            fresh = sum(1 for entry in self._entries.values() if now - entry['timestamp'] < self.ttl)
+            total = len(self._entries)
+        return {
+            'stores': total,
+            'fresh_stores': fresh,
+            'ttl_seconds': self.ttl
+        }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Coalescencia de llamadas concurrentes con la misma clave (single-flight).
+
+Si varias peticiones (hilos o corrutinas) piden el mismo scrape a la vez,
+solo la primera lo ejecuta; el resto espera su resultado.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its result.
+
+    Works across threads (do) and coroutines (do_async) because every flight
+    is backed by a concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join_or_lead(self, key: str) -> Tuple[Future, bool]:
+        """Returns the flight for key and whether the caller must run it"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.executed += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) unless a call for key is already in flight, then wait for it"""
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key, future)
+
+    async def do_async(self, key: str, coro_fn: Callable, *args, **kwargs) -> Any:
+        """Coroutine version of do(); coro_fn(*args, **kwargs) must return an awaitable"""
+        future, leader = self._join_or_lead(key)
+        if leader:
+            # Run as its own task so a cancelled caller does not abort the shared scrape
+            task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            task.add_done_callback(lambda t: self._settle(key, future, t))
+        # shield: cancelling this caller must not cancel the flight for the others
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _settle(self, key: str, future: Future, task: asyncio.Future):
+        try:
+            if task.cancelled():
+                future.set_exception(asyncio.CancelledError())
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        finally:
+            self._finish(key, future)
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        with self._lock:
+            in_flight = list(self._calls.keys())
+        return {
+            'in_flight': in_flight,
+            'executed': self.executed,
+            'coalesced': self.coalesced
+        }
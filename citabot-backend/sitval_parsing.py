@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Parsers de las respuestas de SitVal.
+
+Patrones precompilados una sola vez al importar el módulo y extracción en
+una sola pasada de los días abiertos (get_open_days) y las horas libres
+(get_day_slots), tanto si SitVal los envía como dict {'n0': ...} como si
+los envía como lista.
+"""
+
+import re
+from typing import Any, Iterable, List, Optional
+
+# 'YYYY-MM-DD' with a plausible month and day
+DATE_RE = re.compile(r'\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])')
+
+INSTANCE_CODE_PATTERNS = [
+    re.compile(r'instanceCode["\']?\s*[:=]\s*["\']([^"\']{25,})["\']', re.IGNORECASE),
+    re.compile(r'instance["\']?\s*[:=]\s*["\']([^"\']{25,})["\']', re.IGNORECASE),
+    re.compile(r'var\s+instanceCode\s*=\s*["\']([^"\']{25,})["\']', re.IGNORECASE),
+    re.compile(r'data-instance["\']?\s*=\s*["\']([^"\']{25,})["\']', re.IGNORECASE),
+]
+
+# Station fallback patterns, in the order _extract_stations_fallback tries them
+ITV_PATTERNS = [
+    re.compile(r'ITV\s+([A-Za-zÀ-ÿ\s\-\.]+)', re.IGNORECASE),
+    re.compile(r'ESTACIÓN\s+ITV\s+([A-Za-zÀ-ÿ\s\-\.]+)', re.IGNORECASE),
+    re.compile(r'CENTRO\s+ITV\s+([A-Za-zÀ-ÿ\s\-\.]+)', re.IGNORECASE),
+    re.compile(r'>([A-Za-zÀ-ÿ\s\-\.]+\s+ITV)<', re.IGNORECASE),
+    re.compile(r'"([A-Za-zÀ-ÿ\s\-\.]+\s+ITV)"', re.IGNORECASE),
+]
+DATA_PATTERNS = [
+    re.compile(r'data-station[^=]*=\s*["\']([^"\']+)["\']'),
+    re.compile(r'data-store[^=]*=\s*["\']([^"\']+)["\']'),
+    re.compile(r'"station[^"]*"\s*:\s*"([^"]+)"'),
+    re.compile(r'"store[^"]*"\s*:\s*"([^"]+)"'),
+]
+LOCATION_PATTERNS = [
+    re.compile(r'value\s*=\s*["\'](\d+)["\'][^>]*>([A-Za-zÀ-ÿ\s\-\.]{5,40})<'),
+    re.compile(r'<option[^>]+value\s*=\s*["\']([^"\']+)["\'][^>]*>([^<]{5,40})</option>'),
+]
+
+# Legacy HTML appointment parsing
+APPOINTMENT_CLASS_RE = re.compile(r'appointment|cita|available', re.I)
+SLASH_DATE_RE = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})')
+SPANISH_DATE_RE = re.compile(r'(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})')
+CLOCK_RE = re.compile(r'(\d{1,2}):(\d{2})')
+
+
+def _values(payload: Any) -> Iterable[Any]:
+    """Items of a dict-shaped ({'n0': ...}) or list-shaped payload"""
+    if isinstance(payload, dict):
+        return payload.values()
+    if isinstance(payload, list):
+        return payload
+    return ()
+
+
+def parse_open_days(open_days: Any) -> List[str]:
+    """Sorted, unique 'YYYY-MM-DD' days of a get_open_days payload"""
+    match = DATE_RE.fullmatch
+    return sorted({day for day in _values(open_days) if type(day) is str and match(day)})
+
+
+def _slot_hours(slots: Iterable[Any]) -> set:
+    return {slot[11:16] for slot in slots if type(slot) is str and len(slot) >= 16 and slot[13] == ':'}
+
+
+def parse_day_hours(day_slots: Any) -> List[str]:
+    """Sorted, unique 'HH:MM' hours of a get_day_slots payload.
+
+    Slots are 'YYYY-MM-DD HH:MM:SS' strings, either directly in the payload or
+    grouped one level down: {"n0": {"n0": "2025-09-15 08:10:00", ...}, ...}.
+    """
+    groups = _values(day_slots)
+    # Groups are collected with a single comprehension each; loose strings in one go at the end
+    hours = set()
+    loose = []
+    for group in groups:
+        if type(group) is str:
+            loose.append(group)
+        else:
+            hours |= _slot_hours(_values(group))
+    if loose:
+        hours |= _slot_hours(loose)
+    return sorted(hours)
+
+
+def extract_instance_code(content: str) -> Optional[str]:
+    """First instance code found in a page, trying INSTANCE_CODE_PATTERNS in order"""
+    for pattern in INSTANCE_CODE_PATTERNS:
+        match = pattern.search(content)
+        if match:
+            return match.group(1)
+    return None
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Grabación y reproducción del tráfico con SitVal.
+
+SitValRecorder escribe cada petición/respuesta (módulo, formulario, status,
+cabeceras, cuerpo y latencia) en un corpus JSONL comprimido con gzip.
+ReplayCorpus sirve esas respuestas sin red, con su latencia original o
+escalada, a través de un adaptador de requests (SitValScraper) y de un
+transporte de httpx (AsyncSitValScraper). Sirve para medir el scraper y el
+refresco de caché de forma determinista con payloads reales.
+"""
+
+import asyncio
+import base64
+import datetime
+import gzip
+import io
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3 import HTTPResponse
+
+# Not worth keeping in a shared corpus
+_DROPPED_HEADERS = {'set-cookie', 'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def _module(url: str) -> str:
+    query = dict(parse_qsl(urlsplit(url).query))
+    return query.get('module') or urlsplit(url).path or '/'
+
+
+def _form(body: Any) -> Dict[str, str]:
+    """Form fields of a urlencoded request body (str, bytes or dict)"""
+    if not body:
+        return {}
+    if isinstance(body, Mapping):
+        return {str(k): str(v) for k, v in body.items()}
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    return dict(parse_qsl(body, keep_blank_values=True))
+
+
+def _match_key(method: str, module: str, form: Mapping[str, str]) -> Tuple:
+    return method.upper(), module, tuple(sorted(form.items()))
+
+
+class SitValRecorder:
+    """Appends upstream exchanges to a gzip JSONL corpus (thread-safe)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, method: str, url: str, form: Any, status_code: int,
+               headers: Mapping[str, str], body: bytes, latency: float):
+        """Store one exchange; body is the already decoded response body"""
+        entry = {
+            'recorded_on': datetime.date.today().isoformat(),
+            'method': method.upper(),
+            'module': _module(url),
+            'form': _form(form),
+            'status': status_code,
+            'headers': {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS},
+            'latency': round(latency, 4)
+        }
+        try:
+            entry['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body_b64'] = base64.b64encode(body).decode('ascii')
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            # Sync flush: the corpus stays readable if the process dies
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {'path': self.path, 'recorded': self.recorded}
+
+
+class ReplayCorpus:
+    """Recorded exchanges, served in recording order for each (method, module, form)"""
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.entries: List[Dict[str, Any]] = []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self.entries.append(json.loads(line))
+
+        self._by_key: Dict[Tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for entry in self.entries:
+            self._by_key[_match_key(entry['method'], entry['module'], entry['form'])].append(entry)
+        self._cursor: Dict[Tuple, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.misses = 0
+
+    @property
+    def recorded_on(self) -> Optional[datetime.date]:
+        """Day the corpus was captured; pin the scraper's clock to it so searches ask for the same dates"""
+        if not self.entries:
+            return None
+        return datetime.date.fromisoformat(self.entries[0]['recorded_on'])
+
+    def lookup(self, method: str, url: str, form: Any) -> Optional[Dict[str, Any]]:
+        """Next recorded exchange for this request (the last one repeats); None if never recorded"""
+        key = _match_key(method, _module(url), _form(form))
+        with self._lock:
+            candidates = self._by_key.get(key)
+            if not candidates:
+                self.misses += 1
+                return None
+            index = self._cursor[key]
+            self._cursor[key] = index + 1
+            self.served += 1
+            return candidates[min(index, len(candidates) - 1)]
+
+    def rewind(self):
+        """Serve every key from its first recording again"""
+        with self._lock:
+            self._cursor.clear()
+
+    def delay(self, entry: Dict[str, Any]) -> float:
+        return entry.get('latency', 0.0) * self.latency_scale
+
+    @staticmethod
+    def body(entry: Optional[Dict[str, Any]]) -> bytes:
+        if entry is None:
+            return b'{}'
+        if 'body_b64' in entry:
+            return base64.b64decode(entry['body_b64'])
+        return entry.get('body', '').encode('utf-8')
+
+    def install(self, scraper, pin_clock: bool = True):
+        """Route a SitValScraper/AsyncSitValScraper through this corpus"""
+        scraper.replay = self
+        if pin_clock and self.recorded_on:
+            scraper.today = lambda: self.recorded_on
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'entries': len(self.entries),
+            'served': self.served,
+            'misses': self.misses,
+            'latency_scale': self.latency_scale
+        }
+
+
+class ReplayAdapter(BaseAdapter):
+    """requests transport adapter answering from a ReplayCorpus"""
+
+    def __init__(self, corpus: ReplayCorpus):
+        super().__init__()
+        self.corpus = corpus
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.corpus.lookup(request.method, request.url, request.body)
+        if entry is not None:
+            time.sleep(self.corpus.delay(entry))
+        headers = entry['headers'] if entry else {'Content-Type': 'application/json'}
+        status = entry['status'] if entry else 404
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = HTTPResponse(body=io.BytesIO(ReplayCorpus.body(entry)), headers=headers,
+                                    status=status, preload_content=False)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.reason = 'Replayed' if entry else 'Not recorded'
+        return response
+
+    def close(self):
+        pass
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """httpx transport answering from a ReplayCorpus"""
+
+    def __init__(self, corpus: ReplayCorpus):
+        self.corpus = corpus
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        entry = self.corpus.lookup(request.method, str(request.url), body)
+        if entry is not None:
+            await asyncio.sleep(self.corpus.delay(entry))
+        headers = entry['headers'] if entry else {'Content-Type': 'application/json'}
+        return httpx.Response(entry['status'] if entry else 404, headers=headers,
+                              content=ReplayCorpus.body(entry), request=request)
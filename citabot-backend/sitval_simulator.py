@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Simulador local de SitVal para pruebas de carga y de caos.
+
+Implementa los módulos de ajax/ajaxmodules.php que usa el scraper
+(groupStartup, startUp, serviceMonthData y serviceDayData) con estaciones,
+servicios y calendarios sintéticos. Los huecos aparecen y desaparecen con el
+tiempo (cada SIM_CHURN_SECONDS). La latencia, la tasa de errores 5xx, los 429,
+los desafíos de Cloudflare y la cabecera Brotli engañosa son configurables por
+variables de entorno o en caliente con POST /sim/config.
+
+Uso:
+    uvicorn sitval_simulator:app --port 8090
+    SITVAL_BASE_URL=http://127.0.0.1:8090 uvicorn main:app
+"""
+
+import asyncio
+import datetime
+import hashlib
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+import brotli
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+
+    def _dumps(payload: Any) -> bytes:
+        return orjson.dumps(payload)
+except ImportError:
+    import json
+
+    def _dumps(payload: Any) -> bytes:
+        return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+PROVINCES = ["Valencia", "Alicante", "Castellón"]
+SERVICES = {
+    "Turismo": [("227", "Turismo diesel"), ("228", "Turismo gasolina"), ("229", "Turismo eléctrico")],
+    "Motocicletas": [("301", "Motocicleta"), ("302", "Ciclomotor")],
+    "Pesados": [("401", "Camión"), ("402", "Autobús")],
+}
+CHALLENGE_PAGE = (b'<!DOCTYPE html><html><head><title>Just a moment...</title></head>'
+                  b'<body><div id="challenge-platform"></div></body></html>')
+
+
+class SimulatorConfig:
+    """Runtime knobs; every field can be changed with POST /sim/config"""
+
+    def __init__(self):
+        self.stations = int(os.getenv('SIM_STATIONS', 30))
+        self.seed = int(os.getenv('SIM_SEED', 42))
+        self.latency_ms = float(os.getenv('SIM_LATENCY_MS', 150))  # Latencia media por petición
+        self.latency_jitter_ms = float(os.getenv('SIM_LATENCY_JITTER_MS', 100))
+        self.error_rate = float(os.getenv('SIM_ERROR_RATE', 0.0))  # Fracción de respuestas 503
+        self.throttle_rate = float(os.getenv('SIM_THROTTLE_RATE', 0.0))  # Fracción de respuestas 429
+        self.retry_after = int(os.getenv('SIM_RETRY_AFTER', 2))
+        self.challenge_rate = float(os.getenv('SIM_CHALLENGE_RATE', 0.0))  # Fracción de desafíos de Cloudflare
+        self.br_header_rate = float(os.getenv('SIM_BR_HEADER_RATE', 0.3))  # 'Content-Encoding: br' con cuerpo plano
+        self.br_real_rate = float(os.getenv('SIM_BR_REAL_RATE', 0.2))  # Cuerpo comprimido con Brotli de verdad
+        self.occupancy = float(os.getenv('SIM_OCCUPANCY', 0.85))  # Fracción de huecos ya reservados
+        self.churn_seconds = int(os.getenv('SIM_CHURN_SECONDS', 300))  # Cada cuánto cambian los huecos
+
+    def update(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        for name, value in values.items():
+            if name in self.__dict__:
+                setattr(self, name, type(getattr(self, name))(value))
+        return self.__dict__
+
+
+config = SimulatorConfig()
+stats: Dict[str, int] = {}
+
+app = FastAPI(title="SitVal simulator")
+
+
+def _rng(*parts) -> random.Random:
+    """Deterministic generator for a combination of seed and parts"""
+    digest = hashlib.blake2b(repr((config.seed,) + parts).encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(digest, 'big'))
+
+
+def _station(index: int) -> Dict[str, Any]:
+    store_id = str(index + 1)
+    rng = _rng('station', store_id)
+    return {
+        'store': store_id,
+        'name': f"ITV {rng.choice(['Norte', 'Sur', 'Centro', 'Puerto', 'Polígono'])} {store_id}",
+        'provincia': PROVINCES[index % len(PROVINCES)],
+        'tipo': 'ITV' if index % 4 else 'ITV Móvil',
+        'short_description': f"Calle Simulada {rng.randint(1, 200)}",
+        'first_availability': None,
+        'instanceCode': ''
+    }
+
+
+def _services(store_id: str) -> List[tuple]:
+    """(categoria, id, nombre) offered by a station; every station has Turismo"""
+    rng = _rng('services', store_id)
+    offered = []
+    for categoria, services in SERVICES.items():
+        if categoria == 'Turismo' or rng.random() < 0.5:
+            offered.extend((categoria, service_id, nombre) for service_id, nombre in services)
+    return offered
+
+
+def _price(store_id: str, service: str) -> str:
+    return f"{_rng('price', store_id, service).uniform(30, 60):.2f}"
+
+
+def _day_slots(store_id: str, service: str, dia: datetime.date) -> List[List[str]]:
+    """Free slots per inspection line; they change every churn_seconds"""
+    if dia.weekday() >= 5 or dia < datetime.date.today():
+        return []
+    epoch = int(time.time() // max(1, config.churn_seconds))
+    lines = 1 + _rng('lines', store_id).randint(0, 3)
+    result = []
+    for line in range(lines):
+        rng = _rng('slots', store_id, service, dia.isoformat(), line, epoch)
+        free = []
+        minute = 7 * 60 + line * 5
+        while minute < 20 * 60:
+            if rng.random() >= config.occupancy:
+                free.append(f"{dia.isoformat()} {minute // 60:02d}:{minute % 60:02d}:00")
+            minute += 10
+        result.append(free)
+    return result
+
+
+def group_startup() -> Dict[str, Any]:
+    groups: Dict[str, Any] = {}
+    for index in range(config.stations):
+        station = _station(index)
+        prov = groups.setdefault(f"p{PROVINCES.index(station['provincia'])}",
+                                 {'name': station['provincia'], 'level2': {}})
+        tipo = prov['level2'].setdefault(station['tipo'], {'name': station['tipo'], 'stores': {}})
+        tipo['stores'][f"s{station['store']}"] = {k: v for k, v in station.items() if k not in ('provincia', 'tipo')}
+    return {'groups': groups}
+
+
+def startup(store_id: str) -> Dict[str, Any]:
+    categories: Dict[str, Any] = {}
+    keys: Dict[str, str] = {}
+    for categoria, service_id, nombre in _services(store_id):
+        key = keys.setdefault(categoria, f"c{len(keys)}")
+        cat = categories.setdefault(key, {'name': categoria, 'services': {}})
+        cat['services'][f"s{service_id}"] = {'id': service_id, 'name': nombre}
+    return {'categoriesServices': categories}
+
+
+def service_month_data(store_id: str, service: str, date: str) -> Dict[str, Any]:
+    month_start = datetime.date.fromisoformat(date[:10]).replace(day=1)
+    open_days = {}
+    dia = month_start
+    while dia.month == month_start.month:
+        if any(_day_slots(store_id, service, dia)):
+            open_days[f"n{len(open_days)}"] = dia.isoformat()
+        dia += datetime.timedelta(days=1)
+    return {'get_open_days': open_days, 'service_price': _price(store_id, service)}
+
+
+def service_day_data(store_id: str, service: str, date: str) -> Dict[str, Any]:
+    lines = _day_slots(store_id, service, datetime.date.fromisoformat(date[:10]))
+    return {'get_day_slots': {f"n{i}": {f"n{j}": slot for j, slot in enumerate(line)}
+                              for i, line in enumerate(lines)}}
+
+
+def _count(name: str):
+    stats[name] = stats.get(name, 0) + 1
+
+
+@app.post("/ajax/ajaxmodules.php")
+async def ajax_modules(request: Request, module: str = ""):
+    _count(f"module_{module}")
+    form = dict(await request.form())
+
+    delay = max(0.0, random.gauss(config.latency_ms, config.latency_jitter_ms / 2)) / 1000
+    await asyncio.sleep(delay)
+
+    roll = random.random()
+    if roll < config.challenge_rate:
+        _count('challenges')
+        return Response(CHALLENGE_PAGE, status_code=403, media_type='text/html',
+                        headers={'cf-mitigated': 'challenge'})
+    roll -= config.challenge_rate
+    if roll < config.throttle_rate:
+        _count('throttled')
+        return JSONResponse({'error': 'Too many requests'}, status_code=429,
+                            headers={'Retry-After': str(config.retry_after)})
+    roll -= config.throttle_rate
+    if roll < config.error_rate:
+        _count('errors')
+        return JSONResponse({'error': 'Service unavailable'}, status_code=503)
+
+    store_id = str(form.get('store', '1'))
+    service = str(form.get('service', ''))
+    if module == 'groupStartup':
+        payload = group_startup()
+    elif module == 'startUp':
+        payload = startup(store_id)
+    elif module == 'serviceMonthData':
+        payload = service_month_data(store_id, service, form.get('date', datetime.date.today().isoformat()))
+    elif module == 'serviceDayData':
+        payload = service_day_data(store_id, service, form.get('date', datetime.date.today().isoformat()))
+    else:
+        _count('unknown_module')
+        return JSONResponse({}, status_code=404)
+
+    body = _dumps(payload)
+    headers = {}
+    roll = random.random()
+    if roll < config.br_real_rate:
+        body = brotli.compress(body)
+        headers['Content-Encoding'] = 'br'
+    elif roll < config.br_real_rate + config.br_header_rate:
+        # SitVal quirk: plain body labelled as Brotli
+        _count('br_header_quirks')
+        headers['Content-Encoding'] = 'br'
+    return Response(body, media_type='application/json', headers=headers)
+
+
+@app.get("/")
+def index():
+    return Response('<!DOCTYPE html><html><body>SitVal simulator</body></html>', media_type='text/html')
+
+
+@app.get("/sim/config")
+def get_config():
+    return config.__dict__
+
+
+@app.post("/sim/config")
+async def set_config(request: Request):
+    return config.update(await request.json())
+
+
+@app.get("/sim/stats")
+def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv('SIM_PORT', 8090)))
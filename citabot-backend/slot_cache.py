@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Caché de huecos por estación/servicio (la que sirve /itv/fechas).
+
+SlotCache añade a un backend intercambiable los límites que necesita el
+proceso: número máximo de claves, tamaño máximo aproximado, desalojo LRU y
+caducidad de las claves que nadie ha pedido en SLOT_CACHE_IDLE_TTL. El
+refresco en segundo plano solo recorre las claves vivas, así que el tráfico
+hacia SitVal deja de crecer con cada clave pedida alguna vez.
+
+Backends (SLOT_CACHE_BACKEND):
+- memory: OrderedDict en proceso (por defecto)
+- sqlite: fichero local, sobrevive a reinicios del proceso
+- redis: cualquier servidor que hable el protocolo de Redis (paquete redis opcional)
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache_config import CacheConfig
+from log_config import get_logger
+from slots import SlotSet
+
+logger = get_logger('cache')
+
+
+class CacheEntry:
+    """Slots of one key plus when they were scraped and last requested"""
+
+    __slots__ = ('data', 'timestamp', 'last_access')
+
+    def __init__(self, data: SlotSet, timestamp: float, last_access: float):
+        self.data = data
+        self.timestamp = timestamp
+        self.last_access = last_access
+
+    def nbytes(self) -> int:
+        return self.data.nbytes() + 64
+
+
+class SlotCacheBackend:
+    """Storage interface; implementations must be thread-safe"""
+
+    name = 'base'
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CacheEntry):
+        raise NotImplementedError
+
+    def touch(self, key: str, when: float):
+        """Record an access (LRU order and idle expiry)"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        """Every (key, entry), least recently used first"""
+        raise NotImplementedError
+
+    def keys(self) -> List[str]:
+        return [key for key, _ in self.entries()]
+
+    def evict(self, max_entries: int, max_bytes: int) -> List[str]:
+        """Drop least recently used keys until both bounds hold (0 = unbounded); returns them"""
+        raise NotImplementedError
+
+    def clear(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        """Approximate size of the stored entries"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(SlotCacheBackend):
+    """In-process OrderedDict kept in LRU order"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key: str, entry: CacheEntry):
+        with self._lock:
+            # Existing keys keep their LRU position: only touch() counts as use
+            old = self._entries.get(key)
+            if old is not None:
+                self._nbytes -= old.nbytes()
+            self._entries[key] = entry
+            self._nbytes += entry.nbytes()
+
+    def touch(self, key: str, when: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_access = when
+                self._entries.move_to_end(key)
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._nbytes -= entry.nbytes()
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def evict(self, max_entries: int, max_bytes: int) -> List[str]:
+        evicted = []
+        with self._lock:
+            while self._entries and ((max_entries and len(self._entries) > max_entries)
+                                     or (max_bytes and self._nbytes > max_bytes)):
+                key, entry = self._entries.popitem(last=False)
+                self._nbytes -= entry.nbytes()
+                evicted.append(key)
+        return evicted
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._nbytes = 0
+        return count
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def nbytes(self) -> int:
+        return self._nbytes
+
+
+class SQLiteBackend(SlotCacheBackend):
+    """Single-file SQLite table; entries survive process restarts"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS slots (
+            key TEXT PRIMARY KEY,
+            payload BLOB NOT NULL,
+            timestamp REAL NOT NULL,
+            last_access REAL NOT NULL,
+            nbytes INTEGER NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS slots_last_access ON slots (last_access)")
+
+    def _entry(self, row) -> Optional[CacheEntry]:
+        payload, timestamp, last_access = row
+        try:
+            return CacheEntry(SlotSet.from_bytes(payload), timestamp, last_access)
+        except ValueError as e:
+            logger.warning("⚠️ Dropping unreadable slot cache row: %s", e)
+            return None
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute("SELECT payload, timestamp, last_access FROM slots WHERE key = ?",
+                                   (key,)).fetchone()
+        return self._entry(row) if row else None
+
+    def set(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO slots VALUES (?, ?, ?, ?, ?)",
+                             (key, entry.data.to_bytes(), entry.timestamp, entry.last_access, entry.nbytes()))
+
+    def touch(self, key: str, when: float):
+        with self._lock:
+            self._db.execute("UPDATE slots SET last_access = ? WHERE key = ?", (when, key))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM slots WHERE key = ?", (key,))
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, payload, timestamp, last_access FROM slots ORDER BY last_access").fetchall()
+        result = []
+        for key, *row in rows:
+            entry = self._entry(row)
+            if entry is not None:
+                result.append((key, entry))
+        return result
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT key FROM slots ORDER BY last_access")]
+
+    def evict(self, max_entries: int, max_bytes: int) -> List[str]:
+        evicted = []
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM slots").fetchone()
+            if not ((max_entries and count > max_entries) or (max_bytes and total > max_bytes)):
+                return evicted
+            rows = self._db.execute("SELECT key, nbytes FROM slots ORDER BY last_access").fetchall()
+            for key, nbytes in rows:
+                if not ((max_entries and count > max_entries) or (max_bytes and total > max_bytes)):
+                    break
+                evicted.append(key)
+                count -= 1
+                total -= nbytes
+            if evicted:
+                self._db.executemany("DELETE FROM slots WHERE key = ?", [(key,) for key in evicted])
+        return evicted
+
+    def clear(self) -> int:
+        with self._lock:
+            return self._db.execute("DELETE FROM slots").rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM slots").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisBackend(SlotCacheBackend):
+    """Hashes in any Redis-protocol server, with a sorted set of last accesses for LRU order.
+
+    Memory limits on the server side (maxmemory) still apply; max_bytes is
+    enforced from the sizes recorded here.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str, prefix: str = 'citabot:slots:'):
+        import redis  # Optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self._redis.ping()
+        self.prefix = prefix
+        self._lru = prefix + 'lru'
+        self._sizes = prefix + 'sizes'
+
+    def _key(self, key: str) -> str:
+        return self.prefix + 'entry:' + key
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        values = self._redis.hmget(self._key(key), 'payload', 'timestamp', 'last_access')
+        if values[0] is None:
+            return None
+        try:
+            return CacheEntry(SlotSet.from_bytes(values[0]), float(values[1]), float(values[2]))
+        except ValueError as e:
+            logger.warning("⚠️ Dropping unreadable slot cache entry %s: %s", key, e)
+            self.delete(key)
+            return None
+
+    def set(self, key: str, entry: CacheEntry):
+        pipe = self._redis.pipeline()
+        pipe.hset(self._key(key), mapping={'payload': entry.data.to_bytes(), 'timestamp': entry.timestamp,
+                                           'last_access': entry.last_access})
+        pipe.zadd(self._lru, {key: entry.last_access})
+        pipe.hset(self._sizes, key, entry.nbytes())
+        pipe.execute()
+
+    def touch(self, key: str, when: float):
+        if self._redis.zscore(self._lru, key) is None:
+            return
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._lru, {key: when})
+        pipe.hset(self._key(key), 'last_access', when)
+        pipe.execute()
+
+    def delete(self, key: str):
+        pipe = self._redis.pipeline()
+        pipe.delete(self._key(key))
+        pipe.zrem(self._lru, key)
+        pipe.hdel(self._sizes, key)
+        pipe.execute()
+
+    def keys(self) -> List[str]:
+        return [key.decode('utf-8') for key in self._redis.zrange(self._lru, 0, -1)]
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        result = []
+        for key in self.keys():
+            entry = self.get(key)
+            if entry is not None:
+                result.append((key, entry))
+        return result
+
+    def evict(self, max_entries: int, max_bytes: int) -> List[str]:
+        count = self._redis.zcard(self._lru)
+        total = self.nbytes() if max_bytes else 0
+        if not ((max_entries and count > max_entries) or (max_bytes and total > max_bytes)):
+            return []
+        sizes = {key.decode('utf-8'): int(size) for key, size in self._redis.hgetall(self._sizes).items()}
+        evicted = []
+        for key in self.keys():
+            if not ((max_entries and count > max_entries) or (max_bytes and total > max_bytes)):
+                break
+            self.delete(key)
+            evicted.append(key)
+            count -= 1
+            total -= sizes.get(key, 0)
+        return evicted
+
+    def clear(self) -> int:
+        keys = self.keys()
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def __len__(self) -> int:
+        return self._redis.zcard(self._lru)
+
+    def nbytes(self) -> int:
+        return sum(int(size) for size in self._redis.hvals(self._sizes))
+
+    def close(self):
+        self._redis.close()
+
+
+def create_backend(kind: str = None) -> SlotCacheBackend:
+    """Backend named by SLOT_CACHE_BACKEND; falls back to memory if it cannot be opened"""
+    kind = (kind or CacheConfig.SLOT_CACHE_BACKEND).lower()
+    try:
+        if kind == 'sqlite':
+            return SQLiteBackend(CacheConfig.SLOT_CACHE_SQLITE_PATH)
+        if kind == 'redis':
+            return RedisBackend(CacheConfig.SLOT_CACHE_REDIS_URL)
+    except ImportError:
+        logger.warning("⚠️ SLOT_CACHE_BACKEND=redis but the redis package is not installed - using memory")
+    except Exception as e:
+        logger.warning("⚠️ Could not open %s slot cache backend (%s) - using memory", kind, e)
+    else:
+        if kind != 'memory':
+            logger.warning("⚠️ Unknown SLOT_CACHE_BACKEND %r - using memory", kind)
+    return MemoryBackend()
+
+
+class SlotCache:
+    """Bounded LRU + TTL cache of SlotSets keyed by 'store:service'.
+
+    `ttl` decides whether an entry is fresh; `idle_ttl` drops keys nobody has
+    requested for that long (the refresher only walks live keys). Refresher
+    writes do not count as accesses, requests and favorites do. `on_drop` is
+    called with each key evicted or expired, to drop state kept elsewhere for it.
+    """
+
+    def __init__(self, backend: SlotCacheBackend = None, ttl: int = 3600, idle_ttl: int = None,
+                 max_entries: int = None, max_bytes: int = None, on_drop: Callable[[str], None] = None):
+        self.backend = backend if backend is not None else create_backend()
+        self.ttl = ttl
+        self.idle_ttl = CacheConfig.SLOT_CACHE_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_entries = CacheConfig.SLOT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = (int(CacheConfig.SLOT_CACHE_MAX_MB * 1024 * 1024)
+                          if max_bytes is None else max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.on_drop = on_drop
+        self.evicted = 0
+        self.expired_idle = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Entry for a request (fresh or not), recording the access; None if absent"""
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is None:
+            self.misses += 1
+            return None
+        if now - entry.timestamp < self.ttl:
+            self.hits += 1
+        else:
+            self.stale += 1
+        self.backend.touch(key, now)
+        entry.last_access = now
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Entry without recording an access"""
+        return self.backend.get(key)
+
+    def is_fresh(self, entry: Optional[CacheEntry]) -> bool:
+        return entry is not None and time.time() - entry.timestamp < self.ttl
+
+    def set(self, key: str, data: SlotSet, timestamp: float = None):
+        """Store freshly scraped slots; keeps the key's last access (new keys count as accessed now)"""
+        now = time.time()
+        old = self.backend.get(key)
+        last_access = old.last_access if old is not None else now
+        self.backend.set(key, CacheEntry(data, now if timestamp is None else timestamp, last_access))
+        self._enforce_bounds()
+
+    def watch(self, key: str, store: str, service: str):
+        """Keep a key alive without a request (users' favorites); adds an empty, expired entry if missing"""
+        now = time.time()
+        if self.backend.get(key) is None:
+            self.backend.set(key, CacheEntry(SlotSet(store, service), 0, now))
+            self._enforce_bounds()
+        else:
+            self.backend.touch(key, now)
+
+    def restore(self, entries: List[Tuple[str, CacheEntry]]) -> int:
+        """Load entries as they were (timestamps and last accesses kept), skipping keys
+        the backend already holds a newer copy of; returns how many were loaded"""
+        restored = 0
+        for key, entry in sorted(entries, key=lambda item: item[1].last_access):
+            current = self.backend.get(key)
+            if current is not None and current.timestamp >= entry.timestamp:
+                continue
+            self.backend.set(key, entry)
+            restored += 1
+        self._enforce_bounds()
+        return restored
+
+    def _enforce_bounds(self):
+        evicted = self.backend.evict(self.max_entries, self.max_bytes)
+        if evicted:
+            self.evicted += len(evicted)
+            logger.info("🧹 Evicted %s least recently used slot cache keys", len(evicted))
+            self._dropped(evicted)
+
+    def expire_idle(self) -> List[str]:
+        """Drop keys not requested within idle_ttl; returns them"""
+        if not self.idle_ttl:
+            return []
+        cutoff = time.time() - self.idle_ttl
+        expired = [key for key, entry in self.backend.entries() if entry.last_access < cutoff]
+        for key in expired:
+            self.backend.delete(key)
+        if expired:
+            self.expired_idle += len(expired)
+            logger.info("🧹 Expired %s slot cache keys idle for over %s hours", len(expired), self.idle_ttl // 3600)
+            self._dropped(expired)
+        return expired
+
+    def _dropped(self, keys: List[str]):
+        if self.on_drop is None:
+            return
+        for key in keys:
+            try:
+                self.on_drop(key)
+            except Exception as e:
+                logger.warning("⚠️ on_drop failed for slot cache key %s: %s", key, e)
+
+    def keys(self) -> List[str]:
+        return self.backend.keys()
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        return self.backend.entries()
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+    def clear(self) -> int:
+        return self.backend.clear()
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        return {
+            'backend': self.backend.name,
+            'entries': len(self.backend),
+            'size_mb': round(self.backend.nbytes() / (1024 * 1024), 3),
+            'max_entries': self.max_entries,
+            'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+            'idle_ttl_hours': round(self.idle_ttl / 3600, 1),
+            'hits': self.hits,
+            'stale': self.stale,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'expired_idle': self.expired_idle
+        }
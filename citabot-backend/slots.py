@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Representación compacta de las citas disponibles de una estación/servicio.
+
+Cada cita se guarda como un entero (ordinal de la fecha * 1440 + minuto del
+día) en un array; store, service y precio se guardan una sola vez por clave.
+Los diccionarios {'fecha', 'hora', 'precio', 'store', 'service'} solo se
+construyen al serializar la respuesta JSON.
+"""
+
+import datetime
+import json
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+MINUTES_PER_DAY = 1440
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BI')  # version, length of the JSON header
+
+
+def pack_slot(fecha: str, hora: str) -> int:
+    """'YYYY-MM-DD', 'HH:MM' -> date ordinal * 1440 + minute of day"""
+    ordinal = datetime.date.fromisoformat(fecha).toordinal()
+    return ordinal * MINUTES_PER_DAY + int(hora[:2]) * 60 + int(hora[3:5])
+
+
+def unpack_slot(value: int) -> Tuple[str, str]:
+    """Inverse of pack_slot: (fecha, hora)"""
+    ordinal, minute = divmod(value, MINUTES_PER_DAY)
+    fecha = datetime.date.fromordinal(ordinal).isoformat()
+    return fecha, f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def legacy_id(value: int) -> str:
+    """'YYYY-MM-DD_HH:MM', the format persisted in last_seen_* token data"""
+    return "_".join(unpack_slot(value))
+
+
+def parse_legacy_id(appointment_id: str) -> Optional[int]:
+    """Packed value of a 'YYYY-MM-DD_HH:MM' id; None if it is malformed"""
+    try:
+        return pack_slot(appointment_id[:10], appointment_id[11:16])
+    except (ValueError, TypeError):
+        return None
+
+
+class SlotSet:
+    """Chronological slots of one store/service, packed in an array('I').
+
+    depth is how many slots the scrape that produced them looked for (None if
+    unknown): finding fewer means the search window holds no more. checked_at
+    is the oldest upstream check of a day reused without refetching it (None
+    if every day was fetched by the scrape itself).
+    """
+
+    __slots__ = ('store', 'service', 'precio', 'depth', 'checked_at', '_packed', '_prices')
+
+    def __init__(self, store: str, service: str, precio: Any = None, packed=(), depth: Optional[int] = None):
+        self.store = store
+        self.service = service
+        self.precio = precio
+        self.depth = depth
+        self.checked_at: Optional[float] = None
+        self._packed = array('I', packed)
+        # Slots whose price differs from self.precio (a later month may have another price)
+        self._prices: Dict[int, Any] = {}
+
+    def append(self, fecha: str, hora: str, precio: Any = None):
+        value = pack_slot(fecha, hora)
+        if not self._packed and not self._prices:
+            self.precio = precio
+        elif precio != self.precio:
+            self._prices[value] = precio
+        self._packed.append(value)
+
+    def note_checked(self, when: float):
+        """Record that some slots come from a day last checked upstream at `when`"""
+        if self.checked_at is None or when < self.checked_at:
+            self.checked_at = when
+
+    def __len__(self) -> int:
+        return len(self._packed)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._packed)
+
+    def covers(self, n: int) -> bool:
+        """True if these are the first n slots: the scrape reached n, or found fewer than it looked for"""
+        return len(self._packed) >= n or (self.depth is not None and len(self._packed) < self.depth)
+
+    def head(self, n: int) -> 'SlotSet':
+        """The first n slots as a new SlotSet"""
+        depth = min(self.depth, n) if self.depth is not None else None
+        head = SlotSet(self.store, self.service, self.precio, self._packed[:n], depth)
+        if self._prices:
+            kept = head.keys()
+            head._prices = {v: p for v, p in self._prices.items() if v in kept}
+        return head
+
+    def keys(self) -> Set[int]:
+        """Packed values, for diffing against another set of slots"""
+        return set(self._packed)
+
+    def price_of(self, value: int) -> Any:
+        return self._prices.get(value, self.precio)
+
+    def legacy_ids(self) -> List[str]:
+        """Slots as 'YYYY-MM-DD_HH:MM' ids, in order"""
+        return [legacy_id(value) for value in self._packed]
+
+    def to_dicts(self, n: int = None) -> List[Dict[str, Any]]:
+        """API representation of the first n slots (all by default)"""
+        packed = self._packed if n is None else self._packed[:n]
+        result = []
+        for value in packed:
+            fecha, hora = unpack_slot(value)
+            result.append({
+                'fecha': fecha,
+                'hora': hora,
+                'precio': self.price_of(value),
+                'store': self.store,
+                'service': self.service
+            })
+        return result
+
+    @classmethod
+    def from_dicts(cls, store: str, service: str, items: List[Dict[str, Any]]) -> 'SlotSet':
+        """Build from the API representation, skipping malformed items"""
+        slots = cls(store, service)
+        for item in items:
+            try:
+                slots.append(item['fecha'], item['hora'], item.get('precio'))
+            except (KeyError, ValueError, TypeError):
+                continue
+        return slots
+
+    def nbytes(self) -> int:
+        """Approximate memory footprint, for cache size bounds"""
+        return 200 + self._packed.itemsize * len(self._packed) + 100 * len(self._prices)
+
+    def to_bytes(self) -> bytes:
+        """Compact binary form: JSON header (store, service, prices, depth) + little-endian packed slots"""
+        header = json.dumps([self.store, self.service, self.precio, list(self._prices.items()), self.depth],
+                            separators=(',', ':')).encode('utf-8')
+        packed = array('I', self._packed)
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        return _HEADER.pack(_FORMAT_VERSION, len(header)) + header + packed.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SlotSet':
+        """Inverse of to_bytes; raises ValueError on unknown or truncated data"""
+        try:
+            version, header_length = _HEADER.unpack_from(data)
+            if version != _FORMAT_VERSION:
+                raise ValueError(f"Unknown SlotSet format version {version}")
+            start = _HEADER.size + header_length
+            # depth was added later: older payloads have a 4-item header
+            store, service, precio, prices, *depth = json.loads(data[_HEADER.size:start])
+            packed = array('I')
+            packed.frombytes(data[start:])
+        except (struct.error, TypeError) as e:
+            raise ValueError(f"Corrupt SlotSet payload: {e}") from e
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        slots = cls(store, service, precio, depth=depth[0] if depth else None)
+        slots._packed = packed
+        slots._prices = {int(value): price for value, price in prices}
+        return slots
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Catálogo de estaciones ITV compartido por todos los endpoints.
+
+Descarga groupStartup como mucho una vez por TTL y mantiene las estaciones
+indexadas por store_id y por provincia.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Any
+
+from cache_config import CacheConfig
+from log_config import get_logger
+
+logger = get_logger('catalog')
+
+
+class StationCatalog:
+    """TTL-cached, indexed view of the SitVal station list"""
+
+    def __init__(self, scraper, ttl: int = None, retry_delay: int = None):
+        self._scraper = scraper
+        self.ttl = CacheConfig.STATION_CATALOG_TTL if ttl is None else ttl
+        self.retry_delay = CacheConfig.STATION_CATALOG_RETRY_DELAY if retry_delay is None else retry_delay
+
+        self._stations: List[Dict[str, Any]] = []
+        self._by_store: Dict[str, Dict[str, Any]] = {}
+        self._by_province: Dict[str, List[Dict[str, Any]]] = {}
+        self._fetched_at = 0.0
+        self._expires_at = 0.0
+        # Digest of the station list and when it last changed (HTTP validators)
+        self.version = ''
+        self.modified_at = 0.0
+
+        # Only one refresh in flight; concurrent callers wait for it and reuse its result
+        self._refresh_lock = threading.Lock()
+
+    def _is_fresh(self) -> bool:
+        return time.time() < self._expires_at
+
+    def _ensure_fresh(self):
+        if self._is_fresh():
+            return
+        with self._refresh_lock:
+            # Another caller may have refreshed while we were waiting
+            if self._is_fresh():
+                return
+            self._refresh()
+
+    def _refresh(self):
+        """Fetch groupStartup and rebuild the indexes"""
+        try:
+            group_data = self._scraper.get_group_startup("", "1")
+            estaciones = self._scraper.extract_stations(group_data)
+        except Exception as e:
+            logger.warning("⚠️ Error refreshing station catalog: %s", e)
+            estaciones = []
+
+        now = time.time()
+        if not estaciones:
+            # Keep serving the previous list and retry sooner than the full TTL
+            self._expires_at = now + self.retry_delay
+            return
+
+        by_store = {}
+        by_province = {}
+        for estacion in estaciones:
+            by_store[str(estacion.get('store_id'))] = estacion
+            by_province.setdefault(estacion.get('provincia', ''), []).append(estacion)
+
+        version = hashlib.blake2b(json.dumps(estaciones, sort_keys=True, separators=(',', ':')).encode('utf-8'),
+                                  digest_size=8).hexdigest()
+        if version != self.version:
+            self.version = version
+            self.modified_at = now
+
+        # Swap whole structures so readers never see a half-built index
+        self._stations = estaciones
+        self._by_store = by_store
+        self._by_province = by_province
+        self._fetched_at = now
+        self._expires_at = now + self.ttl
+        logger.info("🏢 Station catalog refreshed: %s stations", len(estaciones))
+
+    def all(self) -> List[Dict[str, Any]]:
+        """All stations, in groupStartup order"""
+        self._ensure_fresh()
+        return list(self._stations)
+
+    def get(self, store_id) -> Optional[Dict[str, Any]]:
+        """Station with the given store_id, or None"""
+        self._ensure_fresh()
+        return self._by_store.get(str(store_id))
+
+    def by_province(self, provincia: str) -> List[Dict[str, Any]]:
+        """Stations of a province (exact name as returned by SitVal)"""
+        self._ensure_fresh()
+        return list(self._by_province.get(provincia, []))
+
+    def provinces(self) -> List[str]:
+        """Province names in groupStartup order"""
+        self._ensure_fresh()
+        return list(self._by_province.keys())
+
+    def expires_in(self) -> float:
+        """Seconds until the list is refetched"""
+        return max(0.0, self._expires_at - time.time())
+
+    def invalidate(self):
+        """Force the next read to refetch groupStartup"""
+        self._expires_at = 0.0
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot for monitoring endpoints"""
+        return {
+            'stations': len(self._stations),
+            'provinces': len(self._by_province),
+            'age_seconds': int(time.time() - self._fetched_at) if self._fetched_at else None,
+            'ttl_seconds': self.ttl
+        }
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Trazas ligeras de scrapes y actualizaciones de caché.
+
+span(nombre, **atributos) abre un tramo hijo del tramo activo (contextvars,
+así que funciona igual en hilos y corrutinas) o empieza una traza nueva si no
+hay ninguno. Cuando termina el tramo raíz, la traza entra en un buffer
+circular con las últimas TRACE_BUFFER_SIZE trazas (GET /debug/traces) y, si
+TRACE_OTLP_ENDPOINT está configurado, se exporta en OTLP/HTTP JSON desde un
+hilo aparte.
+
+Los hilos del pool de días no heredan el contexto: usar wrap() al enviar
+trabajo a un executor.
+"""
+
+import contextlib
+import contextvars
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from cache_config import CacheConfig
+from log_config import get_logger
+
+logger = get_logger('tracing')
+
+_current: contextvars.ContextVar = contextvars.ContextVar('citabot_span', default=None)
+
+
+class Trace:
+    """Spans sharing a trace id; complete once the root span ends"""
+    __slots__ = ('trace_id', 'spans', 'root', '_lock')
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List['Span'] = []
+        self.root: Optional['Span'] = None
+        self._lock = threading.Lock()
+
+    def add(self, span: 'Span'):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Root summary plus every span, ordered by start, with offsets relative to the root"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        root = self.root
+        depths = {}
+        for span in spans:
+            depths[span.span_id] = depths.get(span.parent_id, -1) + 1
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name,
+            'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(root.start)),
+            'duration_ms': root.duration_ms,
+            'attributes': root.attributes,
+            'spans': [dict(span.to_dict(), depth=depths[span.span_id],
+                           offset_ms=round((span.start - root.start) * 1000, 2)) for span in spans]
+        }
+
+
+class Span:
+    """One timed step; use through span(), not directly"""
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        """Add or overwrite attributes"""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: float):
+        """Accumulate a numeric attribute (e.g. retries, wait time)"""
+        self.attributes[name] = round(self.attributes.get(name, 0) + amount, 3)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return round((self.end - self.start) * 1000, 2) if self.end is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled"""
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name: str, amount: float):
+        pass
+
+
+_NOOP = _NoopSpan()
+_traces: deque = deque(maxlen=max(1, CacheConfig.TRACE_BUFFER_SIZE))
+_traces_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Time a step as a child of the active span (or as the root of a new trace)"""
+    if not CacheConfig.TRACING_ENABLED:
+        yield _NOOP
+        return
+    parent = _current.get()
+    trace = parent.trace if parent is not None else Trace()
+    current = Span(trace, name, parent.span_id if parent is not None else None, attributes)
+    if parent is None:
+        trace.root = current
+    trace.add(current)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.time()
+        _current.reset(token)
+        if parent is None:
+            _finish(trace)
+
+
+def current_span():
+    """Active span, or a no-op stand-in so callers can always call set()/add()"""
+    return _current.get() or _NOOP
+
+
+@contextlib.contextmanager
+def traced_lock(lock, name: str):
+    """Acquire a lock inside a span; the span records wait time and lasts until release"""
+    with span(f"lock {name}") as current:
+        started = time.perf_counter()
+        with lock:
+            current.set(wait_ms=round((time.perf_counter() - started) * 1000, 3))
+            yield current
+
+
+def wrap(fn: Callable) -> Callable:
+    """Bind fn to a copy of the caller's context, so spans opened in a worker thread join the caller's trace.
+
+    Wrap once per submitted call: a context can only be entered by one thread at a time.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _finish(trace: Trace):
+    with _traces_lock:
+        _traces.append(trace)
+    if _exporter is not None:
+        _exporter.submit(trace)
+
+
+def recent(limit: int = None, min_duration_ms: float = 0, name: str = None) -> List[Dict[str, Any]]:
+    """Finished traces, newest first"""
+    with _traces_lock:
+        traces = list(_traces)
+    result = []
+    for trace in reversed(traces):
+        if name and trace.root.name != name:
+            continue
+        if (trace.root.duration_ms or 0) < min_duration_ms:
+            continue
+        result.append(trace.to_dict())
+        if limit and len(result) >= limit:
+            break
+    return result
+
+
+def get(trace_id: str) -> Optional[Dict[str, Any]]:
+    with _traces_lock:
+        traces = list(_traces)
+    for trace in traces:
+        if trace.trace_id == trace_id:
+            return trace.to_dict()
+    return None
+
+
+def render_text(trace: Dict[str, Any]) -> str:
+    """Waterfall of one trace: offset, duration and an indented span name per line"""
+    lines = [f"{trace['name']}  {trace['duration_ms']} ms  {trace['start']}  trace {trace['trace_id']}"]
+    for item in trace['spans']:
+        attributes = ' '.join(f"{k}={v}" for k, v in item['attributes'].items())
+        error = f"  ERROR {item['error']}" if item['error'] else ''
+        duration = '…' if item['duration_ms'] is None else f"{item['duration_ms']:.1f}"
+        lines.append(f"{item['offset_ms']:>9.1f} {duration:>9} ms  {'  ' * item['depth']}{item['name']}"
+                     f"  {attributes}{error}")
+    return '\n'.join(lines)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for finished traces"""
+    spans = []
+    for trace in traces:
+        with trace._lock:
+            trace_spans = list(trace.spans)
+        for item in trace_spans:
+            end = item.end if item.end is not None else time.time()
+            otlp_span = {
+                'traceId': trace.trace_id,
+                'spanId': item.span_id,
+                'name': item.name,
+                'kind': 1,
+                'startTimeUnixNano': str(int(item.start * 1e9)),
+                'endTimeUnixNano': str(int(end * 1e9)),
+                'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in item.attributes.items()],
+                'status': {'code': 2, 'message': item.error} if item.error else {'code': 1}
+            }
+            if item.parent_id:
+                otlp_span['parentSpanId'] = item.parent_id
+            spans.append(otlp_span)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'citabot-backend'}}]},
+        'scopeSpans': [{'scope': {'name': 'citabot'}, 'spans': spans}]
+    }]}
+
+
+class OTLPExporter:
+    """Posts finished traces to an OTLP/HTTP collector from a background thread"""
+
+    def __init__(self, endpoint: str, max_queue: int = 1000, batch_size: int = 20):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self.exported = 0
+        self.dropped = 0
+        self.failures = 0
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def submit(self, trace: Trace):
+        """Never blocks the traced code: traces are dropped when the queue is full"""
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                response = self._session.post(self.endpoint, json=to_otlp(batch), timeout=5)
+                response.raise_for_status()
+                self.exported += len(batch)
+            except Exception as e:
+                self.failures += 1
+                logger.warning("⚠️ OTLP export to %s failed: %s", self.endpoint, e)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'endpoint': self.endpoint,
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'failures': self.failures,
+            'queued': self._queue.qsize()
+        }
+
+
+_exporter = OTLPExporter(CacheConfig.TRACE_OTLP_ENDPOINT) if CacheConfig.TRACE_OTLP_ENDPOINT else None
+
+
+def status() -> Dict[str, Any]:
+    """Snapshot for monitoring endpoints"""
+    with _traces_lock:
+        buffered = len(_traces)
+    return {
+        'enabled': CacheConfig.TRACING_ENABLED,
+        'buffered_traces': buffered,
+        'buffer_size': _traces.maxlen,
+        'otlp_export': _exporter.status() if _exporter is not None else None
+    }